@@ -30,3 +30,8 @@ class APIController:
 
     def call(self, action, parameters, api_key, logger):
         return self.apis[action].call(self.base_url, parameters, api_key, action, logger)
+
+    async def call_async(self, action, parameters, api_key, logger):
+        return await self.apis[action].call_async(
+            self.base_url, parameters, api_key, action, logger
+        )
@@ -31,3 +31,26 @@ class ChatController:
             result = self.api_controller.call(action, states, api_key, logger)
 
         return result
+
+    def speculate_API(self, executor, action, states, api_key, logger):
+        """
+        Method to start the api call of an intent with the parameters already in the conversation state, before the
+        entities of the user query are known. The call is only started when the state holds every required parameter.
+        :param executor: executor running the speculative call
+        :param action: intent of the user query
+        :param states: conversation state, including the tenant id
+        :return: tuple of the speculated parameters and the future of the call, or None if the call was not started.
+        The future holds the api result and the parameters as updated by the call.
+        """
+        api = self.api_controller.apis.get(action)
+        if api is None or not api.has_required_parameters(states):
+            return None
+        speculated_states = dict(states)
+        logger.info(f"Speculatively invoking {action} with {speculated_states}")
+
+        def invoke():
+            # the call works on its own copy since it may normalise parameters, like the duration
+            call_states = dict(speculated_states)
+            return self.invoke_API(action, call_states, api_key, logger), call_states
+
+        return speculated_states, executor.submit(invoke)
@@ -12,14 +12,19 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
 import json
 import os
+import threading
 import uuid
-from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, asynccontextmanager
 
 import uvicorn
 from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 
 from backend.app.api import APIController
 from backend.app.chat import ChatController
@@ -31,7 +36,10 @@ from backend.conversation_history.conversation_history_model import (
     DeleteConversationsRequest,
 )
 from backend.external_apis import REGISTERED_APIS
-from backend.llm.HostedLlm import HostedLlm
+from backend.external_apis.HttpSession import close_async_http_client
+from backend.llm.HostedLlm import get_hosted_llm
+from backend.llm.LlmClientRegistry import warm_up
+from backend.llm.TokenUsage import set_usage_owner
 from backend.logging_module.Logging import Logging
 from backend.login_module.user_login import UserLoginModule
 from backend.login_module.user_login_model import (
@@ -54,10 +62,24 @@ from backend.previous_actions_module.ExecuteAction import ActionExecutor
 from backend.previous_actions_module.LatestIntents import (
     get_latest_unique_intents_and_entities,
 )
-from backend.utils.Helpers import Helpers
+from backend.utils.Helpers import Helpers, get_env_flag, get_env_number
 from backend.utils.Helpers import (
     check_and_update_incomplete_intent,
 )
+from backend.utils.Metrics import (
+    REGISTRY,
+    REQUEST_DURATION,
+    REQUESTS_IN_PROGRESS,
+    SI_API_SPECULATIONS,
+    STAGE_DURATION,
+    register_cache_metrics,
+    register_digest_metrics,
+)
+from backend.utils.MorningCupOfCoffee import (
+    MORNING_CUP_OF_COFFEE_SECTIONS,
+    MorningCupOfCoffeeDigests,
+    iter_morning_cup_of_coffee_sections,
+)
 from backend.utils.ResponseGenerationHelpers import preprocess_api_response
 
 logger = None
@@ -72,17 +94,72 @@ incomplete_intent = {}
 consecutive_exception_count = {}
 incomplete_intent_count = {}
 encryption_module = None
+speculative_si_api_calls = False
+# runs the speculative si api calls, apart from the llm calls so that speculation never delays them
+speculation_executor = None
+morning_cup_digests = None
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     try:
         global logger, hosted_llmObj, helper, apiController, chatController, login_module, conversation_history, encryption_module
+        global speculative_si_api_calls, speculation_executor, morning_cup_digests
+        digest_refresh_task = None
 
         logger = Logging("si_chatbot")
-        hosted_llmObj = HostedLlm()
+        hosted_llmObj = get_hosted_llm()
+        register_cache_metrics(hosted_llmObj.get_cache_stats)
+        # open the connections to the inference service in the background, ahead of the first user request
+        threading.Thread(
+            target=warm_up,
+            args=((GRANITE_34B_CODE_INSTRUCT, LLAMA_3_405B_INSTRUCT),),
+            name="llm-warm-up",
+            daemon=True,
+        ).start()
         helper = Helpers(REGISTERED_APIS)
         apiController = APIController(BASE_URL)
         chatController = ChatController(apiController)
+        speculative_si_api_calls = get_env_flag(SPECULATIVE_SI_API_CALLS, False)
+        if speculative_si_api_calls:
+            speculation_executor = ThreadPoolExecutor(
+                max_workers=get_env_number(
+                    SI_API_SPECULATION_WORKERS, DEFAULT_SI_API_SPECULATION_WORKERS
+                ),
+                thread_name_prefix="si-api-speculation",
+            )
+        morning_cup_digests = MorningCupOfCoffeeDigests(
+            apiController,
+            logger,
+            get_env_number(
+                MORNING_CUP_OF_COFFEE_TIMEOUT_SECONDS,
+                DEFAULT_MORNING_CUP_OF_COFFEE_TIMEOUT_SECONDS,
+                cast=float,
+            ),
+            get_env_number(
+                MORNING_CUP_OF_COFFEE_REFRESH_SECONDS,
+                DEFAULT_MORNING_CUP_OF_COFFEE_REFRESH_SECONDS,
+                cast=float,
+            ),
+            get_env_number(
+                MORNING_CUP_OF_COFFEE_MAX_AGE_SECONDS,
+                DEFAULT_MORNING_CUP_OF_COFFEE_MAX_AGE_SECONDS,
+                cast=float,
+            ),
+            get_env_number(
+                MORNING_CUP_OF_COFFEE_ACTIVE_TENANT_SECONDS,
+                DEFAULT_MORNING_CUP_OF_COFFEE_ACTIVE_TENANT_SECONDS,
+                cast=float,
+            ),
+            get_env_number(
+                MORNING_CUP_OF_COFFEE_KEY_VERIFICATION_SECONDS,
+                DEFAULT_MORNING_CUP_OF_COFFEE_KEY_VERIFICATION_SECONDS,
+                cast=float,
+            ),
+        )
+        register_digest_metrics(morning_cup_digests.stats)
+        # refresh the digests of the recently active tenants in the background, ahead of the morning rush
+        if morning_cup_digests.refresh_seconds > 0:
+            digest_refresh_task = asyncio.create_task(morning_cup_digests.run())
         encryption_module = EncryptionService()
    
         login_module = UserLoginModule()
@@ -96,6 +173,14 @@ async def lifespan(app: FastAPI):
         raise HTTPException(status_code=503, detail=str(e))
 
     finally:
+        if digest_refresh_task is not None:
+            digest_refresh_task.cancel()
+        if speculation_executor is not None:
+            speculation_executor.shutdown(wait=False, cancel_futures=True)
+        if hosted_llmObj is not None:
+            # write the token usage buffered since the last flush
+            hosted_llmObj.token_usage.flush()
+        await close_async_http_client()
         logger.info("si-chatbot-be app closed")
 
 
@@ -122,6 +207,353 @@ def run_chatbot(request: RunChatbotModel):
     :param request: {"userQuery": "", "api_key": "", "tenant_id":}
     :return:
     """
+    with REQUESTS_IN_PROGRESS.track_in_progress(
+        endpoint="run_chatbot"
+    ), REQUEST_DURATION.time(
+        endpoint="run_chatbot", tenant=request.tenant_id
+    ) as metric_labels:
+        return _run_chatbot(request, metric_labels=metric_labels)
+
+
+@app.post("/chatbot/run_chatbot_stream")
+def run_chatbot_stream(request: RunChatbotModel):
+    """
+    This endpoint is responsible for servicing user queries, same as /chatbot/run_chatbot. Responses summarized by the
+    llm are streamed as server sent events while they are generated: a start event with the intent, one token event per
+    generated chunk and an end event with the augmented response once it is stored in the conversation history. Every
+    other response is returned as json.
+    :param request: {"userQuery": "", "api_key": "", "tenant_id":}
+    :return:
+    """
+    with ExitStack() as request_metrics:
+        request_metrics.enter_context(
+            REQUESTS_IN_PROGRESS.track_in_progress(endpoint="run_chatbot_stream")
+        )
+        metric_labels = request_metrics.enter_context(
+            REQUEST_DURATION.time(
+                endpoint="run_chatbot_stream", tenant=request.tenant_id
+            )
+        )
+        response = _run_chatbot(
+            request, stream_response=True, metric_labels=metric_labels
+        )
+        if isinstance(response, StreamingResponse):
+            # the request is in progress until its last event is sent
+            response.body_iterator = _close_after_stream(
+                response.body_iterator, request_metrics.pop_all()
+            )
+        return response
+
+
+async def _close_after_stream(body_iterator, exit_stack):
+    """
+    Generator passing on the chunks of a streaming response, the exit stack is closed once the stream ends or the
+    client disconnects
+    :param body_iterator: chunks of the streaming response
+    :param exit_stack: context managers which last as long as the stream
+    :return: chunks of the streaming response
+    """
+    try:
+        async for chunk in body_iterator:
+            yield chunk
+    finally:
+        exit_stack.close()
+
+
+def _server_sent_event(event, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def _stream_chatbot_response(
+    response_stream,
+    question,
+    intent,
+    conversation_id,
+    tenant_id,
+    username,
+    current_state,
+):
+    """
+    Generator of the server sent events of a response streamed by the llm. The complete response is stored in the
+    conversation history once the llm finishes generating it.
+    :param response_stream: iterator over the chunks generated by the llm
+    :return: server sent events
+    """
+    yield _server_sent_event(
+        STREAM_START_EVENT, {INTENT: intent, CONVERSATION_ID: conversation_id}
+    )
+    chunks = []
+    try:
+        with STAGE_DURATION.time(
+            stage=REQUEST_STAGE_RESPONSE_STREAM, intent=intent, tenant=tenant_id
+        ):
+            for chunk in response_stream:
+                chunks.append(chunk)
+                yield _server_sent_event(
+                    STREAM_TOKEN_EVENT, {STREAM_TOKEN_EVENT: chunk}
+                )
+        augmented_response = _complete_chatbot_response(
+            question,
+            intent,
+            {DATA: "".join(chunks).strip()},
+            True,
+            conversation_id,
+            tenant_id,
+            username,
+            current_state,
+        )
+        yield _server_sent_event(STREAM_END_EVENT, augmented_response)
+    except Exception as ex:
+        if not isinstance(ex, HTTPException):
+            logger.error(f"An error occurred while streaming the response: {ex}", ex)
+            ex = HTTPException(
+                status_code=500,
+                detail={
+                    STATUS: INTERNAL_SERVER_ERROR,
+                    MESSAGE: str(ex),
+                    IDENTIFIER: TEXT,
+                },
+            )
+        # the response failed after it started, the user state is updated as for a failed json response
+        ex = _handle_chatbot_error(
+            ex,
+            question,
+            intent,
+            conversation_id,
+            tenant_id,
+            username,
+            current_state,
+            current_state,
+        )
+        yield _server_sent_event(STREAM_ERROR_EVENT, ex.detail)
+
+
+def _handle_chatbot_error(
+    ex,
+    question,
+    intent,
+    conversation_id,
+    tenant_id,
+    username,
+    current_state,
+    entities,
+) -> HTTPException:
+    """
+    Method to update the state of the user after a failed user query: the intent is kept as incomplete when parameters
+    are missing, and the conversation is reset when the same error occurs twice in a row
+    :param ex: error of the user query
+    :param entities: entities extracted from the user query
+    :return: error to return to the user
+    """
+    state_key = (conversation_id, username)
+    if (
+        ex
+        and ex.detail
+        and ex.detail[MESSAGE]
+        and INCOMPLETE_INTENT_CHECK_STR in ex.detail[MESSAGE]
+    ):
+        incomplete_intent[username] = intent
+        logger.info(f"Added incomplete intent {intent} for user {username}")
+
+        # **Store conversation history when "To proceed, I need the" is present**
+        if (
+            "To proceed, I need the"
+            in ex.detail[MESSAGE]
+        ):
+            logger.info(
+                f"Incomplete entities detected for user {username}, storing chat history."
+            )
+
+            # Get the correct response message from the exception
+            response_message = ex.detail[MESSAGE]
+
+            # Create and store the conversation thread for incomplete entities
+            augmented_response = helper.augment_response(
+                intent,
+                {MESSAGE: response_message},
+                conversation_id,
+                tenant_id,
+                (
+                    entities[STORAGE_SYSTEM_ID]
+                    if STORAGE_SYSTEM_ID in entities
+                    else None
+                ),
+                True,  # `is_response_generated` is True because the response is complete
+            )
+            augmented_response[USER_QUERY] = question
+            augmented_response[IDENTIFIER] = MARKDOWN
+            current_conversation_thread = (
+                conversation_history.create_conversation_thread(
+                    conversation_id,
+                    str(question),
+                    augmented_response,
+                    tenant_id,
+                )
+            )
+            _store_conversation_history(
+                intent,
+                current_conversation_thread,
+                current_state,
+                conversation_id,
+                username,
+                tenant_id,
+            )
+
+    logger.error(f"An error occurred: {ex}", ex)
+    # track consecutive exceptions
+    if username not in consecutive_exception_count:
+        consecutive_exception_count[username] = {
+            COUNT: 0,
+            LAST_EXCEPTION_MESSAGE: None,
+        }
+
+    last_exception_message = consecutive_exception_count[username][
+        LAST_EXCEPTION_MESSAGE
+    ]
+    if last_exception_message == ex.detail[MESSAGE]:
+        consecutive_exception_count[username][COUNT] += 1
+    else:
+        consecutive_exception_count[username] = {
+            COUNT: 1,
+            LAST_EXCEPTION_MESSAGE: ex.detail[MESSAGE],
+        }
+
+    # graceful exit if the same exception occurs consecutively
+    if consecutive_exception_count[username][COUNT] >= 2:
+        logger.error(
+            f"Consecutive same exception detected for user {username}, graceful exit.",
+            ex,
+        )
+        # Gracefully exit: clear state, reset incomplete intent, and respond with an apology
+        if state_key in global_states:
+            del global_states[state_key]
+        if username in incomplete_intent:
+            del incomplete_intent[username]
+        graceful_exit_response = {
+            STATUS: BAD_REQUEST,
+            MESSAGE: GRACEFUL_EXIT_MESSAGE,
+            IDENTIFIER: MARKDOWN,
+        }
+        # delete after graceful exit
+        del consecutive_exception_count[username]
+        return HTTPException(status_code=400, detail=graceful_exit_response)
+
+    # Return the original exception
+    return ex
+
+
+def _store_conversation_history(
+    intent, conversation_thread, current_state, conversation_id, username, tenant_id
+):
+    """
+    Method to store a conversation thread in the conversation history, timing the sqlite write
+    :param intent: intent of the serviced user query
+    :return:
+    """
+    with STAGE_DURATION.time(
+        stage=REQUEST_STAGE_HISTORY, intent=intent, tenant=tenant_id
+    ):
+        conversation_history.store_conversation_history(
+            conversation_thread,
+            current_state,
+            conversation_id,
+            username,
+            tenant_id,
+        )
+
+
+def _complete_chatbot_response(
+    question,
+    intent,
+    response,
+    is_response_generated,
+    conversation_id,
+    tenant_id,
+    username,
+    current_state,
+):
+    """
+    Method to augment the response of a serviced intent, store it in the conversation history and the previous actions,
+    and reset the incomplete intent and consecutive exception count of the user
+    :return: augmented response
+    """
+    augmented_response = helper.augment_response(
+        intent,
+        response,
+        conversation_id,
+        tenant_id,
+        (
+            current_state[STORAGE_SYSTEM_ID]
+            if STORAGE_SYSTEM_ID in current_state
+            else None
+        ),
+        is_response_generated,
+    )
+    if intent == CHATBOT_CAPABILITIES and (
+        augmented_response[MESSAGE] is None or len(augmented_response[MESSAGE]) == 0
+    ):
+        # Check if data key is present and has a None value
+        error_response = {
+            STATUS: NO_CONTENT,
+            MESSAGE: "No data available for the given request.",
+            IDENTIFIER: TEXT,
+            DATA: [],
+        }
+        raise HTTPException(status_code=204, detail=error_response)
+    elif intent != CHATBOT_CAPABILITIES and (
+        augmented_response[DATA] is None or len(augmented_response[DATA]) == 0
+    ):
+        augmented_response[DATA] = "No data found for your request. The resource may not be available on your tenant, or no response was received."
+        augmented_response[IDENTIFIER] = MARKDOWN
+    current_conversation_thread = conversation_history.create_conversation_thread(
+        conversation_id, str(question), augmented_response, tenant_id
+    )
+    _store_conversation_history(
+        intent,
+        current_conversation_thread,
+        current_state,
+        conversation_id,
+        username,
+        tenant_id,
+    )
+
+    if intent in helper.get_api_list() and augmented_response is not None:
+        # Append missing entities from current_state to userQuery based on the intent
+        updated_question = (
+            IntentsAndEntitiesDatabaseOperations.append_missing_entities_to_query(
+                question, current_state, intent
+            )
+        )
+        IntentsAndEntitiesDatabaseOperations.insert_intent_and_entities(
+            intent, current_state, username, updated_question, tenant_id
+        )
+
+    # if incomplete intent was present and if the control comes here, that means intent was serviced properly,
+    # remove it from the list
+    # Reset incomplete intent count on successful completion
+    if username in incomplete_intent:
+        del incomplete_intent[username]
+        if username in incomplete_intent_count:
+            del incomplete_intent_count[username]
+        logger.info(f"Completed intent {intent} for user {username}")
+    # delete the key to reset consecutive exception count on a successful response
+    if username in consecutive_exception_count:
+        del consecutive_exception_count[username]
+        logger.info("Reset the consecutive exception count")
+    return augmented_response
+
+
+def _run_chatbot(
+    request: RunChatbotModel, stream_response=False, metric_labels=None
+):
+    """
+    Method to service a user query
+    :param request: {"userQuery": "", "api_key": "", "tenant_id":}
+    :param stream_response: stream the responses summarized by the llm as server sent events
+    :param metric_labels: labels of the request duration metric, the intent is added once detected
+    :return: augmented response, or a streaming response of server sent events
+    """
+    metric_labels = {} if metric_labels is None else metric_labels
     global global_states, incomplete_intent, consecutive_exception_count, incomplete_intent_count
     # get necessary parameters from user request
     question = request.userQuery
@@ -130,6 +562,12 @@ def run_chatbot(request: RunChatbotModel):
     username = request.username
     conversation_id = request.conversation_id or str(uuid.uuid4())
     intent = None
+    entity_dict = {}
+    entity_future = speculation = None
+    # account the llm calls of the request to the tenant and the user, and reject it up front when the token budget
+    # is exhausted instead of waiting for the quota error of watsonx
+    set_usage_owner(tenant_id, username)
+    hosted_llmObj.check_token_budget(tenant_id)
     try:
         api_key = encryption_module.decrypt_value(encrypted_api_key)
         # Retrieve or initialize the state for the given conversation_id and username
@@ -158,22 +596,43 @@ def run_chatbot(request: RunChatbotModel):
                     f"New conversation thread detected. Deleted consecutive exception count for user {username}"
                 )
 
-        # call the llm chain to detect intent
-        intent = hosted_llmObj.get_intent_of_utterance(question)
+        # call the llm chain to detect intent, entities are extracted concurrently when enabled
+        with STAGE_DURATION.time(
+            stage=REQUEST_STAGE_INTENT, tenant=tenant_id
+        ) as stage_labels:
+            intent, entity_future = (
+                hosted_llmObj.detect_intent_and_prefetch_entities(question)
+            )
+            stage_labels["intent"] = metric_labels["intent"] = intent
         logger.info(f"Detected intent {intent} for user query {question}")
         if intent in (GREETINGS, THANKING):
-            # generate response to these common intents using llm for better ux
-            llm_response = hosted_llmObj.common_intents_response_generator(intent,question)
-            logger.info(f"Generated common intent response {llm_response} using llm for user query {question}")
+            # respond to these common intents from the pre-generated responses, the llm only generates the response
+            # when llm responses are enabled or the intent has no pre-generated response
+            with STAGE_DURATION.time(
+                stage=REQUEST_STAGE_COMMON_INTENTS, intent=intent, tenant=tenant_id
+            ):
+                common_intent_response = hosted_llmObj.get_pre_generated_response(
+                    intent, question
+                )
+                response_source = "pre-generated responses"
+                if common_intent_response is None:
+                    common_intent_response = (
+                        hosted_llmObj.common_intents_response_generator(intent, question)
+                    )
+                    response_source = "llm"
+            logger.info(
+                f"Served common intent response {common_intent_response} from the {response_source} for user query {question}"
+            )
             augmented_response = helper.augment_response(
-                intent, llm_response, conversation_id, None, None, True
+                intent, common_intent_response, conversation_id, None, None, True
             )
             current_conversation_thread = (
                 conversation_history.create_conversation_thread(
                     conversation_id, str(question), augmented_response, tenant_id
                 )
             )
-            conversation_history.store_conversation_history(
+            _store_conversation_history(
+                intent,
                 current_conversation_thread,
                 current_state,
                 conversation_id,
@@ -190,7 +649,8 @@ def run_chatbot(request: RunChatbotModel):
                     conversation_id, question, augmented_response, tenant_id
                 )
             )
-            conversation_history.store_conversation_history(
+            _store_conversation_history(
+                intent,
                 current_conversation_thread,
                 current_state,
                 conversation_id,
@@ -211,7 +671,8 @@ def run_chatbot(request: RunChatbotModel):
                     conversation_id, str(question), augmented_response, tenant_id
                 )
             )
-            conversation_history.store_conversation_history(
+            _store_conversation_history(
+                intent,
                 current_conversation_thread,
                 current_state,
                 conversation_id,
@@ -234,8 +695,29 @@ def run_chatbot(request: RunChatbotModel):
         intent = check_and_update_incomplete_intent(
             username, intent, incomplete_intent, incomplete_intent_count, logger
         )
-        # call the llm chain to detect entities
-        entity_dict = hosted_llmObj.extract_entities_from_utterance(question)
+        metric_labels["intent"] = intent
+        # start the api call with the parameters of the earlier turns while the entities are extracted, the result is
+        # only used if the entities of the user query leave those parameters unchanged
+        speculation = (
+            chatController.speculate_API(
+                speculation_executor,
+                intent,
+                {**global_states[state_key], TENANT_ID: tenant_id},
+                api_key,
+                logger,
+            )
+            if speculative_si_api_calls
+            else None
+        )
+        # call the llm chain to detect entities, or collect the result of the concurrent extraction
+        with STAGE_DURATION.time(
+            stage=REQUEST_STAGE_ENTITY, intent=intent, tenant=tenant_id
+        ):
+            entity_dict = (
+                hosted_llmObj.get_prefetched_entities(entity_future, question)
+                if entity_future is not None
+                else hosted_llmObj.extract_entities_from_utterance(question, intent)
+            )
         logger.info(
             f"Extracted entities {entity_dict} from user query {question} for user {username}"
         )
@@ -247,13 +729,16 @@ def run_chatbot(request: RunChatbotModel):
             logger.info(
                 f"For user query {question}, user entered system name instead of system id"
             )
-            mapped_storage_system_id = helper.get_storage_system_id(
-                entity_dict[SYSTEM_NAME].lower(),
-                tenant_id,
-                api_key=api_key,
-                chat_controller=chatController,
-                logger=logger,
-            )
+            with STAGE_DURATION.time(
+                stage=REQUEST_STAGE_SYSTEM_NAME, intent=intent, tenant=tenant_id
+            ):
+                mapped_storage_system_id = helper.get_storage_system_id(
+                    entity_dict[SYSTEM_NAME].lower(),
+                    tenant_id,
+                    api_key=api_key,
+                    chat_controller=chatController,
+                    logger=logger,
+                )
             # if a valid new storage system id is found, update the entity_dict
             if mapped_storage_system_id != entity_dict[SYSTEM_NAME]:
                 entity_dict[STORAGE_SYSTEM_ID] = mapped_storage_system_id
@@ -279,89 +764,74 @@ def run_chatbot(request: RunChatbotModel):
         augmented_response = None
         error_response = None
         # invoke the api based on intent and entities
-        documents = chatController.invoke_API(
-            intent, global_states[state_key], api_key, logger
-        )
-        documents = preprocess_api_response(documents, intent, current_state)
+        with STAGE_DURATION.time(
+            stage=REQUEST_STAGE_SI_API, intent=intent, tenant=tenant_id
+        ):
+            if speculation is not None and speculation[0] == current_state:
+                SI_API_SPECULATIONS.inc(intent=intent, outcome=SPECULATION_HIT)
+                documents, global_states[state_key] = speculation[1].result()
+                current_state = global_states[state_key]
+            else:
+                if speculation is not None:
+                    SI_API_SPECULATIONS.inc(intent=intent, outcome=SPECULATION_MISS)
+                    speculation[1].cancel()
+                    logger.info(
+                        f"Discarded speculative {intent} call, parameters changed to {current_state}"
+                    )
+                documents = chatController.invoke_API(
+                    intent, global_states[state_key], api_key, logger
+                )
+        # keep the digest of the tenant refreshed while it uses the chatbot, the key is only kept if it was verified
+        morning_cup_digests.mark_active(tenant_id, api_key)
+        with STAGE_DURATION.time(
+            stage=REQUEST_STAGE_PREPROCESS, intent=intent, tenant=tenant_id
+        ):
+            documents = preprocess_api_response(documents, intent, current_state)
 
         if documents:
-            response, is_response_generated = (
-                hosted_llmObj.extract_answers_from_documents(
-                    question, intent, documents[DATA]
+            if intent in RESPONSE_GENERATION_INTENTS and DATA in documents:
+                generate_answers = (
+                    hosted_llmObj.stream_answers_from_documents
+                    if stream_response
+                    else hosted_llmObj.extract_answers_from_documents
+                )
+                with STAGE_DURATION.time(
+                    stage=REQUEST_STAGE_RESPONSE, intent=intent, tenant=tenant_id
+                ):
+                    response, is_response_generated = generate_answers(
+                        question, intent, documents[DATA]
+                    )
+            else:
+                response, is_response_generated = documents[DATA], False
+            if stream_response and is_response_generated:
+                return StreamingResponse(
+                    _stream_chatbot_response(
+                        response,
+                        question,
+                        intent,
+                        conversation_id,
+                        tenant_id,
+                        username,
+                        current_state,
+                    ),
+                    media_type=EVENT_STREAM_MEDIA_TYPE,
+                    # disable buffering in proxies so that every chunk reaches the client as soon as it is generated
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
                 )
-                if intent in RESPONSE_GENERATION_INTENTS and DATA in documents
-                else (documents[DATA], False)
-            )
             response = {DATA: response}
         else:
             response = {DATA: documents}
             is_response_generated = False
-        augmented_response = helper.augment_response(
+        augmented_response = _complete_chatbot_response(
+            question,
             intent,
             response,
-            conversation_id,
-            tenant_id,
-            (
-                current_state[STORAGE_SYSTEM_ID]
-                if STORAGE_SYSTEM_ID in current_state
-                else None
-            ),
             is_response_generated,
-        )
-        if intent == CHATBOT_CAPABILITIES and (
-            augmented_response[MESSAGE] is None or len(augmented_response[MESSAGE]) == 0
-        ):
-            # Check if data key is present and has a None value
-            error_response = {
-                STATUS: NO_CONTENT,
-                MESSAGE: "No data available for the given request.",
-                IDENTIFIER: TEXT,
-                DATA: [],
-            }
-            raise HTTPException(status_code=204, detail=error_response)
-        elif intent != CHATBOT_CAPABILITIES and (
-            augmented_response[DATA] is None or len(augmented_response[DATA]) == 0
-        ):
-            augmented_response[DATA] = "No data found for your request. The resource may not be available on your tenant, or no response was received."
-            augmented_response[IDENTIFIER] = MARKDOWN
-        current_conversation_thread = conversation_history.create_conversation_thread(
-            conversation_id, str(question), augmented_response, tenant_id
-        )
-        conversation_history.store_conversation_history(
-            current_conversation_thread,
-            current_state,
             conversation_id,
-            username,
             tenant_id,
+            username,
+            current_state,
         )
-
-        if (
-            error_response is None
-            and intent in helper.get_api_list()
-            and augmented_response is not None
-        ):
-            # Append missing entities from current_state to userQuery based on the intent
-            updated_question = (
-                IntentsAndEntitiesDatabaseOperations.append_missing_entities_to_query(
-                    question, current_state, intent
-                )
-            )
-            IntentsAndEntitiesDatabaseOperations.insert_intent_and_entities(
-                intent, current_state, username, updated_question, tenant_id
-            )
-
-        # if incomplete intent was present and if the control comes here, that means intent was serviced properly,
-        # remove it from the list
-        # Reset incomplete intent count on successful completion
-        if username in incomplete_intent:
-            del incomplete_intent[username]
-            if username in incomplete_intent_count:
-                del incomplete_intent_count[username]
-            logger.info(f"Completed intent {intent} for user {username}")
-        # delete the key to reset consecutive exception count on a successful response
-        if username in consecutive_exception_count:
-            del consecutive_exception_count[username]
-            logger.info("Reset the consecutive exception count")
     except KeyError:
         # Handle case where "data" key is missing
         error_response = {
@@ -371,99 +841,22 @@ def run_chatbot(request: RunChatbotModel):
         }
         raise HTTPException(status_code=500, detail=error_response)
     except HTTPException as ex:
-        if (
-            ex
-            and ex.detail
-            and ex.detail[MESSAGE]
-            and INCOMPLETE_INTENT_CHECK_STR in ex.detail[MESSAGE]
-        ):
-            incomplete_intent[username] = intent
-            logger.info(f"Added incomplete intent {intent} for user {username}")
-
-            # **Store conversation history when "To proceed, I need the" is present**
-            if (
-                "To proceed, I need the"
-                in ex.detail[MESSAGE]
-            ):
-                logger.info(
-                    f"Incomplete entities detected for user {username}, storing chat history."
-                )
-
-                # Get the correct response message from the exception
-                response_message = ex.detail[MESSAGE]
-
-                # Create and store the conversation thread for incomplete entities
-                augmented_response = helper.augment_response(
-                    intent,
-                    {MESSAGE: response_message},
-                    conversation_id,
-                    tenant_id,
-                    (
-                        entity_dict[STORAGE_SYSTEM_ID]
-                        if STORAGE_SYSTEM_ID in entity_dict
-                        else None
-                    ),
-                    True,  # `is_response_generated` is True because the response is complete
-                )
-                augmented_response[USER_QUERY] = request.userQuery
-                augmented_response[IDENTIFIER] = MARKDOWN
-                current_conversation_thread = (
-                    conversation_history.create_conversation_thread(
-                        conversation_id,
-                        str(request.userQuery),
-                        augmented_response,
-                        tenant_id,
-                    )
-                )
-                conversation_history.store_conversation_history(
-                    current_conversation_thread,
-                    current_state,
-                    conversation_id,
-                    username,
-                    tenant_id,
-                )
-
-        logger.error(f"An error occurred: {ex}", ex)
-        # track consecutive exceptions
-        if username not in consecutive_exception_count:
-            consecutive_exception_count[username] = {
-                COUNT: 0,
-                LAST_EXCEPTION_MESSAGE: None,
-            }
-
-        last_exception_message = consecutive_exception_count[username][
-            LAST_EXCEPTION_MESSAGE
-        ]
-        if last_exception_message == ex.detail[MESSAGE]:
-            consecutive_exception_count[username][COUNT] += 1
-        else:
-            consecutive_exception_count[username] = {
-                COUNT: 1,
-                LAST_EXCEPTION_MESSAGE: ex.detail[MESSAGE],
-            }
-
-        # graceful exit if the same exception occurs consecutively
-        if consecutive_exception_count[username][COUNT] >= 2:
-            logger.error(
-                f"Consecutive same exception detected for user {username}, graceful exit.",
-                ex,
-            )
-            # Gracefully exit: clear state, reset incomplete intent, and respond with an apology
-            if state_key in global_states:
-                del global_states[state_key]
-            if username in incomplete_intent:
-                del incomplete_intent[username]
-            graceful_exit_response = {
-                STATUS: BAD_REQUEST,
-                MESSAGE: GRACEFUL_EXIT_MESSAGE,
-                IDENTIFIER: MARKDOWN,
-            }
-            # delete after graceful exit
-            del consecutive_exception_count[username]
-            raise HTTPException(status_code=400, detail=graceful_exit_response)
-
-        # Raise the original exception
-        raise ex
+        raise _handle_chatbot_error(
+            ex,
+            question,
+            intent,
+            conversation_id,
+            tenant_id,
+            username,
+            current_state,
+            entity_dict,
+        )
+    finally:
+        # concurrent work whose result was not collected, on an early return or an error, is cancelled
+        if entity_future is not None:
+            entity_future.cancel()
+        if speculation is not None:
+            speculation[1].cancel()
     return augmented_response
 
 
@@ -511,6 +904,87 @@ def previous_actions(
     return previous_actions_data
 
 
+async def _verify_api_key(tenant_id, encrypted_api_key) -> None:
+    """
+    Method to verify the api key of a request against its tenant, recently verified keys are not checked again
+    :param tenant_id: tenant of the request
+    :param encrypted_api_key: api key of the request, as sent by the client
+    :return:
+    """
+    try:
+        api_key = encryption_module.decrypt_value(encrypted_api_key)
+        is_verified = await morning_cup_digests.verify(tenant_id, api_key)
+    except Exception as ex:
+        logger.error(f"An error occurred: {ex}", ex)
+        raise _invalid_api_key_error()
+    if not is_verified:
+        raise _invalid_api_key_error()
+
+
+@app.get("/chatbot/intent_detection_report")
+async def intent_detection_report(tenant_id: str, api_key: str):
+    """
+    This endpoint reports the share of intents resolved by the intent cache, the local classifier and the llm
+    :param tenant_id: tenant of the caller
+    :param api_key: api key of the tenant
+    :return: intent cache counters and local classifier report
+    """
+    await _verify_api_key(tenant_id, api_key)
+    try:
+        return await run_in_threadpool(hosted_llmObj.get_intent_detection_report)
+    except Exception as ex:
+        logger.error(f"An error occurred: {ex}", ex)
+        raise HTTPException(status_code=500, detail=str(ex))
+
+
+@app.get("/chatbot/llm_health_report")
+async def llm_health_report(tenant_id: str, api_key: str):
+    """
+    This endpoint reports the circuit breaker state, the recent latencies of every llm stage and the hedged requests
+    :param tenant_id: tenant of the caller
+    :param api_key: api key of the tenant
+    :return: llm health report
+    """
+    await _verify_api_key(tenant_id, api_key)
+    try:
+        return await run_in_threadpool(hosted_llmObj.get_llm_health_report)
+    except Exception as ex:
+        logger.error(f"An error occurred: {ex}", ex)
+        raise HTTPException(status_code=500, detail=str(ex))
+
+
+@app.get("/chatbot/token_usage_report")
+async def token_usage_report(
+    tenant_id: str, api_key: str, username: str | None = None, since: str | None = None
+):
+    """
+    This endpoint reports the llm tokens used by the tenant of the caller per user and llm stage, and its token budgets
+    :param tenant_id: tenant of the caller, only this tenant is reported
+    :param api_key: api key of the tenant
+    :param username: only report this user
+    :param since: first day of the report as YYYY-MM-DD, defaults to the start of the current month
+    :return: token usage report
+    """
+    await _verify_api_key(tenant_id, api_key)
+    try:
+        return await run_in_threadpool(
+            hosted_llmObj.get_token_usage_report, tenant_id, username, since
+        )
+    except Exception as ex:
+        logger.error(f"An error occurred: {ex}", ex)
+        raise HTTPException(status_code=500, detail=str(ex))
+
+
+@app.get("/metrics")
+def metrics():
+    """
+    This endpoint exposes the request and stage latency histograms, the llm call metrics, the cache counters and the
+    in-progress gauges in the prometheus text format
+    :return: metrics of this worker process
+    """
+    return Response(REGISTRY.render(), media_type=METRICS_MEDIA_TYPE)
+
+
 @app.post("/chatbot/login")
 def login(user_data: UserLoginRequest):
     try:
@@ -718,6 +1192,7 @@ def execute_action(
     username = request.username
     conversation_id = request.conversation_id or str(uuid.uuid4())
     userQuery = request.userQuery
+    set_usage_owner(tenant_id, username)
 
     try:
         api_key = encryption_module.decrypt_value(decrypted_api_key)
@@ -757,113 +1232,180 @@ def execute_action(
             raise HTTPException(status_code=500, detail=error_response)
 
 
+def _store_morning_cup_of_coffee(conversation_id, username, tenant_id, response_data):
+    """
+    Method to store the digest in the conversation history
+    :param response_data: sections of the digest
+    :return: augmented response
+    """
+    state_key = (conversation_id, username)
+    current_state = global_states.get(state_key)
+    current_conversation_thread = conversation_history.create_conversation_thread(
+        conversation_id, str(MORNING_CUP_OF_COFFEE), response_data, tenant_id
+    )
+    current_conversation_thread[ROUTINE] = MORNING_CUP_OF_COFFEE_ROUTINE
+    _store_conversation_history(
+        MORNING_CUP_OF_COFFEE_ROUTINE,
+        current_conversation_thread,
+        current_state,
+        conversation_id,
+        username,
+        tenant_id,
+    )
+    return {
+        CONVERSATION_ID: conversation_id,
+        DATA: response_data,
+        ROUTINE: MORNING_CUP_OF_COFFEE_ROUTINE,
+    }
+
+
+def _invalid_api_key_error() -> HTTPException:
+    error_response = {STATUS: UNAUTHORIZED, MESSAGE: INVALID_API_KEY, IDENTIFIER: TEXT}
+    return HTTPException(status_code=401, detail=error_response)
+
+
+def _morning_cup_of_coffee_error() -> HTTPException:
+    error_response = {
+        STATUS: INTERNAL_SERVER_ERROR,
+        MESSAGE: MISSING_PARAMETER_MORNINGCUP_ROUTINE,
+        IDENTIFIER: TEXT,
+    }
+    return HTTPException(status_code=500, detail=error_response)
+
+
 @app.post("/chatbot/morning_cup_of_coffee")
-def morning_cup_of_coffee(
-    request: MorningCupOfCoffeeModel
+async def morning_cup_of_coffee(
+    request: MorningCupOfCoffeeModel, response: Response
 ):
-    try:
-        global global_states
-        username = request.username
-        tenant_id = request.tenant_id
-        decrypted_api_key = request.api_key
-        conversation_id = request.conversation_id or str(uuid.uuid4())
-
-        response_data = []
-        api_key = encryption_module.decrypt_value(decrypted_api_key)
-        # Iterating over REGISTERED_APIS to find the required APIs by their class names.
-        for api in REGISTERED_APIS:
-            parameters = {TENANT_ID: tenant_id}
-            if api.__name__ == STORAGE_LIST_INFO:
-                storage_data_response = api.call(
-                    BASE_URL, parameters, api_key, STORAGE_LIST, logger=logger
-                )
-                error_storage_data = [
-                    entry
-                    for entry in storage_data_response[DATA]
-                    if entry[CONDITION] == ERROR
-                ]
-                description = (
-                    STORAGE_LIST_DESC
-                    if error_storage_data
-                    else STORAGE_LIST_NO_DATA_DESC
-                )
-                response_data.append(
-                    {
-                        INTENT: STORAGE_LIST,
-                        DATA: error_storage_data,
-                        IDENTIFIER: GRID,
-                        DESCRIPTION: description,
-                    }
+    """
+    This endpoint returns the digest of the tenant: the storage systems in error, and the critical alerts and
+    notifications of the last day. The digest is shared by the users of the tenant and served from memory while it is
+    recent, with its age in seconds in the response and in the Age header. Otherwise the sections are fetched
+    concurrently, each within its deadline, and a section which could not be fetched is returned without data as long
+    as another section was fetched.
+    :param request: {"tenant_id": "", "username": "", "api_key": "", "conversation_id": ""}
+    :return:
+    """
+    with REQUESTS_IN_PROGRESS.track_in_progress(
+        endpoint="morning_cup_of_coffee"
+    ), REQUEST_DURATION.time(
+        endpoint="morning_cup_of_coffee",
+        intent=MORNING_CUP_OF_COFFEE_ROUTINE,
+        tenant=request.tenant_id,
+    ):
+        try:
+            conversation_id = request.conversation_id or str(uuid.uuid4())
+            api_key = encryption_module.decrypt_value(request.api_key)
+            try:
+                response_data, age, fetched = await morning_cup_digests.get(
+                    request.tenant_id, api_key
                 )
-            elif (
-                api.__name__ == TENANT_ALERTS_INFO
-                or api.__name__ == TENANT_NOTIFICATIONS_INFO
-            ):
-                parameters.update({SEVERITY: CRITICAL, DURATION: OCCURRENCE})
+            except PermissionError as ex:
+                logger.error(f"An error occurred: {ex}", ex)
+                raise _invalid_api_key_error()
+            if not fetched:
+                raise ValueError("none of the sections of the digest could be fetched")
+            augmented_response = await run_in_threadpool(
+                _store_morning_cup_of_coffee,
+                conversation_id,
+                request.username,
+                request.tenant_id,
+                response_data,
+            )
+            augmented_response[DIGEST_AGE_SECONDS] = int(age)
+            response.headers["Age"] = str(int(age))
+            return augmented_response
+        except HTTPException as ex:
+            raise ex
+        except Exception as ex:
+            logger.error(f"An error occurred: {ex}", ex)
+            raise _morning_cup_of_coffee_error()
 
-                if api.__name__ == TENANT_ALERTS_INFO:
-                    alert_data = api.call(
-                        BASE_URL, parameters, api_key, TENANT_ALERTS, logger=logger
-                    )
-                    description = (
-                        TENANT_ALERTS_DESC
-                        if alert_data[DATA]
-                        else TENANT_ALERTS_NO_DATA_DESC
-                    )
-                    response_data.append(
-                        {
-                            INTENT: TENANT_ALERTS,
-                            DATA: alert_data,
-                            IDENTIFIER: GRID,
-                            DESCRIPTION: description,
-                        }
-                    )
-                elif api.__name__ == TENANT_NOTIFICATIONS_INFO:
-                    notification_data = api.call(
-                        BASE_URL,
-                        parameters,
-                        api_key,
-                        TENANT_NOTIFICATIONS,
-                        logger=logger,
-                    )
-                    description = (
-                        TENANT_NOTIFICATIONS_DESC
-                        if notification_data[DATA]
-                        else TENANT_NOTIFICATIONS_NO_DATA_DESC
-                    )
-                    response_data.append(
-                        {
-                            INTENT: TENANT_NOTIFICATIONS,
-                            DATA: notification_data,
-                            IDENTIFIER: GRID,
-                            DESCRIPTION: description,
-                        }
-                    )
 
-        state_key = (conversation_id, username)
-        current_state = global_states.get(state_key)
-        current_conversation_thread = conversation_history.create_conversation_thread(
-            conversation_id, str(MORNING_CUP_OF_COFFEE), response_data, tenant_id
-        )
-        current_conversation_thread[ROUTINE] = MORNING_CUP_OF_COFFEE_ROUTINE
-        conversation_history.store_conversation_history(
-            current_conversation_thread,
-            current_state,
-            conversation_id,
-            username,
-            tenant_id,
-        )
-        augmented_response = {
-            CONVERSATION_ID: conversation_id,
-            DATA: response_data,
-            ROUTINE: MORNING_CUP_OF_COFFEE_ROUTINE,
-        }
-        return augmented_response
+@app.post("/chatbot/morning_cup_of_coffee_stream")
+async def morning_cup_of_coffee_stream(request: MorningCupOfCoffeeModel):
+    """
+    This endpoint returns the digest of the tenant, same as /chatbot/morning_cup_of_coffee, as server sent events: a
+    start event with the conversation id, one section event per section as soon as it is fetched, and an end event with
+    the augmented response, its sections in display order, once it is stored in the conversation history. A digest
+    served from memory is sent at once.
+    :param request: {"tenant_id": "", "username": "", "api_key": "", "conversation_id": ""}
+    :return:
+    """
+    conversation_id = request.conversation_id or str(uuid.uuid4())
+    try:
+        api_key = encryption_module.decrypt_value(request.api_key)
+        is_verified = await morning_cup_digests.verify(request.tenant_id, api_key)
     except Exception as ex:
         logger.error(f"An error occurred: {ex}", ex)
-        error_response = {
-            STATUS: INTERNAL_SERVER_ERROR,
-            MESSAGE: MISSING_PARAMETER_MORNINGCUP_ROUTINE,
-            IDENTIFIER: TEXT,
-        }
-        raise HTTPException(status_code=500, detail=error_response)
+        raise _morning_cup_of_coffee_error()
+    # the key is checked before serving the digest from memory
+    if not is_verified:
+        raise _invalid_api_key_error()
+    morning_cup_digests.mark_active(request.tenant_id, api_key)
+    cached = morning_cup_digests.get_cached(request.tenant_id, api_key)
+    # age of the digest in seconds, 0 unless it is served from memory
+    age = cached[1] if cached is not None else 0.0
+
+    async def iter_sections():
+        if cached is not None:
+            for section in cached[0]:
+                yield section, True
+            return
+        async for section, is_fetched in iter_morning_cup_of_coffee_sections(
+            apiController,
+            request.tenant_id,
+            api_key,
+            logger,
+            morning_cup_digests.timeout,
+        ):
+            yield section, is_fetched
+
+    async def stream_sections():
+        yield _server_sent_event(
+            STREAM_START_EVENT,
+            {ROUTINE: MORNING_CUP_OF_COFFEE_ROUTINE, CONVERSATION_ID: conversation_id},
+        )
+        sections = {}
+        try:
+            with REQUESTS_IN_PROGRESS.track_in_progress(
+                endpoint="morning_cup_of_coffee_stream"
+            ), REQUEST_DURATION.time(
+                endpoint="morning_cup_of_coffee_stream",
+                intent=MORNING_CUP_OF_COFFEE_ROUTINE,
+                tenant=request.tenant_id,
+            ):
+                async for section, is_fetched in iter_sections():
+                    sections[section[INTENT]] = (section, is_fetched)
+                    yield _server_sent_event(STREAM_SECTION_EVENT, section)
+            if not any(is_fetched for _, is_fetched in sections.values()):
+                raise _morning_cup_of_coffee_error()
+            response_data = [
+                sections[intent][0] for intent, _ in MORNING_CUP_OF_COFFEE_SECTIONS
+            ]
+            if cached is None and all(
+                is_fetched for _, is_fetched in sections.values()
+            ):
+                morning_cup_digests.store(request.tenant_id, response_data)
+            augmented_response = await run_in_threadpool(
+                _store_morning_cup_of_coffee,
+                conversation_id,
+                request.username,
+                request.tenant_id,
+                response_data,
+            )
+            augmented_response[DIGEST_AGE_SECONDS] = int(age)
+            yield _server_sent_event(STREAM_END_EVENT, augmented_response)
+        except HTTPException as ex:
+            yield _server_sent_event(STREAM_ERROR_EVENT, ex.detail)
+        except Exception as ex:
+            logger.error(f"An error occurred while streaming the digest: {ex}", ex)
+            yield _server_sent_event(
+                STREAM_ERROR_EVENT, _morning_cup_of_coffee_error().detail
+            )
+
+    return StreamingResponse(
+        stream_sections(),
+        media_type=EVENT_STREAM_MEDIA_TYPE,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
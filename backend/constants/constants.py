@@ -58,9 +58,19 @@ BUTTONS = "buttons"
 USER_DATA = "user_data"
 LINK = "link"
 
+# server sent events of the streamed chatbot response
+STREAM_START_EVENT = "start"
+STREAM_TOKEN_EVENT = "token"
+STREAM_END_EVENT = "end"
+STREAM_ERROR_EVENT = "error"
+STREAM_SECTION_EVENT = "section"
+EVENT_STREAM_MEDIA_TYPE = "text/event-stream"
+
 # hosted llm parameter
 INTENT_DETECTION_STOP_SEQUENCE = ["]"]
 ENTITY_EXTRACTION_STOP_SEQUENCE = ["}", "\n\n"]
+JOINT_INTENT_ENTITY_STOP_SEQUENCE = ["}", "\n\n"]
+JOINT_TAGS_SEPARATOR = "Tags:"
 GREEDY = "greedy"
 FIFTEEN = 15
 HUNDRED = 100
@@ -68,10 +78,203 @@ ONE = 1
 WATSONX_APIKEY = "WATSONX_APIKEY"
 GRANITE_34B_CODE_INSTRUCT = "ibm/granite-34b-code-instruct"
 LLAMA_3_405B_INSTRUCT = "meta-llama/llama-3-405b-instruct"
+LLAMA_3_1_70B_INSTRUCT = "meta-llama/llama-3-1-70b-instruct"
 WATSONX_HOSTED_SERVICE = "WATSONX_HOSTED_SERVICE"
 PROJECT_ID = "PROJECT_ID"
 SECRET_KEY = "SECRET_KEY"
 
+# hosted llm orchestration, values are read from environment variables of the same name
+PARALLEL_ENTITY_EXTRACTION = "PARALLEL_ENTITY_EXTRACTION"
+LLM_EXECUTOR_WORKERS = "LLM_EXECUTOR_WORKERS"
+DEFAULT_LLM_EXECUTOR_WORKERS = 8
+INTENT_CACHE_MAX_SIZE = "INTENT_CACHE_MAX_SIZE"
+INTENT_CACHE_TTL_SECONDS = "INTENT_CACHE_TTL_SECONDS"
+DEFAULT_INTENT_CACHE_MAX_SIZE = 1024
+DEFAULT_INTENT_CACHE_TTL_SECONDS = 3600
+LLM_COMPLETION_CACHE_MAX_BYTES = "LLM_COMPLETION_CACHE_MAX_BYTES"
+DEFAULT_LLM_COMPLETION_CACHE_MAX_BYTES = 67108864  # bytes = 64 MiB
+LOCAL_INTENT_CLASSIFIER = "LOCAL_INTENT_CLASSIFIER"
+INTENT_CLASSIFIER_CONFIDENCE_THRESHOLD = "INTENT_CLASSIFIER_CONFIDENCE_THRESHOLD"
+# lowest threshold without a wrong prediction on held-out folds of the labelled examples
+DEFAULT_INTENT_CLASSIFIER_CONFIDENCE_THRESHOLD = 0.9
+LOCAL_ENTITY_EXTRACTOR = "LOCAL_ENTITY_EXTRACTOR"
+TOKEN_ESTIMATE_SAFETY_MARGIN = "TOKEN_ESTIMATE_SAFETY_MARGIN"
+DEFAULT_TOKEN_ESTIMATE_SAFETY_MARGIN = 0.15
+DOCUMENT_COMPACTION = "DOCUMENT_COMPACTION"
+DOCUMENT_TOKEN_BUDGET = "DOCUMENT_TOKEN_BUDGET"
+DEFAULT_DOCUMENT_TOKEN_BUDGET = 0  # tokens, 0 = bounded by the context window only
+MAP_REDUCE_MAX_CHUNKS = "MAP_REDUCE_MAX_CHUNKS"
+MAP_REDUCE_CHUNK_TOKENS = "MAP_REDUCE_CHUNK_TOKENS"
+MAP_REDUCE_PARALLELISM = "MAP_REDUCE_PARALLELISM"
+MAP_REDUCE_CHUNK_TIMEOUT_SECONDS = "MAP_REDUCE_CHUNK_TIMEOUT_SECONDS"
+MAP_REDUCE_TIMEOUT_SECONDS = "MAP_REDUCE_TIMEOUT_SECONDS"
+DEFAULT_MAP_REDUCE_MAX_CHUNKS = 16  # about 256k tokens of documents, 0 disables map reduce summarization
+DEFAULT_MAP_REDUCE_CHUNK_TOKENS = 16000
+DEFAULT_MAP_REDUCE_PARALLELISM = 8
+DEFAULT_MAP_REDUCE_CHUNK_TIMEOUT_SECONDS = 120
+DEFAULT_MAP_REDUCE_TIMEOUT_SECONDS = 240  # deadline of the map and reduce rounds together
+ANSWER_CACHE_MAX_SIZE = "ANSWER_CACHE_MAX_SIZE"
+ANSWER_CACHE_MAX_BYTES = "ANSWER_CACHE_MAX_BYTES"
+ANSWER_CACHE_TTL_SECONDS = "ANSWER_CACHE_TTL_SECONDS"
+DEFAULT_ANSWER_CACHE_MAX_SIZE = 512
+DEFAULT_ANSWER_CACHE_MAX_BYTES = 16777216  # bytes = 16 MiB
+DEFAULT_ANSWER_CACHE_TTL_SECONDS = 300
+INTENT_FEW_SHOT_EXAMPLES = "INTENT_FEW_SHOT_EXAMPLES"
+ENTITY_FEW_SHOT_EXAMPLES = "ENTITY_FEW_SHOT_EXAMPLES"
+DEFAULT_INTENT_FEW_SHOT_EXAMPLES = 24  # 0 keeps every example of the prompt
+DEFAULT_ENTITY_FEW_SHOT_EXAMPLES = 10
+JOINT_INTENT_ENTITY_EXTRACTION = "JOINT_INTENT_ENTITY_EXTRACTION"
+LLM_MICRO_BATCHING = "LLM_MICRO_BATCHING"
+LLM_BATCH_WINDOW_MS = "LLM_BATCH_WINDOW_MS"
+LLM_MAX_BATCH_SIZE = "LLM_MAX_BATCH_SIZE"
+DEFAULT_LLM_BATCH_WINDOW_MS = 20
+DEFAULT_LLM_MAX_BATCH_SIZE = 8
+LLM_INVOKE_WORKERS = "LLM_INVOKE_WORKERS"
+DEFAULT_LLM_INVOKE_WORKERS = 32
+LLM_INTENT_TIMEOUT_SECONDS = "LLM_INTENT_TIMEOUT_SECONDS"
+LLM_ENTITY_TIMEOUT_SECONDS = "LLM_ENTITY_TIMEOUT_SECONDS"
+LLM_COMMON_INTENTS_TIMEOUT_SECONDS = "LLM_COMMON_INTENTS_TIMEOUT_SECONDS"
+LLM_RESPONSE_TIMEOUT_SECONDS = "LLM_RESPONSE_TIMEOUT_SECONDS"
+DEFAULT_LLM_INTENT_TIMEOUT_SECONDS = 10  # 0 waits without a deadline
+DEFAULT_LLM_ENTITY_TIMEOUT_SECONDS = 10
+DEFAULT_LLM_COMMON_INTENTS_TIMEOUT_SECONDS = 10
+DEFAULT_LLM_RESPONSE_TIMEOUT_SECONDS = 180
+LLM_CONNECT_TIMEOUT_SECONDS = "LLM_CONNECT_TIMEOUT_SECONDS"
+DEFAULT_LLM_CONNECT_TIMEOUT_SECONDS = 10
+LLM_HEDGING = "LLM_HEDGING"
+LLM_HEDGE_PERCENTILE = "LLM_HEDGE_PERCENTILE"
+LLM_HEDGE_MIN_SAMPLES = "LLM_HEDGE_MIN_SAMPLES"
+LLM_LATENCY_WINDOW_SIZE = "LLM_LATENCY_WINDOW_SIZE"
+DEFAULT_LLM_HEDGE_PERCENTILE = 95
+DEFAULT_LLM_HEDGE_MIN_SAMPLES = 20
+DEFAULT_LLM_LATENCY_WINDOW_SIZE = 200
+LLM_CIRCUIT_FAILURE_RATE = "LLM_CIRCUIT_FAILURE_RATE"
+LLM_CIRCUIT_WINDOW_SIZE = "LLM_CIRCUIT_WINDOW_SIZE"
+LLM_CIRCUIT_MIN_CALLS = "LLM_CIRCUIT_MIN_CALLS"
+LLM_CIRCUIT_OPEN_SECONDS = "LLM_CIRCUIT_OPEN_SECONDS"
+DEFAULT_LLM_CIRCUIT_FAILURE_RATE = 0.5  # 0 disables the circuit breaker
+DEFAULT_LLM_CIRCUIT_WINDOW_SIZE = 20
+DEFAULT_LLM_CIRCUIT_MIN_CALLS = 10
+DEFAULT_LLM_CIRCUIT_OPEN_SECONDS = 30
+LLM_BACKEND = "LLM_BACKEND"
+LLM_CASSETTE_PATH = "LLM_CASSETTE_PATH"
+LLM_REPLAY_LATENCY = "LLM_REPLAY_LATENCY"
+LLM_REPLAY_SEED = "LLM_REPLAY_SEED"
+LLM_STUB_RULES_PATH = "LLM_STUB_RULES_PATH"
+DEFAULT_LLM_BACKEND = "live"
+DEFAULT_LLM_CASSETTE_PATH = "/app/database/llm_cassette.jsonl"
+DEFAULT_LLM_REPLAY_LATENCY = "recorded"
+DEFAULT_LLM_REPLAY_SEED = 5
+TOKEN_USAGE_ACCOUNTING = "TOKEN_USAGE_ACCOUNTING"
+TOKEN_USAGE_FLUSH_SECONDS = "TOKEN_USAGE_FLUSH_SECONDS"
+TENANT_TOKEN_BUDGET = "TENANT_TOKEN_BUDGET"
+LLM_TOKEN_BUDGET = "LLM_TOKEN_BUDGET"
+TOKEN_BUDGET_SOFT_LIMIT = "TOKEN_BUDGET_SOFT_LIMIT"
+DEFAULT_TOKEN_USAGE_FLUSH_SECONDS = 5
+DEFAULT_TENANT_TOKEN_BUDGET = 0  # tokens per calendar month, 0 = no budget
+DEFAULT_LLM_TOKEN_BUDGET = 0  # tokens per calendar month for all tenants, 0 = no budget
+DEFAULT_TOKEN_BUDGET_SOFT_LIMIT = 0.8
+RESPONSE_MODEL_ROUTING = "RESPONSE_MODEL_ROUTING"
+RESPONSE_SMALL_MODEL_ID = "RESPONSE_SMALL_MODEL_ID"
+RESPONSE_SMALL_MODEL_MAX_PROMPT_TOKENS = "RESPONSE_SMALL_MODEL_MAX_PROMPT_TOKENS"
+RESPONSE_LARGE_MODEL_INTENTS = "RESPONSE_LARGE_MODEL_INTENTS"  # comma separated intents
+RESPONSE_LATENCY_SLO_SECONDS = "RESPONSE_LATENCY_SLO_SECONDS"
+RESPONSE_ROUTING_MIN_SAMPLES = "RESPONSE_ROUTING_MIN_SAMPLES"
+RESPONSE_ROUTING_PROBE_SECONDS = "RESPONSE_ROUTING_PROBE_SECONDS"
+RESPONSE_MIN_NEW_TOKENS = "RESPONSE_MIN_NEW_TOKENS"
+RESPONSE_OUTPUT_TOKEN_RATIO = "RESPONSE_OUTPUT_TOKEN_RATIO"
+DEFAULT_RESPONSE_SMALL_MODEL_ID = LLAMA_3_1_70B_INSTRUCT
+DEFAULT_RESPONSE_SMALL_MODEL_MAX_PROMPT_TOKENS = 4000
+DEFAULT_RESPONSE_LATENCY_SLO_SECONDS = 60  # 0 disables the fallback to the small model
+DEFAULT_RESPONSE_ROUTING_MIN_SAMPLES = 20
+DEFAULT_RESPONSE_ROUTING_PROBE_SECONDS = 30
+DEFAULT_RESPONSE_MIN_NEW_TOKENS = 512
+DEFAULT_RESPONSE_OUTPUT_TOKEN_RATIO = 1.5
+COMMON_INTENTS_LLM_RESPONSES = "COMMON_INTENTS_LLM_RESPONSES"
+COMMON_INTENTS_RESPONSES_PATH = "COMMON_INTENTS_RESPONSES_PATH"
+SPECULATIVE_SI_API_CALLS = "SPECULATIVE_SI_API_CALLS"
+SI_API_SPECULATION_WORKERS = "SI_API_SPECULATION_WORKERS"
+DEFAULT_SI_API_SPECULATION_WORKERS = 8
+SI_API_POOL_CONNECTIONS = "SI_API_POOL_CONNECTIONS"
+SI_API_POOL_MAXSIZE = "SI_API_POOL_MAXSIZE"
+SI_API_CONNECT_TIMEOUT_SECONDS = "SI_API_CONNECT_TIMEOUT_SECONDS"
+SI_API_READ_TIMEOUT_SECONDS = "SI_API_READ_TIMEOUT_SECONDS"
+DEFAULT_SI_API_POOL_CONNECTIONS = 4
+DEFAULT_SI_API_POOL_MAXSIZE = 32
+DEFAULT_SI_API_CONNECT_TIMEOUT_SECONDS = 5
+DEFAULT_SI_API_READ_TIMEOUT_SECONDS = 60
+SI_API_HTTP2 = "SI_API_HTTP2"
+SI_API_MAX_CONCURRENCY = "SI_API_MAX_CONCURRENCY"
+DEFAULT_SI_API_MAX_CONCURRENCY = 16
+MORNING_CUP_OF_COFFEE_TIMEOUT_SECONDS = "MORNING_CUP_OF_COFFEE_TIMEOUT_SECONDS"
+DEFAULT_MORNING_CUP_OF_COFFEE_TIMEOUT_SECONDS = 20
+MORNING_CUP_OF_COFFEE_REFRESH_SECONDS = "MORNING_CUP_OF_COFFEE_REFRESH_SECONDS"
+MORNING_CUP_OF_COFFEE_MAX_AGE_SECONDS = "MORNING_CUP_OF_COFFEE_MAX_AGE_SECONDS"
+MORNING_CUP_OF_COFFEE_ACTIVE_TENANT_SECONDS = "MORNING_CUP_OF_COFFEE_ACTIVE_TENANT_SECONDS"
+DEFAULT_MORNING_CUP_OF_COFFEE_REFRESH_SECONDS = 900  # 0 disables the background refresh
+DEFAULT_MORNING_CUP_OF_COFFEE_MAX_AGE_SECONDS = 1800
+DEFAULT_MORNING_CUP_OF_COFFEE_ACTIVE_TENANT_SECONDS = 86400
+MORNING_CUP_OF_COFFEE_KEY_VERIFICATION_SECONDS = "MORNING_CUP_OF_COFFEE_KEY_VERIFICATION_SECONDS"
+DEFAULT_MORNING_CUP_OF_COFFEE_KEY_VERIFICATION_SECONDS = 900
+
+# llm backends, record also saves the completions of watsonx to the cassette, replay serves them back from the
+# cassette and stub answers with local rules. Replay and stub work without network access
+LLM_BACKEND_LIVE = "live"
+LLM_BACKEND_RECORD = "record"
+LLM_BACKEND_REPLAY = "replay"
+LLM_BACKEND_STUB = "stub"
+
+# token budget states, response generation is skipped from the soft limit and requests are rejected once exhausted
+TOKEN_BUDGET_OK = "ok"
+TOKEN_BUDGET_SOFT_LIMIT_REACHED = "soft_limit_reached"
+TOKEN_BUDGET_EXHAUSTED = "exhausted"
+TOKEN_BUDGET_EXHAUSTED_MESSAGE = (
+    "The Watsonx token budget of your tenant for this month has been used. Tokens will refresh next month, please "
+    "contact your administrator to raise the budget."
+)
+
+# llm stages, used to label timeouts, latencies and usage of the llm calls
+LLM_STAGE_INTENT = "intent_detection"
+LLM_STAGE_ENTITY = "entity_extraction"
+LLM_STAGE_JOINT = "joint_intent_entity_detection"
+LLM_STAGE_COMMON_INTENTS = "common_intents_response"
+LLM_STAGE_RESPONSE = "response_generation"
+LLM_STAGES = (
+    LLM_STAGE_INTENT,
+    LLM_STAGE_ENTITY,
+    LLM_STAGE_JOINT,
+    LLM_STAGE_COMMON_INTENTS,
+    LLM_STAGE_RESPONSE,
+)
+# stages short enough to duplicate, response generation is never hedged
+HEDGED_LLM_STAGES = (
+    LLM_STAGE_INTENT,
+    LLM_STAGE_ENTITY,
+    LLM_STAGE_JOINT,
+    LLM_STAGE_COMMON_INTENTS,
+)
+# stages whose completions are kept in the persistent completion cache, generated responses hold tenant data
+CACHED_LLM_STAGES = (
+    LLM_STAGE_INTENT,
+    LLM_STAGE_ENTITY,
+    LLM_STAGE_JOINT,
+    LLM_STAGE_COMMON_INTENTS,
+)
+
+# stages of a chatbot request, used to label the stage latency histograms
+REQUEST_STAGE_INTENT = "intent_detection"
+REQUEST_STAGE_ENTITY = "entity_extraction"
+REQUEST_STAGE_SYSTEM_NAME = "system_name_resolution"
+REQUEST_STAGE_SI_API = "si_api_call"
+REQUEST_STAGE_PREPROCESS = "preprocess_api_response"
+REQUEST_STAGE_COMMON_INTENTS = "common_intents_response"
+REQUEST_STAGE_RESPONSE = "response_generation"
+REQUEST_STAGE_RESPONSE_STREAM = "response_streaming"
+REQUEST_STAGE_HISTORY = "conversation_history_write"
+SPECULATION_HIT = "hit"
+SPECULATION_MISS = "miss"
+METRICS_MEDIA_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
 # morning cup of coffee routine descriptions and constants
 STORAGE_LIST_DESC = "Here are the storage systems with Error condition on your tenant"
 TENANT_ALERTS_DESC = (
@@ -85,6 +288,10 @@ TENANT_ALERTS_NO_DATA_DESC = "There were no alerts generated during the last 24
 TENANT_NOTIFICATIONS_NO_DATA_DESC = (
     "There were no notifications generated during the last 24 hours."
 )
+DIGEST_AGE_SECONDS = "age_seconds"
+MORNING_CUP_OF_COFFEE_SECTION_UNAVAILABLE_DESC = (
+    "I couldn't fetch this section right now, please try again in a moment."
+)
 DATA = "data"
 SEVERITY = "severity"
 CONDITION = "condition"
@@ -414,6 +621,8 @@ USER_DATA_DB = "/app/database/user_data.db"
 API_KEY_DATABASE = "/app/database/api_key_database.db"
 INTENTS_AND_ENTITIES_FOR_PA = "/app/database/previous_actions.db"
 CONVERSATION_HISTORY_DB = "/app/database/conversation_history.db"
+LLM_COMPLETION_CACHE_DB = "/app/database/llm_completion_cache.db"
+TOKEN_USAGE_DB = "/app/database/token_usage.db"
 
 # log constants
 CONTAINER_MOUNT_POINT = "/app/logging/"
@@ -440,3 +649,11 @@ RESPONSE_GENERATION_INTENTS = (
     STORAGE_SYSTEM_ALERTS,
     STORAGE_SYSTEM_DETAILS,
 )
+# intents which are serviced without calling the entity extraction llm
+NON_ENTITY_INTENTS = (
+    GREETINGS,
+    THANKING,
+    UNKNOWN,
+    CHATBOT_CAPABILITIES,
+    MORNING_CUP_OF_COFFEE_ROUTINE,
+)
@@ -12,9 +12,6 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import requests
-from fastapi import HTTPException
-
 from backend.constants.constants import (
     STORAGE_SYSTEM_ALERTS,
     TENANT_ID,
@@ -22,12 +19,8 @@ from backend.constants.constants import (
     SEVERITY,
     DURATION,
     BASE_URL,
-    METADATA,
-    MESSAGE,
-    TEXT,
 )
 from backend.external_apis.Template import API
-from backend.utils.Helpers import generate_error_response
 
 
 class AlertByStorageSystem(API):
@@ -39,36 +32,11 @@ class AlertByStorageSystem(API):
     description = "Get alerts for a specific system added to a specific tenant based on severity and duration"
 
     @classmethod
-    def _invoke_and_validate(cls, base_url, parameters, headers, logger):
-
+    def _build_request(cls, base_url, parameters):
         get_url = f"{BASE_URL}tenants/{parameters[TENANT_ID]}/storage-systems/{parameters[STORAGE_SYSTEM_ID]}/alerts"
         query_params = {}
         if SEVERITY in parameters:
             query_params[SEVERITY] = parameters[SEVERITY]
         if DURATION in parameters:
             query_params[DURATION] = parameters[DURATION]
-        logger.info(f"Making the API call:{get_url}")
-
-        try:
-            response = requests.get(get_url, params=query_params, headers=headers)
-            # check if the response is empty or not
-            if response.content:
-                response_data = response.json()
-            else:
-                response_data = ""
-            # handling any errors thrown by external apis, ex. "Parameter duration value can't be greater then 30 days"
-            # so that UI can show the error message properly instead of 500 error. If "metadata" is present in
-            # response_data, that means an error has occurred
-            if METADATA in response_data:
-                error_msg = response_data[METADATA][MESSAGE]
-                raise HTTPException(
-                    status_code=400,
-                    detail=generate_error_response(
-                        status_code=400, error_msg=error_msg, identifier=TEXT
-                    ),
-                )
-        except Exception as ex:
-            logger.error(f"An unexpected error occurred: {ex}", ex)
-            raise ex
-
-        return response_data
+        return get_url, query_params
@@ -23,3 +23,7 @@ class ChatbotCapabilities(API):
     @classmethod
     def _invoke_and_validate(cls, base_url, parameters, api_key, logger):
         return {STATUS: 200, MESSAGE: EPSILON_SUMMARY}
+
+    @classmethod
+    async def _invoke_and_validate_async(cls, base_url, parameters, headers, logger):
+        return cls._invoke_and_validate(base_url, parameters, headers, logger)
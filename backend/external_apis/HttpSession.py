@@ -0,0 +1,181 @@
+# Copyright 2024. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import importlib.util
+from functools import lru_cache
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from backend.constants.constants import (
+    SI_API_HTTP2,
+    SI_API_MAX_CONCURRENCY,
+    DEFAULT_SI_API_MAX_CONCURRENCY,
+    SI_API_POOL_CONNECTIONS,
+    SI_API_POOL_MAXSIZE,
+    SI_API_CONNECT_TIMEOUT_SECONDS,
+    SI_API_READ_TIMEOUT_SECONDS,
+    DEFAULT_SI_API_POOL_CONNECTIONS,
+    DEFAULT_SI_API_POOL_MAXSIZE,
+    DEFAULT_SI_API_CONNECT_TIMEOUT_SECONDS,
+    DEFAULT_SI_API_READ_TIMEOUT_SECONDS,
+)
+from backend.utils.Helpers import get_env_flag, get_env_number
+
+# http/2 support of httpx is an optional dependency
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# process wide async client and the semaphore bounding its concurrent requests, created on first use in the event loop
+_async_client = None
+_async_semaphore = None
+
+
+@lru_cache(maxsize=None)
+def get_http_session() -> requests.Session:
+    """
+    Method to return the process wide http session used for the storage insights apis. Connections are kept alive and
+    pooled per host, so consecutive calls skip the tcp and tls handshakes, and responses are requested gzip compressed
+    and decompressed transparently. The session is shared by the request threads, which only use it to send requests.
+    :return: shared session
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        # number of hosts with a pool of connections, and connections kept alive per host
+        pool_connections=get_env_number(
+            SI_API_POOL_CONNECTIONS, DEFAULT_SI_API_POOL_CONNECTIONS, cast=int
+        ),
+        pool_maxsize=get_env_number(
+            SI_API_POOL_MAXSIZE, DEFAULT_SI_API_POOL_MAXSIZE, cast=int
+        ),
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers["Accept-Encoding"] = "gzip, deflate"
+    return session
+
+
+@lru_cache(maxsize=None)
+def get_http_timeout() -> tuple[float, float]:
+    """
+    Method to return the timeouts of the storage insights api calls
+    :return: tuple of the connect and read timeouts in seconds
+    """
+    return (
+        get_env_number(
+            SI_API_CONNECT_TIMEOUT_SECONDS,
+            DEFAULT_SI_API_CONNECT_TIMEOUT_SECONDS,
+            cast=float,
+        ),
+        get_env_number(
+            SI_API_READ_TIMEOUT_SECONDS, DEFAULT_SI_API_READ_TIMEOUT_SECONDS, cast=float
+        ),
+    )
+
+
+def http_get(url, **kwargs) -> requests.Response:
+    """
+    Method to send a get request through the shared session
+    :param url: url of the request
+    :param kwargs: arguments of requests.Session.get, like params and headers
+    :return: response
+    """
+    kwargs.setdefault("timeout", get_http_timeout())
+    return get_http_session().get(url, **kwargs)
+
+
+def http_post(url, **kwargs) -> requests.Response:
+    """
+    Method to send a post request through the shared session
+    :param url: url of the request
+    :param kwargs: arguments of requests.Session.post, like data and headers
+    :return: response
+    """
+    kwargs.setdefault("timeout", get_http_timeout())
+    return get_http_session().post(url, **kwargs)
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """
+    Method to return the process wide async http client used for the storage insights apis. It keeps the connections
+    alive, multiplexes the requests to a host over one http/2 connection when h2 is installed, and has the same pool
+    size and timeouts as the http session. The client must be used from the event loop of the app.
+    :return: shared async client
+    """
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        http2 = get_env_flag(SI_API_HTTP2, True)
+        if http2 and not HTTP2_AVAILABLE:
+            print("h2 is not installed, storage insights apis are called over http/1.1")
+        connect_timeout, read_timeout = get_http_timeout()
+        _async_client = httpx.AsyncClient(
+            http2=http2 and HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=get_env_number(
+                    SI_API_POOL_MAXSIZE, DEFAULT_SI_API_POOL_MAXSIZE, cast=int
+                ),
+                max_keepalive_connections=get_env_number(
+                    SI_API_POOL_MAXSIZE, DEFAULT_SI_API_POOL_MAXSIZE, cast=int
+                ),
+            ),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+        )
+    return _async_client
+
+
+def _get_async_semaphore() -> asyncio.Semaphore:
+    global _async_semaphore
+    if _async_semaphore is None:
+        _async_semaphore = asyncio.Semaphore(
+            get_env_number(
+                SI_API_MAX_CONCURRENCY, DEFAULT_SI_API_MAX_CONCURRENCY, cast=int
+            )
+        )
+    return _async_semaphore
+
+
+async def async_http_get(url, **kwargs) -> httpx.Response:
+    """
+    Method to send a get request through the shared async client, waiting while the maximum number of concurrent
+    requests is reached
+    :param url: url of the request
+    :param kwargs: arguments of httpx.AsyncClient.get, like params and headers
+    :return: response
+    """
+    async with _get_async_semaphore():
+        return await get_async_http_client().get(url, **kwargs)
+
+
+async def async_http_post(url, **kwargs) -> httpx.Response:
+    """
+    Method to send a post request through the shared async client, waiting while the maximum number of concurrent
+    requests is reached
+    :param url: url of the request
+    :param kwargs: arguments of httpx.AsyncClient.post, like data and headers
+    :return: response
+    """
+    async with _get_async_semaphore():
+        return await get_async_http_client().post(url, **kwargs)
+
+
+async def close_async_http_client() -> None:
+    """
+    Method to close the connections of the shared async client, when the app shuts down
+    """
+    global _async_client, _async_semaphore
+    if _async_client is not None:
+        await _async_client.aclose()
+    _async_client = None
+    _async_semaphore = None
@@ -12,21 +12,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import requests
-from fastapi import HTTPException
-
 from backend.constants.constants import (
     STORAGE_SYSTEM_NOTIFICATIONS,
     TENANT_ID,
     STORAGE_SYSTEM_ID,
     SEVERITY,
     DURATION,
-    METADATA,
-    MESSAGE,
-    TEXT,
 )
 from backend.external_apis.Template import API
-from backend.utils.Helpers import generate_error_response
 
 
 class NotificationByStorageSystem(API):
@@ -38,8 +31,7 @@ class NotificationByStorageSystem(API):
     description = "Get notifications for a specific system added to a specific tenant based on severity and duration"
 
     @classmethod
-    def _invoke_and_validate(cls, base_url, parameters, headers, logger):
-
+    def _build_request(cls, base_url, parameters):
         get_url = f"{base_url}tenants/{parameters[TENANT_ID]}/storage-systems/{parameters[STORAGE_SYSTEM_ID]}/notifications"
 
         query_params = {}
@@ -47,28 +39,4 @@ class NotificationByStorageSystem(API):
             query_params[SEVERITY] = parameters[SEVERITY]
         if DURATION in parameters:
             query_params[DURATION] = parameters[DURATION]
-        logger.info(f"Making the API call:{get_url}")
-
-        try:
-            response = requests.get(get_url, params=query_params, headers=headers)
-            # check if the response is empty or not
-            if response.content:
-                response_data = response.json()
-            else:
-                response_data = ""
-            # handling any errors thrown by external apis, ex. "Parameter duration value can't be greater then 30 days"
-            # so that UI can show the error message properly instead of 500 error. If "metadata" is present in
-            # response_data, that means an error has occurred
-            if METADATA in response_data:
-                error_msg = response_data[METADATA][MESSAGE]
-                raise HTTPException(
-                    status_code=400,
-                    detail=generate_error_response(
-                        status_code=400, error_msg=error_msg, identifier=TEXT
-                    ),
-                )
-        except Exception as ex:
-            logger.error(f"An unexpected error occurred: {ex}", ex)
-            raise ex
-
-        return response_data
+        return get_url, query_params
@@ -31,7 +31,9 @@ from backend.constants.constants import (
     intentDescMap,
     STORAGE_SYSTEM_METRIC,
     DURATION,
+    METADATA,
 )
+from backend.external_apis.HttpSession import async_http_get, http_get
 from backend.external_apis.TokenGenerationService import TokenGenerationService
 from backend.utils.Helpers import generate_error_response
 
@@ -45,52 +47,153 @@ class API(object):
     def call(cls, base_url, parameters, api_key, intent, logger):
 
         try:
-            # Step 1: Make sure all required parameters are collected
-            missing_parameters = cls._missing_parameters(parameters)
-            if len(missing_parameters) > 0:
-                intent_message = intentDescMap.get(intent)
-                # Check for specific intent
-                if intent == STORAGE_SYSTEM_METRIC and 'types' in missing_parameters:
-                    response = (
-                        "To proceed, I need the: %s like for e.g. cpu_utilization, usable_capacity, etc."
-                        % (", ".join(missing_parameters))
-                    )
-                else:
-                    response = (
-                        "%s. To proceed, I need the: %s"
-                        % (intent_message, ", ".join(missing_parameters))
-                    )
-                # Check for specific response condition
-                json_response = {STATUS: BAD_REQUEST, MESSAGE: response, IDENTIFIER: TEXT}
-                # Return JSON response with custom HTTP status code 400 (Bad Request)
-                raise HTTPException(status_code=400, detail=json_response)
+            # Step 1: Make sure all required parameters are collected and valid
+            cls._validate_parameters(parameters, intent)
 
             # Step 2: Generate API otken to make API call
             headers = cls._get_headers(base_url, parameters[TENANT_ID], api_key)
 
-            # Step 2: Check if the duration parameter stored in states is valid or not
-            if intent != STORAGE_SYSTEM_METRIC and DURATION in parameters:
-                parameters[DURATION] = cls._validate_duration_and_update(
-                    parameters[DURATION]
-                )
-            # Step 4: Make API request and validate the response
+            # Step 3: Make API request and validate the response
             response = cls._invoke_and_validate(base_url, parameters, headers, logger)
 
             return response  # No display to show
         except HTTPException as e:
             raise e
         except Exception:
-            error_msg = "Oops! Something went wrong on our side. Please try again in a moment."
+            raise cls._internal_error()
+
+    @classmethod
+    async def call_async(cls, base_url, parameters, api_key, intent, logger):
+        """
+        Method to call the api without blocking the event loop, the steps are the same as in call
+        :param base_url: base url of the storage insights apis
+        :param parameters: conversation state holding the parameters of the api
+        :param api_key: api key of the tenant
+        :param intent: intent serviced by the api
+        :return: validated response of the api
+        """
+        try:
+            cls._validate_parameters(parameters, intent)
+            headers = await cls._get_headers_async(
+                base_url, parameters[TENANT_ID], api_key
+            )
+            return await cls._invoke_and_validate_async(
+                base_url, parameters, headers, logger
+            )
+        except HTTPException as e:
+            raise e
+        except Exception:
+            raise cls._internal_error()
+
+    @classmethod
+    def _validate_parameters(cls, parameters, intent):
+        missing_parameters = cls._missing_parameters(parameters)
+        if len(missing_parameters) > 0:
+            intent_message = intentDescMap.get(intent)
+            # Check for specific intent
+            if intent == STORAGE_SYSTEM_METRIC and 'types' in missing_parameters:
+                response = (
+                    "To proceed, I need the: %s like for e.g. cpu_utilization, usable_capacity, etc."
+                    % (", ".join(missing_parameters))
+                )
+            else:
+                response = (
+                    "%s. To proceed, I need the: %s"
+                    % (intent_message, ", ".join(missing_parameters))
+                )
+            # Check for specific response condition
+            json_response = {STATUS: BAD_REQUEST, MESSAGE: response, IDENTIFIER: TEXT}
+            # Return JSON response with custom HTTP status code 400 (Bad Request)
+            raise HTTPException(status_code=400, detail=json_response)
+
+        # Check if the duration parameter stored in states is valid or not
+        if intent != STORAGE_SYSTEM_METRIC and DURATION in parameters:
+            parameters[DURATION] = cls._validate_duration_and_update(
+                parameters[DURATION]
+            )
+
+    @classmethod
+    def _internal_error(cls) -> HTTPException:
+        error_msg = "Oops! Something went wrong on our side. Please try again in a moment."
+        return HTTPException(
+            status_code=500,
+            detail=generate_error_response(
+                status_code=500, error_msg=error_msg, identifier=TEXT
+            ),
+        )
+
+    @classmethod
+    def _build_request(cls, base_url, parameters) -> tuple[str, dict]:
+        """
+        Method to build the request of the api from its parameters
+        :param base_url: base url of the storage insights apis
+        :param parameters: conversation state holding the parameters of the api
+        :return: tuple of the url and the query parameters
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def _invoke_and_validate(cls, base_url, parameters, headers, logger):
+        get_url, query_params = cls._build_request(base_url, parameters)
+        logger.info(f"Making the API call:{get_url}")
+        try:
+            response = cls._get(get_url, params=query_params, headers=headers)
+            return cls._validate_response(response)
+        except Exception as e:
+            logger.error(f"Unable to make the API call: {e}", e)
+            raise e
+
+    @classmethod
+    async def _invoke_and_validate_async(cls, base_url, parameters, headers, logger):
+        get_url, query_params = cls._build_request(base_url, parameters)
+        logger.info(f"Making the API call:{get_url}")
+        try:
+            response = await async_http_get(
+                get_url, params=query_params, headers=headers
+            )
+            return cls._validate_response(response)
+        except Exception as e:
+            logger.error(f"Unable to make the API call: {e}", e)
+            raise e
+
+    @classmethod
+    def _validate_response(cls, response):
+        """
+        Method to parse the response of the api, of requests or httpx, and raise the errors it reports
+        :param response: http response
+        :return: parsed response, or an empty string if the response has no content
+        """
+        # check if the response is empty or not
+        if response.content:
+            response_data = response.json()
+        else:
+            response_data = ""
+        # handling any errors thrown by external apis, ex. "Parameter duration value can't be greater then 30 days"
+        # so that UI can show the error message properly instead of 500 error. If "metadata" is present in
+        # response_data, that means an error has occurred
+        if METADATA in response_data:
+            error_msg = response_data[METADATA][MESSAGE]
             raise HTTPException(
-                status_code=500,
+                status_code=400,
                 detail=generate_error_response(
-                    status_code=500, error_msg=error_msg, identifier=TEXT
+                    status_code=400, error_msg=error_msg, identifier=TEXT
                 ),
             )
+        return response_data
 
     @classmethod
-    def _invoke_and_validate(cls, base_url, parameters, api_key, logger):
-        raise NotImplementedError
+    def _get(cls, url, **kwargs):
+        # every api shares the pooled keep-alive connections and the timeouts of the process wide session
+        return http_get(url, **kwargs)
+
+    @classmethod
+    def has_required_parameters(cls, parameters) -> bool:
+        """
+        Method to check whether the parameters hold every parameter required by the api
+        :param parameters: conversation state holding the parameters of the api
+        :return: True if no required parameter is missing
+        """
+        return not cls._missing_parameters(parameters)
 
     @classmethod
     def _missing_parameters(cls, parameters):
@@ -115,6 +218,17 @@ class API(object):
 
         return headers
 
+    @classmethod
+    async def _get_headers_async(cls, base_url, tenant_id, api_key) -> dict:
+        return {
+            X_API_TOKEN: await TokenGenerationService.generate_api_token_async(
+                base_url, tenant_id, api_key
+            ),
+            ACCEPT: APPLICATION_JSON,
+            X_INTEGRATION: STORAGE_INSIGHTS_CHATBOT,
+            X_INTEGRATION_VERSION: VERSION,
+        }
+
     @classmethod
     def _validate_duration_and_update(cls, duration: str):
         """
@@ -12,20 +12,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import requests
-from fastapi import HTTPException
-
 from backend.constants.constants import (
     TENANT_NOTIFICATIONS,
     SEVERITY,
     TENANT_ID,
     DURATION,
-    METADATA,
-    MESSAGE,
-    TEXT,
 )
 from backend.external_apis.Template import API
-from backend.utils.Helpers import generate_error_response
 
 
 class TenantNotifications(API):
@@ -36,7 +29,7 @@ class TenantNotifications(API):
     )
 
     @classmethod
-    def _invoke_and_validate(cls, base_url, parameters, headers, logger):
+    def _build_request(cls, base_url, parameters):
         get_url = f"{base_url}tenants/{parameters[TENANT_ID]}/notifications"
 
         query_params = {}
@@ -44,31 +37,7 @@ class TenantNotifications(API):
             query_params[SEVERITY] = parameters[SEVERITY]
         if DURATION in parameters:
             query_params[DURATION] = parameters[DURATION]
-
-        logger.info(f"Making the API call:{get_url}")
-        try:
-            response = requests.get(get_url, headers=headers, params=query_params)
-            # check if the response is empty or not
-            if response.content:
-                response_data = response.json()
-            else:
-                response_data = ""
-            # handling any errors thrown by external apis, ex. "Parameter duration value can't be greater then 30 days"
-            # so that UI can show the error message properly instead of 500 error. If "metadata" is present in
-            # response_data, that means an error has occurred
-            if METADATA in response_data:
-                error_msg = response_data[METADATA][MESSAGE]
-                raise HTTPException(
-                    status_code=400,
-                    detail=generate_error_response(
-                        status_code=400, error_msg=error_msg, identifier=TEXT
-                    ),
-                )
-        except Exception as e:
-            logger.error(f"Unable to parse the server response: {str(e)}", e)
-            raise e
-
-        return response_data
+        return get_url, query_params
 
     @classmethod
     def invoke(cls, parameters):
@@ -14,6 +14,8 @@
 
 import requests
 import time
+import httpx
+from backend.external_apis.HttpSession import async_http_post, http_post
 from backend.constants.constants import (
     X_API_KEY,
     ACCEPT,
@@ -32,35 +34,61 @@ class TokenGenerationService:
 
     @classmethod
     def generate_api_token(cls, base_url, tenant_id, api_key):
-        global cached_token
-        global token_expiry_time
         current_time = time.time()
+        token = cls._get_cached_token(tenant_id, current_time)
+        if token:
+            return token
 
+        token_url = f"{base_url}tenants/{tenant_id}/token"
+        try:
+            response = http_post(token_url, headers=cls._get_headers(api_key))
+            response.raise_for_status()
+            return cls._cache_token(tenant_id, response.json(), current_time)
+        except requests.exceptions.RequestException as e:
+            print(f"[ERROR] Unable to fetch X-API-Token: {e}", flush=True)
+            return None
+
+    @classmethod
+    async def generate_api_token_async(cls, base_url, tenant_id, api_key):
+        current_time = time.time()
+        token = cls._get_cached_token(tenant_id, current_time)
+        if token:
+            return token
+
+        token_url = f"{base_url}tenants/{tenant_id}/token"
+        try:
+            response = await async_http_post(token_url, headers=cls._get_headers(api_key))
+            response.raise_for_status()
+            return cls._cache_token(tenant_id, response.json(), current_time)
+        except httpx.HTTPError as e:
+            print(f"[ERROR] Unable to fetch X-API-Token: {e}", flush=True)
+            return None
+
+    @classmethod
+    def _get_cached_token(cls, tenant_id, current_time):
         if (
             tenant_id in cached_token
             and tenant_id in token_expiry_time
             and current_time < token_expiry_time[tenant_id]
         ):
             return cached_token[tenant_id]
+        return None
 
-        headers = {
+    @classmethod
+    def _get_headers(cls, api_key) -> dict:
+        return {
             X_API_KEY: api_key,
             ACCEPT: APPLICATION_JSON,
             X_INTEGRATION: STORAGE_INSIGHTS_CHATBOT,
             X_INTEGRATION_VERSION: VERSION
         }
 
-        token_url = f"{base_url}tenants/{tenant_id}/token"
-        try:
-            response = requests.post(token_url, headers=headers)
-            response.raise_for_status()
-            token_data = response.json().get("result")
-            new_token = token_data.get("token")
+    @classmethod
+    def _cache_token(cls, tenant_id, response_data, current_time):
+        token_data = response_data.get("result")
+        new_token = token_data.get("token")
 
-            token_expiry_time[tenant_id] = current_time + 720
+        token_expiry_time[tenant_id] = current_time + 720
 
-            cached_token[tenant_id] = new_token
-            return new_token
-        except requests.exceptions.RequestException as e:
-            print(f"[ERROR] Unable to fetch X-API-Token: {e}", flush=True)
-            return None
+        cached_token[tenant_id] = new_token
+        return new_token
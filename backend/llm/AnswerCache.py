@@ -0,0 +1,77 @@
+# Copyright 2024. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import json
+
+from backend.utils.LruCache import TtlLruCache
+
+
+def normalize_question(question) -> str:
+    """
+    Method to normalize a user query, so that queries differing only in case, whitespace or trailing punctuation
+    share an answer
+    :param question: user query
+    :return: normalized query
+    """
+    return " ".join(question.lower().split()).strip(" ?.!")
+
+
+def fingerprint_documents(documents) -> str:
+    """
+    Method to compute a stable hash of the preprocessed api response, independent of the order of the keys
+    :param documents: api response for the identified intent
+    :return: hex digest of the documents
+    """
+    serialized = json.dumps(documents, sort_keys=True, default=str)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    """
+    In-memory cache of generated answers, keyed by the normalized user query, the intent and a fingerprint of the
+    documents the answer was generated from. A change in the upstream documents changes the fingerprint, so stale
+    answers are never served. Entries expire after a time to live and the least recently used answers are evicted
+    beyond the memory bound.
+    """
+
+    def __init__(self, max_size, max_bytes, ttl_seconds):
+        """
+        :param max_size: maximum number of cached answers, 0 disables the cache
+        :param max_bytes: maximum total size of the cached answers
+        :param ttl_seconds: number of seconds after which an answer expires
+        """
+        self.cache = TtlLruCache(
+            max_size,
+            ttl_seconds,
+            max_bytes=max_bytes,
+            sizeof=lambda answer: len(answer.encode("utf-8")),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.cache.enabled
+
+    @staticmethod
+    def cache_key(question, intent, documents) -> tuple[str, str, str]:
+        return normalize_question(question), intent, fingerprint_documents(documents)
+
+    def get(self, key) -> str | None:
+        return self.cache.get(key)
+
+    def put(self, key, answer) -> None:
+        self.cache.put(key, answer)
+
+    def stats(self) -> dict:
+        return self.cache.stats()
@@ -0,0 +1,97 @@
+# Copyright 2024. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import threading
+
+
+class CommonIntentsResponsePool:
+    """
+    Pre-generated responses to the common intents, like greetings and thanking, served from memory in turn so that
+    consecutive turns get varied responses without an llm call. The responses can be refreshed offline through a json
+    file mapping intents to lists of responses, which replaces the built-in responses of the intents it lists and is
+    reloaded whenever it changes.
+    """
+
+    def __init__(self, responses, path=None):
+        """
+        :param responses: dict mapping intent to its built-in responses
+        :param path: location of the json file refreshing the responses, None to only use the built-in responses
+        """
+        self.builtin_responses = {intent: list(texts) for intent, texts in responses.items()}
+        self.responses = self.builtin_responses
+        self.path = path
+        self.served = 0
+        self._modified_time = None
+        self._next_index = {}
+        self._lock = threading.Lock()
+
+    def _reload_if_changed(self) -> None:
+        """
+        Method to load the responses file when it was created or modified since it was last read
+        """
+        try:
+            modified_time = os.stat(self.path).st_mtime
+        except OSError:
+            modified_time = None
+        if modified_time == self._modified_time:
+            return
+        responses = dict(self.builtin_responses)
+        if modified_time is not None:
+            try:
+                with open(self.path, encoding="utf-8") as responses_file:
+                    loaded_responses = json.load(responses_file)
+                for intent, texts in loaded_responses.items():
+                    if not isinstance(texts, list):
+                        print(
+                            f"Ignoring the common intent responses of {intent} in {self.path}, expected a list"
+                        )
+                        continue
+                    responses[intent] = [
+                        text for text in texts if isinstance(text, str) and text
+                    ]
+            except (OSError, ValueError, AttributeError) as e:
+                print(f"Unable to load common intent responses from {self.path}: {e}")
+                # the current responses are kept, and the file is only read again once it changes
+                with self._lock:
+                    self._modified_time = modified_time
+                return
+        with self._lock:
+            self.responses = responses
+            self._modified_time = modified_time
+
+    def get_response(self, intent) -> str | None:
+        """
+        Method to return the next response of an intent
+        :param intent: common intent, ex. GREETINGS
+        :return: response, or None if the pool has no response for the intent
+        """
+        if self.path:
+            self._reload_if_changed()
+        with self._lock:
+            texts = self.responses.get(intent)
+            if not texts:
+                return None
+            index = self._next_index.get(intent, 0) % len(texts)
+            self._next_index[intent] = index + 1
+            self.served += 1
+        return texts[index]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "served": self.served,
+                "responses": {intent: len(texts) for intent, texts in self.responses.items()},
+            }
@@ -0,0 +1,216 @@
+# Copyright 2024. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+# seconds to wait for a lock held by another uvicorn worker
+SQLITE_BUSY_TIMEOUT = 5
+# version of the schema, databases of older versions may hold generated responses and are cleared
+SCHEMA_VERSION = 1
+# share of the size bound the cache is evicted down to, so that eviction does not run on every insert
+EVICTION_TARGET_RATIO = 0.9
+# number of completions deleted per eviction statement
+EVICTION_BATCH_SIZE = 256
+# seconds within which further hits of a completion do not update its last access time
+LAST_ACCESS_RESOLUTION_SECONDS = 60
+
+
+class CompletionCache:
+    """
+    Disk backed cache of llm completions, shared by all uvicorn workers and kept across restarts. Entries are keyed by
+    model id, generation parameters and a hash of the rendered prompt. The total size of the completions is kept up to
+    date by triggers, and once it grows beyond the size bound the least recently used completions are evicted in
+    batches.
+    """
+
+    def __init__(self, db_path, max_bytes):
+        """
+        :param db_path: location of the sqlite database
+        :param max_bytes: size bound of the cached completions, 0 disables the cache
+        """
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self.enabled = max_bytes > 0 and self._initialize()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=SQLITE_BUSY_TIMEOUT)
+
+    def _initialize(self) -> bool:
+        """
+        Creates the completions table and the triggers keeping its total size if they do not already exist.
+        :return: True if the cache can be used, otherwise False
+        """
+        try:
+            with closing(self._connect()) as connection, connection:
+                # write ahead logging lets readers in other workers proceed while one worker writes
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.execute(
+                    """CREATE TABLE IF NOT EXISTS completions (
+                                    cache_key TEXT PRIMARY KEY,
+                                    model_id TEXT,
+                                    completion TEXT,
+                                    size INTEGER,
+                                    last_access REAL
+                                )"""
+                )
+                connection.execute(
+                    "CREATE INDEX IF NOT EXISTS completions_last_access ON completions (last_access)"
+                )
+                connection.execute(
+                    """CREATE TABLE IF NOT EXISTS completions_size (
+                                    id INTEGER PRIMARY KEY CHECK (id = 0),
+                                    total INTEGER NOT NULL
+                                )"""
+                )
+                connection.execute(
+                    """CREATE TRIGGER IF NOT EXISTS completions_insert AFTER INSERT ON completions BEGIN
+                                    UPDATE completions_size SET total = total + new.size;
+                                END"""
+                )
+                connection.execute(
+                    """CREATE TRIGGER IF NOT EXISTS completions_update AFTER UPDATE OF size ON completions BEGIN
+                                    UPDATE completions_size SET total = total + new.size - old.size;
+                                END"""
+                )
+                connection.execute(
+                    """CREATE TRIGGER IF NOT EXISTS completions_delete AFTER DELETE ON completions BEGIN
+                                    UPDATE completions_size SET total = total - old.size;
+                                END"""
+                )
+                (version,) = connection.execute("PRAGMA user_version").fetchone()
+                if version < SCHEMA_VERSION:
+                    connection.execute("DELETE FROM completions")
+                    connection.execute(
+                        "INSERT OR REPLACE INTO completions_size (id, total) VALUES (0, 0)"
+                    )
+                    connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            return True
+        except sqlite3.Error as e:
+            print(f"Unable to initialize llm completion cache at {self.db_path}, cache disabled: {e}")
+            return False
+
+    @staticmethod
+    def cache_key(model_id, params, prompt) -> str:
+        """
+        Method to build the cache key for a completion
+        :param model_id: id of the hosted model
+        :param params: generation parameters passed to the model
+        :param prompt: rendered prompt
+        :return: hex digest identifying the completion
+        """
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        key = json.dumps(
+            {"model_id": model_id, "params": params, "prompt": prompt_hash},
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def get(self, model_id, params, prompt) -> str | None:
+        """
+        Method to look up a cached completion
+        :return: cached completion, or None on a miss
+        """
+        if not self.enabled:
+            return None
+        key = self.cache_key(model_id, params, prompt)
+        try:
+            with closing(self._connect()) as connection, connection:
+                row = connection.execute(
+                    "SELECT completion, last_access FROM completions WHERE cache_key = ?",
+                    (key,),
+                ).fetchone()
+                now = time.time()
+                # the eviction order only needs a coarse access time, most hits are reads only
+                if row is not None and now - row[1] > LAST_ACCESS_RESOLUTION_SECONDS:
+                    connection.execute(
+                        "UPDATE completions SET last_access = ? WHERE cache_key = ?",
+                        (now, key),
+                    )
+        except sqlite3.Error as e:
+            print(f"Error reading llm completion cache: {e}")
+            row = None
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return row[0]
+
+    def put(self, model_id, params, prompt, completion) -> None:
+        """
+        Method to store a completion, and evict the least recently used completions once the size bound is exceeded
+        """
+        if not self.enabled:
+            return
+        key = self.cache_key(model_id, params, prompt)
+        size = len(key) + len(completion.encode("utf-8"))
+        try:
+            with closing(self._connect()) as connection, connection:
+                connection.execute(
+                    """INSERT INTO completions (cache_key, model_id, completion, size, last_access)
+                                  VALUES (?, ?, ?, ?, ?)
+                                  ON CONFLICT (cache_key) DO UPDATE SET
+                                    completion = excluded.completion,
+                                    size = excluded.size,
+                                    last_access = excluded.last_access""",
+                    (key, model_id, completion, size, time.time()),
+                )
+                (total,) = connection.execute(
+                    "SELECT total FROM completions_size"
+                ).fetchone()
+                if total > self.max_bytes:
+                    self._evict(connection, total)
+        except sqlite3.Error as e:
+            print(f"Error writing llm completion cache: {e}")
+
+    def _evict(self, connection, total) -> None:
+        """
+        Method to delete the least recently used completions until the cache is back under the eviction target
+        :param connection: connection holding the write transaction
+        :param total: current size of the cached completions
+        """
+        target = self.max_bytes * EVICTION_TARGET_RATIO
+        evicted = 0
+        while total > target:
+            deleted = connection.execute(
+                """DELETE FROM completions WHERE cache_key IN (
+                                SELECT cache_key FROM completions ORDER BY last_access LIMIT ?
+                            )""",
+                (EVICTION_BATCH_SIZE,),
+            ).rowcount
+            if not deleted:
+                break
+            evicted += deleted
+            (total,) = connection.execute("SELECT total FROM completions_size").fetchone()
+        with self._lock:
+            self.evictions += evicted
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "max_bytes": self.max_bytes,
+            }
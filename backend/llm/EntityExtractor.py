@@ -0,0 +1,220 @@
+# Copyright 2024. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import re
+
+from backend.constants.constants import (
+    VALID_UUID_REGEX,
+    VALID_DURATION_PATTERN,
+    VALID_SEVERITIES,
+    VALID_METRIC_TYPE,
+    INFORMATIONAL_ACK_VARIATIONS,
+    WARNING_ACK_VARIATIONS,
+    CRITICAL_ACK_VARIATIONS,
+    DAYS_VARIATION,
+    HOURS_VARIATION,
+    MINUTES_VARIATION,
+    STORAGE_SYSTEM_ID,
+    SEVERITY,
+    DURATION,
+    TYPES,
+    TENANT_ID,
+    ERROR,
+)
+from backend.llm.IntentCache import phrase_alternation
+
+ONES = ("one", "two", "three", "four", "five", "six", "seven", "eight", "nine")
+TENS = ("twenty", "thirty", "forty", "fifty", "sixty")
+NUMBER_WORDS = {
+    "a": 1,
+    "an": 1,
+    "one": 1,
+    "two": 2,
+    "three": 3,
+    "four": 4,
+    "five": 5,
+    "six": 6,
+    "seven": 7,
+    "eight": 8,
+    "nine": 9,
+    "ten": 10,
+    "eleven": 11,
+    "twelve": 12,
+    "thirteen": 13,
+    "fourteen": 14,
+    "fifteen": 15,
+    "sixteen": 16,
+    "seventeen": 17,
+    "eighteen": 18,
+    "nineteen": 19,
+    "twenty": 20,
+    "thirty": 30,
+    "forty": 40,
+    "fifty": 50,
+    "sixty": 60,
+    "couple of": 2,
+    "a couple of": 2,
+}
+# unit words mapped to the duration suffix and the number of units they represent
+DURATION_UNITS = {
+    **{word: ("d", 1) for word in DAYS_VARIATION},
+    **{word: ("h", 1) for word in HOURS_VARIATION},
+    **{word: ("m", 1) for word in MINUTES_VARIATION},
+    "minute": ("m", 1),
+    "weeks": ("d", 7),
+    "week": ("d", 7),
+    "months": ("d", 30),
+    "month": ("d", 30),
+}
+# the entity detection prompt does not tag error as a severity, e.g. "systems in error condition"
+ENTITY_SEVERITIES = [severity for severity in VALID_SEVERITIES if severity != ERROR]
+
+
+def _alternation(words):
+    return "|".join(re.escape(word) for word in sorted(words, key=len, reverse=True))
+
+
+_NUMBER_PATTERN = (
+    r"\d+|(?:" + _alternation(TENS) + r")[\s\-](?:" + _alternation(ONES) + r")|"
+    + _alternation(NUMBER_WORDS)
+)
+_UUID_PATTERN = re.compile(VALID_UUID_REGEX.strip("^$"), re.IGNORECASE)
+_COMPACT_DURATION_PATTERN = re.compile(VALID_DURATION_PATTERN, re.IGNORECASE)
+_SPOKEN_DURATION_PATTERN = re.compile(
+    r"\b(" + _NUMBER_PATTERN + r")\s*(" + _alternation(DURATION_UNITS) + r")\b"
+)
+_IMPLICIT_DURATION_PATTERN = re.compile(
+    r"\b(?:last|past|previous)\s+(" + _alternation(DURATION_UNITS) + r")\b"
+)
+# any mention of a time unit, used to detect durations which could not be resolved locally
+_TIME_MENTION_PATTERN = re.compile(
+    r"\b(?:"
+    + _alternation(tuple(DURATION_UNITS) + ("year", "years", "today", "yesterday"))
+    + r")\b"
+)
+_METRIC_PATTERN = re.compile(phrase_alternation(VALID_METRIC_TYPE))
+_SEVERITY_PATTERN = re.compile(
+    phrase_alternation(
+        ENTITY_SEVERITIES
+        + list(INFORMATIONAL_ACK_VARIATIONS)
+        + list(WARNING_ACK_VARIATIONS)
+        + list(CRITICAL_ACK_VARIATIONS)
+        + ["informational"]
+    )
+)
+_METRIC_LOOKUP = {
+    tuple(re.split(r"[_\-\s]+", metric)): metric for metric in VALID_METRIC_TYPE
+}
+
+
+def _to_number(words) -> int | None:
+    words = " ".join(words.split())
+    if words.isdigit():
+        return int(words)
+    if words in NUMBER_WORDS:
+        return NUMBER_WORDS[words]
+    tens, _, ones = words.replace("-", " ").partition(" ")
+    if tens in TENS and ones in ONES:
+        return NUMBER_WORDS[tens] + ONES.index(ones) + 1
+    return None
+
+
+def _normalize_severity(value) -> str:
+    words = re.split(r"[_\-\s]+", value)
+    if words[-1].startswith("acknowledge"):
+        level = VALID_SEVERITIES[2] if words[0].startswith("info") else words[0]
+        return f"{level}_acknowledged"
+    if words[0] == "informational":
+        return VALID_SEVERITIES[2]
+    return words[0]
+
+
+class EntityExtractor:
+    """
+    Deterministic entity extractor for storage system ids, durations, severities and metric types. It resolves the
+    well structured entities of a user utterance with compiled regular expressions, so that the entity llm is only
+    needed for free form entities like system names.
+    """
+
+    def extract(self, user_utterance) -> dict:
+        """
+        Method to extract entities from user utterance.
+        :param user_utterance: The input string from the user.
+        :return: dict containing the entities found, in the same format as the llm based extraction
+        """
+        entities = {}
+        utterance = user_utterance.lower()
+
+        uuid_match = _UUID_PATTERN.search(utterance)
+        if uuid_match:
+            entities[STORAGE_SYSTEM_ID] = uuid_match.group(0)
+
+        metric_match = _METRIC_PATTERN.search(utterance)
+        if metric_match:
+            entities[TYPES] = _METRIC_LOOKUP[
+                tuple(re.split(r"[_\-\s]+", metric_match.group(0)))
+            ]
+
+        severity_match = _SEVERITY_PATTERN.search(utterance)
+        if severity_match:
+            entities[SEVERITY] = _normalize_severity(severity_match.group(0))
+
+        duration = self._extract_duration(utterance)
+        if duration:
+            entities[DURATION] = duration
+
+        return entities
+
+    def _extract_duration(self, utterance) -> str | None:
+        # the uuid can contain tokens like 11ee which should not be read as durations
+        utterance = _UUID_PATTERN.sub(" ", utterance)
+        compact_match = _COMPACT_DURATION_PATTERN.search(utterance)
+        if compact_match:
+            return compact_match.group(0).lower()
+
+        spoken_match = _SPOKEN_DURATION_PATTERN.search(utterance)
+        if spoken_match:
+            number = _to_number(spoken_match.group(1))
+            if number:
+                suffix, multiplier = DURATION_UNITS[spoken_match.group(2)]
+                return f"{number * multiplier}{suffix}"
+
+        implicit_match = _IMPLICIT_DURATION_PATTERN.search(utterance)
+        if implicit_match:
+            suffix, multiplier = DURATION_UNITS[implicit_match.group(1)]
+            return f"{multiplier}{suffix}"
+        return None
+
+    def is_fully_resolved(self, user_utterance, entities, required_parameters) -> bool:
+        """
+        Method to check if the locally extracted entities are sufficient to service the intent, i.e. every required
+        parameter of the api was found and every mentioned time period was understood.
+        :param user_utterance: The input string from the user.
+        :param entities: locally extracted entities
+        :param required_parameters: parameters required by the api of the detected intent
+        :return: True if the entity llm call can be skipped
+        """
+        if required_parameters is None:
+            return False
+        if any(
+            parameter not in entities
+            for parameter in required_parameters
+            if parameter != TENANT_ID
+        ):
+            return False
+        if DURATION not in entities and _TIME_MENTION_PATTERN.search(
+            user_utterance.lower()
+        ):
+            return False
+        return True
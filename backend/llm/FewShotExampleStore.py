@@ -0,0 +1,105 @@
+# Copyright 2024. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+from langchain_core.prompts import PromptTemplate
+
+from backend.llm.IntentClassifier import FEATURE_DIMENSIONS, hash_features
+from backend.utils.LruCache import TtlLruCache
+
+EXAMPLES_MARKER = "Here are some examples, complete the last one:\n"
+# number of distinct example selections whose prompt templates are kept
+PROMPT_CACHE_SIZE = 256
+
+
+class FewShotExampleStore:
+    """
+    Store of the few-shot examples embedded in a prompt template, with a tf-idf index over hashed n-gram features of
+    the example sentences. Every request gets a prompt with only the k examples most similar to the user utterance.
+    The selected examples keep their order of the original template, so repeated selections render identical prompts
+    and the shared instructions stay a common prefix for prefix caching.
+    """
+
+    def __init__(self, template, query_block, k, input_variables):
+        """
+        :param template: prompt template with the examples between EXAMPLES_MARKER and the query block
+        :param query_block: start of the final block of the template holding the user utterance
+        :param k: number of examples selected per request
+        :param input_variables: input variables of the prompt template
+        """
+        self.k = k
+        self.input_variables = input_variables
+        header, marker, rest = template.partition(EXAMPLES_MARKER)
+        if not marker or query_block not in rest:
+            raise ValueError("Prompt template has no few-shot examples")
+        query_start = rest.rindex(query_block)
+        self.header = header + marker
+        self.footer = rest[query_start:]
+        self.examples = [
+            block.strip("\n")
+            for block in rest[:query_start].split("\n\n")
+            if block.strip()
+        ]
+        # the sentence of an example is the line after its heading, ex. "sentence:" or "Input Sentence:"
+        self.sentences = [block.splitlines()[1] for block in self.examples]
+        self._build_index()
+        self._prompts = TtlLruCache(PROMPT_CACHE_SIZE, 0)
+
+    def _build_index(self) -> None:
+        features = np.zeros((len(self.sentences), FEATURE_DIMENSIONS), dtype=np.float32)
+        for row, sentence in enumerate(self.sentences):
+            for bucket, value in hash_features(sentence).items():
+                features[row, bucket] = value
+        document_frequency = np.count_nonzero(features, axis=0)
+        self.idf = (
+            np.log((1 + len(self.sentences)) / (1 + document_frequency)) + 1
+        ).astype(np.float32)
+        features *= self.idf
+        norms = np.linalg.norm(features, axis=1, keepdims=True)
+        self.index = features / np.where(norms > 0, norms, 1)
+
+    def select(self, utterance) -> tuple[int, ...]:
+        """
+        Method to select the examples most similar to the utterance
+        :param utterance: The input string from the user.
+        :return: positions of the selected examples in the original template, in ascending order
+        """
+        if self.k >= len(self.examples):
+            return tuple(range(len(self.examples)))
+        query = np.zeros(FEATURE_DIMENSIONS, dtype=np.float32)
+        for bucket, value in hash_features(utterance).items():
+            query[bucket] = value
+        query *= self.idf
+        scores = self.index @ query
+        top_k = np.argpartition(-scores, self.k)[: self.k]
+        return tuple(sorted(int(position) for position in top_k))
+
+    def get_prompt(self, utterance) -> PromptTemplate:
+        """
+        Method to return the prompt template holding the examples most similar to the utterance
+        :param utterance: The input string from the user.
+        :return: prompt template with the selected examples
+        """
+        selection = self.select(utterance)
+        prompt = self._prompts.get(selection)
+        if prompt is None:
+            prompt = PromptTemplate(
+                template=self.header
+                + "\n\n".join(self.examples[position] for position in selection)
+                + "\n\n"
+                + self.footer,
+                input_variables=self.input_variables,
+            )
+            self._prompts.put(selection, prompt)
+        return prompt
@@ -12,27 +12,73 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import contextvars
 import json
 import os
-from typing import Any
+import threading
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    TimeoutError,
+    wait,
+)
+from typing import Any, Iterator
 
 from fastapi import HTTPException
-from ibm_watsonx_ai import Credentials
-from ibm_watsonx_ai.foundation_models import ModelInference
 from ibm_watsonx_ai.metanames import GenTextParamsMetaNames
-from langchain_ibm import WatsonxLLM
 
 from backend.constants.PromptConstants import LLAMA_INPUT_CONTEXT_LENGTH
 from backend.constants.constants import *
+from backend.external_apis import REGISTERED_APIS
+from backend.llm.AnswerCache import AnswerCache
+from backend.llm.CommonIntentsResponsePool import CommonIntentsResponsePool
+from backend.llm.CompletionCache import CompletionCache
+from backend.llm.EntityExtractor import EntityExtractor
+from backend.llm.IntentCache import IntentCache
+from backend.llm.IntentClassifier import get_intent_classifier
+from backend.llm.LlmClientRegistry import (
+    get_llm_backend,
+    get_model_inference,
+    get_watsonx_llm,
+)
+from backend.llm.PromptBatcher import PromptBatcher
+from backend.llm.Resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    LatencyWindow,
+    is_upstream_failure,
+)
+from backend.llm.ResponseModelRouter import ResponseModelRouter
+from backend.llm.TokenCounter import TokenCounter
+from backend.llm.TokenUsage import TokenUsage, get_usage_owner
 from backend.prompt import prompts
+from backend.prompt.prompts import (
+    chunk_response_generation_instructions,
+    compact_document_format_instructions,
+)
 from backend.prompt.CommonIntentsPromptManager import CommonIntentsPromptManager
 from backend.prompt.EntityDetectionPromptManager import EntityDetectionPromptManager
 from backend.prompt.IntentDetectionPromptManager import IntentDetectionPromptManager
+from backend.prompt.JointIntentEntityPromptManager import (
+    JointIntentEntityPromptManager,
+)
 from backend.prompt.ResponseGenerationPromptManager import (
     ResponseGenerationPromptManager,
 )
-from backend.utils.Helpers import Helpers
-from backend.utils.ResponseGenerationHelpers import get_instructions_for_intent
+from backend.utils.Helpers import Helpers, get_env_flag, get_env_number
+from backend.utils.Metrics import (
+    LLM_CALL_DURATION,
+    LLM_CALLS_IN_PROGRESS,
+    RESPONSE_ROUTING_DECISIONS,
+)
+from backend.utils.ResponseGenerationHelpers import (
+    get_instructions_for_intent,
+    compact_records,
+    render_compact_records,
+    split_compact_records,
+)
 
 intent_detection_parameters = {
     GenTextParamsMetaNames.DECODING_METHOD: GREEDY,
@@ -52,6 +98,15 @@ entity_extraction_parameters = {
     GenTextParamsMetaNames.RANDOM_SEED: 42,
 }
 
+joint_intent_entity_parameters = {
+    GenTextParamsMetaNames.DECODING_METHOD: GREEDY,
+    GenTextParamsMetaNames.MAX_NEW_TOKENS: FIFTEEN + HUNDRED,
+    GenTextParamsMetaNames.STOP_SEQUENCES: JOINT_INTENT_ENTITY_STOP_SEQUENCE,
+    GenTextParamsMetaNames.MIN_NEW_TOKENS: ONE,
+    GenTextParamsMetaNames.REPETITION_PENALTY: ONE,
+    GenTextParamsMetaNames.RANDOM_SEED: 42,
+}
+
 common_user_intents_parameters = {
     GenTextParamsMetaNames.DECODING_METHOD: GREEDY,
     GenTextParamsMetaNames.MAX_NEW_TOKENS: 100,
@@ -73,51 +128,266 @@ response_generation_parameters = {
 
 
 class HostedLlm:
+    # shared by all instances, used to run independent llm calls concurrently
+    executor = ThreadPoolExecutor(
+        max_workers=get_env_number(LLM_EXECUTOR_WORKERS, DEFAULT_LLM_EXECUTOR_WORKERS),
+        thread_name_prefix="hosted-llm",
+    )
+    # runs the llm calls, so that callers can stop waiting at the deadline of the stage
+    invoke_executor = ThreadPoolExecutor(
+        max_workers=get_env_number(LLM_INVOKE_WORKERS, DEFAULT_LLM_INVOKE_WORKERS),
+        thread_name_prefix="hosted-llm-invoke",
+    )
+    # process wide, so that every request fails fast during an upstream incident
+    circuit_breaker = CircuitBreaker(
+        get_env_number(
+            LLM_CIRCUIT_FAILURE_RATE, DEFAULT_LLM_CIRCUIT_FAILURE_RATE, cast=float
+        ),
+        get_env_number(LLM_CIRCUIT_WINDOW_SIZE, DEFAULT_LLM_CIRCUIT_WINDOW_SIZE),
+        get_env_number(LLM_CIRCUIT_MIN_CALLS, DEFAULT_LLM_CIRCUIT_MIN_CALLS),
+        get_env_number(
+            LLM_CIRCUIT_OPEN_SECONDS, DEFAULT_LLM_CIRCUIT_OPEN_SECONDS, cast=float
+        ),
+    )
+    stage_latencies = {
+        stage: LatencyWindow(
+            get_env_number(LLM_LATENCY_WINDOW_SIZE, DEFAULT_LLM_LATENCY_WINDOW_SIZE)
+        )
+        for stage in LLM_STAGES
+    }
+    hedged_requests = 0
+    _hedge_lock = threading.Lock()
 
     def __init__(self):
         """
         Constructor to load the intent detection and entity extraction models
         using IBM Watsonx hosted service.
         """
+        # Every llm below shares the process wide inference client of its model, only the parameters differ
         # Initialize Granite for Intent Detection
-        self.llm = WatsonxLLM(
-            model_id=GRANITE_34B_CODE_INSTRUCT,
-            url=os.getenv(WATSONX_HOSTED_SERVICE),
-            project_id=os.getenv(PROJECT_ID),
-            params=intent_detection_parameters,  # Initial parameters for intent detection
+        self.llm = get_watsonx_llm(
+            GRANITE_34B_CODE_INSTRUCT,
+            intent_detection_parameters,  # Initial parameters for intent detection
         )
         # Initialize Granite for Entity Detection
-        self.entity_llm = WatsonxLLM(
-            model_id=GRANITE_34B_CODE_INSTRUCT,
-            url=os.getenv(WATSONX_HOSTED_SERVICE),
-            project_id=os.getenv(PROJECT_ID),
-            params=entity_extraction_parameters,  # Initial parameters for entity detection
-        )
-        self.common_response_handler_llm = WatsonxLLM(
-            model_id=GRANITE_34B_CODE_INSTRUCT,
-            url=os.getenv(WATSONX_HOSTED_SERVICE),
-            project_id=os.getenv(PROJECT_ID),
-            params=common_user_intents_parameters,
-        )
-        self.response_llm = WatsonxLLM(
-            model_id=LLAMA_3_405B_INSTRUCT,
-            url=os.getenv(WATSONX_HOSTED_SERVICE),
-            project_id=os.getenv(PROJECT_ID),
-            params=response_generation_parameters,
-        )
-        self.response_llm_tokenizer = ModelInference(
-            model_id=LLAMA_3_405B_INSTRUCT,
-            credentials=Credentials(
-                api_key=os.getenv(WATSONX_APIKEY), url=os.getenv(WATSONX_HOSTED_SERVICE)
-            ),
-            project_id=os.getenv(PROJECT_ID),
+        self.entity_llm = get_watsonx_llm(
+            GRANITE_34B_CODE_INSTRUCT,
+            entity_extraction_parameters,  # Initial parameters for entity detection
+        )
+        # Initialize Granite for Intent and Entity Detection in a single call
+        self.joint_llm = get_watsonx_llm(
+            GRANITE_34B_CODE_INSTRUCT, joint_intent_entity_parameters
+        )
+        self.common_response_handler_llm = get_watsonx_llm(
+            GRANITE_34B_CODE_INSTRUCT, common_user_intents_parameters
         )
-        self.helper = Helpers()
+        self.response_llm = get_watsonx_llm(
+            LLAMA_3_405B_INSTRUCT, response_generation_parameters
+        )
+        self.response_llm_tokenizer = get_model_inference(LLAMA_3_405B_INSTRUCT)
+        # prompts of concurrent requests to granite are batched into multi-prompt generate calls
+        self.intent_batcher = self.entity_batcher = self.joint_batcher = None
+        if get_env_flag(LLM_MICRO_BATCHING, False):
+            granite_inference = get_model_inference(GRANITE_34B_CODE_INSTRUCT)
+            window_seconds = (
+                get_env_number(LLM_BATCH_WINDOW_MS, DEFAULT_LLM_BATCH_WINDOW_MS) / 1000
+            )
+            max_batch_size = get_env_number(
+                LLM_MAX_BATCH_SIZE, DEFAULT_LLM_MAX_BATCH_SIZE
+            )
+            self.intent_batcher = PromptBatcher(
+                granite_inference,
+                intent_detection_parameters,
+                window_seconds,
+                max_batch_size,
+                self.circuit_breaker,
+            )
+            self.entity_batcher = PromptBatcher(
+                granite_inference,
+                entity_extraction_parameters,
+                window_seconds,
+                max_batch_size,
+                self.circuit_breaker,
+            )
+            self.joint_batcher = PromptBatcher(
+                granite_inference,
+                joint_intent_entity_parameters,
+                window_seconds,
+                max_batch_size,
+                self.circuit_breaker,
+            )
+        self.helper = Helpers(REGISTERED_APIS)
         # Initialize the IntentDetectionPromptManager and EntityDetectionPromptManager
-        self.prompt_manager = IntentDetectionPromptManager()
-        self.entity_manager = EntityDetectionPromptManager()
+        # the prompts only carry the few-shot examples most similar to the user utterance
+        self.prompt_manager = IntentDetectionPromptManager(
+            get_env_number(INTENT_FEW_SHOT_EXAMPLES, DEFAULT_INTENT_FEW_SHOT_EXAMPLES)
+        )
+        self.entity_manager = EntityDetectionPromptManager(
+            get_env_number(ENTITY_FEW_SHOT_EXAMPLES, DEFAULT_ENTITY_FEW_SHOT_EXAMPLES)
+        )
         self.common_intents_manager = CommonIntentsPromptManager()
+        # greetings and thanking are answered from pre-generated responses unless llm responses are enabled
+        self.common_intents_llm_responses = get_env_flag(COMMON_INTENTS_LLM_RESPONSES, False)
+        self.common_intents_response_pool = CommonIntentsResponsePool(
+            prompts.common_intents_responses,
+            os.environ.get(COMMON_INTENTS_RESPONSES_PATH) or None,
+        )
+        self.joint_intent_entity_manager = JointIntentEntityPromptManager()
         self.response_generation_manager = ResponseGenerationPromptManager()
+        # start entity extraction together with intent detection
+        self.parallel_entity_extraction = get_env_flag(PARALLEL_ENTITY_EXTRACTION, True)
+        # detect the intent and the entities with a single llm call instead of two
+        self.joint_intent_entity_extraction = get_env_flag(
+            JOINT_INTENT_ENTITY_EXTRACTION, False
+        )
+        # intents of previously seen query shapes, keyed by the slot canonical form of the utterance
+        self.intent_cache = IntentCache(
+            get_env_number(INTENT_CACHE_MAX_SIZE, DEFAULT_INTENT_CACHE_MAX_SIZE),
+            get_env_number(INTENT_CACHE_TTL_SECONDS, DEFAULT_INTENT_CACHE_TTL_SECONDS),
+        )
+        # local classifier answering confidently classified utterances without the llm
+        self.intent_classifier = (
+            get_intent_classifier(
+                get_env_number(
+                    INTENT_CLASSIFIER_CONFIDENCE_THRESHOLD,
+                    DEFAULT_INTENT_CLASSIFIER_CONFIDENCE_THRESHOLD,
+                    cast=float,
+                )
+            )
+            if get_env_flag(LOCAL_INTENT_CLASSIFIER, True)
+            else None
+        )
+        # deterministic extraction of structured entities, the entity llm is skipped when it resolves the intent
+        self.entity_extractor = (
+            EntityExtractor() if get_env_flag(LOCAL_ENTITY_EXTRACTOR, True) else None
+        )
+        # local token count estimates for the response generation prompt
+        self.token_counter = TokenCounter(
+            get_env_number(
+                TOKEN_ESTIMATE_SAFETY_MARGIN,
+                DEFAULT_TOKEN_ESTIMATE_SAFETY_MARGIN,
+                cast=float,
+            )
+        )
+        # render the api response as a compact table trimmed to the token budget instead of the python repr
+        self.document_compaction = get_env_flag(DOCUMENT_COMPACTION, True)
+        self.document_token_budget = get_env_number(
+            DOCUMENT_TOKEN_BUDGET, DEFAULT_DOCUMENT_TOKEN_BUDGET
+        )
+        # api responses which do not fit in the context window are answered chunk by chunk and the answers combined
+        self.map_reduce_max_chunks = get_env_number(
+            MAP_REDUCE_MAX_CHUNKS, DEFAULT_MAP_REDUCE_MAX_CHUNKS
+        )
+        self.map_reduce_chunk_tokens = get_env_number(
+            MAP_REDUCE_CHUNK_TOKENS, DEFAULT_MAP_REDUCE_CHUNK_TOKENS
+        )
+        self.map_reduce_parallelism = get_env_number(
+            MAP_REDUCE_PARALLELISM, DEFAULT_MAP_REDUCE_PARALLELISM
+        )
+        self.map_reduce_chunk_timeout = get_env_number(
+            MAP_REDUCE_CHUNK_TIMEOUT_SECONDS,
+            DEFAULT_MAP_REDUCE_CHUNK_TIMEOUT_SECONDS,
+            cast=float,
+        )
+        self.map_reduce_timeout = get_env_number(
+            MAP_REDUCE_TIMEOUT_SECONDS, DEFAULT_MAP_REDUCE_TIMEOUT_SECONDS, cast=float
+        )
+        # answers to the same question over the same documents, shared by the users of a tenant
+        self.answer_cache = AnswerCache(
+            get_env_number(ANSWER_CACHE_MAX_SIZE, DEFAULT_ANSWER_CACHE_MAX_SIZE),
+            get_env_number(ANSWER_CACHE_MAX_BYTES, DEFAULT_ANSWER_CACHE_MAX_BYTES),
+            get_env_number(ANSWER_CACHE_TTL_SECONDS, DEFAULT_ANSWER_CACHE_TTL_SECONDS),
+        )
+        # deadline of every llm stage, in seconds
+        self.stage_timeouts = {
+            LLM_STAGE_INTENT: get_env_number(
+                LLM_INTENT_TIMEOUT_SECONDS, DEFAULT_LLM_INTENT_TIMEOUT_SECONDS, cast=float
+            ),
+            LLM_STAGE_ENTITY: get_env_number(
+                LLM_ENTITY_TIMEOUT_SECONDS, DEFAULT_LLM_ENTITY_TIMEOUT_SECONDS, cast=float
+            ),
+            LLM_STAGE_COMMON_INTENTS: get_env_number(
+                LLM_COMMON_INTENTS_TIMEOUT_SECONDS,
+                DEFAULT_LLM_COMMON_INTENTS_TIMEOUT_SECONDS,
+                cast=float,
+            ),
+            LLM_STAGE_RESPONSE: get_env_number(
+                LLM_RESPONSE_TIMEOUT_SECONDS, DEFAULT_LLM_RESPONSE_TIMEOUT_SECONDS, cast=float
+            ),
+        }
+        self.stage_timeouts[LLM_STAGE_JOINT] = self.stage_timeouts[LLM_STAGE_ENTITY]
+        # a duplicate request is sent when a short stage takes longer than its recent latency percentile
+        self.hedging = get_env_flag(LLM_HEDGING, False)
+        self.hedge_percentile = get_env_number(
+            LLM_HEDGE_PERCENTILE, DEFAULT_LLM_HEDGE_PERCENTILE, cast=float
+        )
+        self.hedge_min_samples = get_env_number(
+            LLM_HEDGE_MIN_SAMPLES, DEFAULT_LLM_HEDGE_MIN_SAMPLES
+        )
+        # completions of deterministic prompts, shared by all workers through sqlite
+        self.completion_cache = CompletionCache(
+            LLM_COMPLETION_CACHE_DB,
+            get_env_number(
+                LLM_COMPLETION_CACHE_MAX_BYTES, DEFAULT_LLM_COMPLETION_CACHE_MAX_BYTES
+            ),
+        )
+        # response generation model and max new tokens picked per prompt, None always uses the response llm
+        self.response_router = (
+            ResponseModelRouter(
+                LLAMA_3_405B_INSTRUCT,
+                os.getenv(RESPONSE_SMALL_MODEL_ID) or DEFAULT_RESPONSE_SMALL_MODEL_ID,
+                get_env_number(
+                    RESPONSE_SMALL_MODEL_MAX_PROMPT_TOKENS,
+                    DEFAULT_RESPONSE_SMALL_MODEL_MAX_PROMPT_TOKENS,
+                ),
+                [
+                    intent.strip()
+                    for intent in os.getenv(RESPONSE_LARGE_MODEL_INTENTS, "").split(",")
+                    if intent.strip()
+                ],
+                get_env_number(
+                    RESPONSE_LATENCY_SLO_SECONDS,
+                    DEFAULT_RESPONSE_LATENCY_SLO_SECONDS,
+                    cast=float,
+                ),
+                get_env_number(
+                    RESPONSE_ROUTING_MIN_SAMPLES, DEFAULT_RESPONSE_ROUTING_MIN_SAMPLES
+                ),
+                get_env_number(
+                    RESPONSE_ROUTING_PROBE_SECONDS,
+                    DEFAULT_RESPONSE_ROUTING_PROBE_SECONDS,
+                    cast=float,
+                ),
+                get_env_number(RESPONSE_MIN_NEW_TOKENS, DEFAULT_RESPONSE_MIN_NEW_TOKENS),
+                response_generation_parameters[GenTextParamsMetaNames.MAX_NEW_TOKENS],
+                get_env_number(
+                    RESPONSE_OUTPUT_TOKEN_RATIO,
+                    DEFAULT_RESPONSE_OUTPUT_TOKEN_RATIO,
+                    cast=float,
+                ),
+                get_env_number(LLM_LATENCY_WINDOW_SIZE, DEFAULT_LLM_LATENCY_WINDOW_SIZE),
+                TokenCounter.estimate,
+            )
+            if get_env_flag(RESPONSE_MODEL_ROUTING, False)
+            else None
+        )
+        self._routed_response_llms = {}
+        # tokens of every llm call per tenant and user, checked against the monthly token budgets
+        self.token_usage = TokenUsage(
+            TOKEN_USAGE_DB,
+            TokenCounter.estimate,
+            # flushes are written one at a time, apart from the llm calls
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix="token-usage"),
+            get_env_number(
+                TOKEN_USAGE_FLUSH_SECONDS, DEFAULT_TOKEN_USAGE_FLUSH_SECONDS, cast=float
+            ),
+            get_env_number(TENANT_TOKEN_BUDGET, DEFAULT_TENANT_TOKEN_BUDGET),
+            get_env_number(LLM_TOKEN_BUDGET, DEFAULT_LLM_TOKEN_BUDGET),
+            get_env_number(
+                TOKEN_BUDGET_SOFT_LIMIT, DEFAULT_TOKEN_BUDGET_SOFT_LIMIT, cast=float
+            ),
+            get_env_flag(TOKEN_USAGE_ACCOUNTING, True),
+        )
 
     def set_parameters(self, parameters):
         """
@@ -125,13 +395,145 @@ class HostedLlm:
         :param parameters: A dictionary of parameters to be set.
         """
         self.llm.params = parameters
-        
+
+    def _invoke(self, llm, input_prompt, stage, batcher=None) -> str:
+        """
+        Method to invoke the given hosted llm. Greedy decoding with a fixed seed is deterministic, so those completions
+        are served from, and stored in, the persistent completion cache, except for the generated responses which hold
+        tenant data. The cache is only used with the live backend, so that every call reaches the cassette when recording
+        and replays do not depend on the cache of the machine. Calls fail fast while the circuit breaker is open, and
+        raise a TimeoutError when the llm does not answer within the deadline of the stage.
+        :param llm: WatsonxLLM to invoke
+        :param input_prompt: rendered prompt
+        :param stage: llm stage of the call, ex. LLM_STAGE_INTENT
+        :param batcher: micro-batcher generating the prompt with the parameters of the llm, None to invoke it directly
+        :return: completion generated for the prompt
+        """
+        params = llm.params or {}
+        is_cacheable = (
+            stage in CACHED_LLM_STAGES
+            and params.get(GenTextParamsMetaNames.DECODING_METHOD) == GREEDY
+            and get_llm_backend() == LLM_BACKEND_LIVE
+        )
+        if is_cacheable:
+            response = self.completion_cache.get(llm.model_id, params, input_prompt)
+            if response is not None:
+                return response
+
+        if not self.circuit_breaker.allow():
+            raise CircuitOpenError(f"Circuit breaker is open, {stage} call rejected")
+        try:
+            with LLM_CALLS_IN_PROGRESS.track_in_progress(
+                stage=stage
+            ), LLM_CALL_DURATION.time(stage=stage):
+                response = self._call_with_deadline(
+                    stage,
+                    lambda: (
+                        batcher.generate(input_prompt)
+                        if batcher
+                        else llm.invoke(input_prompt)
+                    ),
+                )
+        except Exception as ex:
+            # the batcher records the outcome of a batch once for all of its callers
+            if batcher:
+                raise
+            # quota and other client errors of one caller must not open the circuit for everyone
+            if is_upstream_failure(ex):
+                self.circuit_breaker.record(False)
+            else:
+                self.circuit_breaker.release()
+            raise
+        if not batcher:
+            self.circuit_breaker.record(True)
+        self.token_usage.record(stage, input_prompt, response)
+        if is_cacheable and response:
+            self.completion_cache.put(llm.model_id, params, input_prompt, response)
+        return response
+
+    def _call_with_deadline(self, stage, call):
+        """
+        Method to run an llm call within the deadline of its stage. For hedged stages, a duplicate call is started once
+        the call takes longer than the recent latency percentile of the stage, and the first completion is used.
+        The deadline only bounds how long the caller waits: a call which misses it keeps its worker and its http request
+        until the request ends, which is at the latest the request timeout of the watsonx client (see
+        LlmClientRegistry.get_request_timeout).
+        :param stage: llm stage of the call
+        :param call: function making the llm call
+        :return: result of the call
+        """
+        start = time.monotonic()
+        timeout = self.stage_timeouts.get(stage) or None
+        hedge_delay = (
+            self.stage_latencies[stage].percentile(
+                self.hedge_percentile, self.hedge_min_samples
+            )
+            if self.hedging and stage in HEDGED_LLM_STAGES
+            else None
+        )
+        if timeout is None and hedge_delay is None:
+            result = call()
+            self.stage_latencies[stage].record(time.monotonic() - start)
+            return result
+
+        pending = {self.invoke_executor.submit(call)}
+        if hedge_delay is not None and (timeout is None or hedge_delay < timeout):
+            done, _ = wait(pending, timeout=hedge_delay)
+            if not done:
+                pending.add(self.invoke_executor.submit(call))
+                with self._hedge_lock:
+                    HostedLlm.hedged_requests += 1
+
+        error = None
+        while pending:
+            remaining = None if timeout is None else start + timeout - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                break
+            done, pending = wait(
+                pending, timeout=remaining, return_when=FIRST_COMPLETED
+            )
+            for future in done:
+                if future.exception() is None:
+                    for duplicate in pending:
+                        duplicate.cancel()
+                    self.stage_latencies[stage].record(time.monotonic() - start)
+                    return future.result()
+                error = future.exception()
+        if pending or error is None:
+            raise TimeoutError(f"{stage} did not complete within {timeout} seconds")
+        raise error
+
+    def get_llm_health_report(self) -> dict:
+        """
+        Method to report the llm backend, the state of the circuit breaker, the recent latencies of every stage, the
+        hedged requests and the response generation routing
+        :return: dict containing the backend, circuit breaker state, latency percentiles, hedged request count and
+        routing decisions
+        """
+        return {
+            "backend": get_llm_backend(),
+            "circuit_breaker": self.circuit_breaker.stats(),
+            "stage_latencies": {
+                stage: {
+                    "p50": latencies.percentile(50),
+                    "p95": latencies.percentile(95),
+                }
+                for stage, latencies in self.stage_latencies.items()
+            },
+            "hedged_requests": self.hedged_requests,
+            "response_routing": (
+                self.response_router.stats() if self.response_router else None
+            ),
+        }
+
     def handle_token_quota_error(self, ex):
         """
         Handles the token quota error and raises an HTTPException with a user-friendly message.
         :param ex: The original exception caught during the LLM invocation.
         """
-        # Check if the exception has a response
+        status_code = None
+        error_data = {}
+        # Check if the exception has a response, timeouts and calls rejected by the circuit breaker do not
         if hasattr(ex, 'response') and ex.response is not None:
             status_code = ex.response.status_code
             
@@ -142,7 +544,7 @@ class HostedLlm:
                 error_data = {}  # If JSON parsing fails, use an empty dict
 
         # Check for specific error code and status code
-        if status_code == 403 and error_data["errors"][0]["code"] == "token_quota_reached":
+        if status_code == 403 and error_data.get("errors", [{}])[0].get("code") == "token_quota_reached":
             message = (
                 f"You've used all your free tokens for this month's Watsonx API. "
                 f"Tokens will refresh next month. To continue using the service without interruption, you can upgrade your plan or purchase additional tokens. "
@@ -166,72 +568,412 @@ class HostedLlm:
         }
         raise HTTPException(status_code=503, detail=error_response)
 
+    def _get_intent_without_llm(self, user_utterance) -> str | None:
+        """
+        Method to resolve the intent from the intent cache or the local classifier.
+        :param user_utterance: The input string from the user.
+        :return: Intent of the user utterance, or None if the llm needs to be consulted.
+        """
+        # Queries with the same shape as a previous query skip the llm
+        cached_intent = self.intent_cache.get(user_utterance)
+        if cached_intent:
+            return cached_intent
+
+        # The llm is only consulted when the local classifier is not confident
+        if self.intent_classifier is not None:
+            return self.intent_classifier.classify(user_utterance)
+        return None
+
     def get_intent_of_utterance(self, user_utterance) -> str | None:
         """
         Method to detect intent from the given user utterance using Watsonx.
         :param user_utterance: The input string from the user.
         :return: Intent of the user utterance.
         """
-        try:
-            if not user_utterance:
-                return UNKNOWN
+        if not user_utterance:
+            return UNKNOWN
+
+        intent = self._get_intent_without_llm(user_utterance)
+        if intent:
+            return intent
+        return self._get_intent_from_llm(user_utterance)
 
+    def _get_intent_from_llm(self, user_utterance) -> str | None:
+        """
+        Method to detect intent from the given user utterance using Watsonx.
+        :param user_utterance: The input string from the user.
+        :return: Intent of the user utterance.
+        """
+        try:
             # Get the intent detection prompt template and format it
-            prompt_template = self.prompt_manager.get_intent_prompt()
+            prompt_template = self.prompt_manager.get_intent_prompt(user_utterance)
             input_prompt = prompt_template.format(
                 system_message=prompts.system_message, question=user_utterance
             )
 
             # Call the hosted LLM to get intent classification
-            response = self.llm.invoke(input_prompt)
+            response = self._invoke(
+                self.llm, input_prompt, LLM_STAGE_INTENT, self.intent_batcher
+            )
 
             # Parse and return the intent from the response
             if response:
-                return self.helper.parse_output(response)
+                intent = self.helper.parse_output(response)
+                if intent:
+                    self.intent_cache.put(user_utterance, intent)
+                return intent
             else:
                 return UNKNOWN
         except Exception as ex:
             print(f"Error encountered while trying to detecting intents. {str(ex)}")
             self.handle_token_quota_error(ex)
 
-    def extract_entities_from_utterance(self, user_utterance) -> dict:
+    def _stream(self, llm, input_prompt, usage_owner=None) -> Iterator[str]:
+        """
+        Method to stream the completion of the given hosted llm. Streamed responses hold tenant data, so they are
+        never kept in the persistent completion cache.
+        :param llm: WatsonxLLM to invoke
+        :param input_prompt: rendered prompt
+        :param usage_owner: (tenant id, username) the tokens are accounted to, the stream is consumed outside of the
+        request context
+        :return: iterator over the generated text chunks
+        """
+        if not self.circuit_breaker.allow():
+            raise CircuitOpenError("Circuit breaker is open, streaming call rejected")
+        chunks = []
+        # None while the outcome says nothing about the health of the llm
+        succeeded = None
+        try:
+            with LLM_CALLS_IN_PROGRESS.track_in_progress(
+                stage=LLM_STAGE_RESPONSE
+            ), LLM_CALL_DURATION.time(stage=LLM_STAGE_RESPONSE):
+                for chunk in llm.stream(input_prompt):
+                    chunks.append(chunk)
+                    yield chunk
+            succeeded = True
+        except Exception as ex:
+            if is_upstream_failure(ex):
+                succeeded = False
+            raise
+        finally:
+            # also reached with GeneratorExit when the client disconnects mid-stream, a trial call must always end
+            if succeeded is None:
+                self.circuit_breaker.release()
+            else:
+                self.circuit_breaker.record(succeeded)
+            # the tokens generated before a disconnect or an error are billed as well
+            if succeeded or chunks:
+                self.token_usage.record(
+                    LLM_STAGE_RESPONSE, input_prompt, "".join(chunks), usage_owner
+                )
+
+    def get_intent_detection_report(self) -> dict:
+        """
+        Method to report how intents were resolved, through the intent cache, locally or through the llm.
+        :return: dict containing intent cache counters, the local classifier report, the micro-batching counters and
+        the counters of the pre-generated common intent responses
+        """
+        return {
+            "intent_cache": self.intent_cache.stats(),
+            "local_classifier": (
+                self.intent_classifier.report() if self.intent_classifier else None
+            ),
+            "micro_batching": (
+                {
+                    "intent": self.intent_batcher.stats(),
+                    "entity": self.entity_batcher.stats(),
+                    "joint": self.joint_batcher.stats(),
+                }
+                if self.intent_batcher
+                else None
+            ),
+            "common_intents_responses": self.common_intents_response_pool.stats(),
+        }
+
+    def _is_token_budget_limited(self) -> bool:
+        """
+        Method to check whether the tenant of the current request reached the soft limit of its token budget, in
+        which case the api response is returned as is instead of being summarized by the llm
+        :return: True if response generation should be skipped
+        """
+        tenant_id, _ = get_usage_owner()
+        if self.token_usage.get_budget_state(tenant_id) == TOKEN_BUDGET_OK:
+            return False
+        print(f"Token budget soft limit reached for tenant {tenant_id}, response generation skipped")
+        return True
+
+    def check_token_budget(self, tenant_id) -> None:
+        """
+        Method to reject a request before any llm call when the token budget of the tenant, or of all tenants, is
+        exhausted for the month
+        :param tenant_id: tenant of the request
+        """
+        if self.token_usage.get_budget_state(tenant_id) == TOKEN_BUDGET_EXHAUSTED:
+            raise HTTPException(
+                status_code=403,
+                detail={
+                    STATUS: "Forbidden",
+                    MESSAGE: TOKEN_BUDGET_EXHAUSTED_MESSAGE,
+                    IDENTIFIER: MARKDOWN,
+                },
+            )
+
+    def get_token_usage_report(self, tenant_id, username=None, since_day=None) -> dict:
+        """
+        Method to report the tokens used by a tenant per user and llm stage
+        :param tenant_id: tenant to report
+        :param username: only report this user
+        :param since_day: first day of the report as YYYY-MM-DD, defaults to the start of the current month
+        :return: dict containing the period, the budgets and the usage rows
+        """
+        return self.token_usage.report(tenant_id, username, since_day)
+
+    def _get_routed_response_llm(self, intent, input_prompt):
+        """
+        Method to pick the llm answering a response generation prompt. Without a routing policy the response llm is
+        used, otherwise the model and the max new tokens are chosen by the policy and the decision is logged.
+        :param intent: intent for which the documents were fetched
+        :param input_prompt: rendered response generation prompt
+        :return: WatsonxLLM answering the prompt
+        """
+        if self.response_router is None:
+            return self.response_llm
+        decision = self.response_router.route(intent, input_prompt)
+        print(
+            f"Response generation routed to {decision.model_id} with {decision.max_new_tokens} max new tokens, "
+            f"intent {intent}, estimated prompt tokens {decision.prompt_tokens}, reason {decision.reason}"
+        )
+        RESPONSE_ROUTING_DECISIONS.inc(
+            model=decision.model_id, reason=decision.reason, intent=intent
+        )
+        key = (decision.model_id, decision.max_new_tokens)
+        llm = self._routed_response_llms.get(key)
+        if llm is None:
+            llm = self._routed_response_llms.setdefault(
+                key,
+                get_watsonx_llm(
+                    decision.model_id,
+                    {
+                        **response_generation_parameters,
+                        GenTextParamsMetaNames.MAX_NEW_TOKENS: decision.max_new_tokens,
+                    },
+                ),
+            )
+        return llm
+
+    def _record_response_latency(self, llm, start) -> None:
+        if self.response_router is not None:
+            self.response_router.record_latency(llm.model_id, time.monotonic() - start)
+
+    def get_cache_stats(self) -> dict:
+        """
+        Method to collect the counters of the caches used by the llm stages
+        :return: dict mapping cache name to its stats
+        """
+        return {
+            "intent": self.intent_cache.stats(),
+            "llm_completion": self.completion_cache.stats(),
+            "answer": self.answer_cache.stats(),
+        }
+
+    def detect_intent_and_prefetch_entities(
+        self, user_utterance
+    ) -> tuple[str | None, Future | None]:
+        """
+        Method to detect intent of the user utterance while entities are extracted concurrently. Entity extraction
+        does not depend on the detected intent, so when parallel entity extraction is enabled both llm calls are
+        started together. The entity extraction is cancelled, or its result discarded, for intents which are serviced
+        without entities. In joint mode, the intent and the entities are detected by a single llm call.
+        :param user_utterance: The input string from the user.
+        :return: Intent of the user utterance and a future holding the extracted entities. The future is None if the
+        entities were not prefetched.
+        """
+        if not user_utterance or not (
+            self.parallel_entity_extraction or self.joint_intent_entity_extraction
+        ):
+            return self.get_intent_of_utterance(user_utterance), None
+
+        # When the intent is resolved without the llm, entities are extracted afterwards knowing the intent, which
+        # lets the local entity extractor skip the entity llm
+        intent = self._get_intent_without_llm(user_utterance)
+        if intent:
+            return intent, None
+
+        if self.joint_intent_entity_extraction:
+            intent, entities = self._get_intent_and_entities_from_llm(user_utterance)
+            if entities is None or intent in NON_ENTITY_INTENTS:
+                return intent, None
+            entity_future = Future()
+            entity_future.set_result(entities)
+            return intent, entity_future
+
+        # the extraction runs in a copy of the request context, so that its tokens are accounted to the request
+        entity_future = self.executor.submit(
+            contextvars.copy_context().run,
+            self.extract_entities_from_utterance,
+            user_utterance,
+        )
+        try:
+            intent = self._get_intent_from_llm(user_utterance)
+        except Exception:
+            entity_future.cancel()
+            raise
+
+        if intent in NON_ENTITY_INTENTS:
+            entity_future.cancel()
+            return intent, None
+        return intent, entity_future
+
+    def get_prefetched_entities(self, entity_future, user_utterance) -> dict:
+        """
+        Method to collect the entities extracted concurrently with the intent. The wait is bounded by the deadline of
+        the entity stage, after which the extraction is cancelled and only the local entity extractor is used.
+        :param entity_future: future returned by detect_intent_and_prefetch_entities
+        :param user_utterance: The input string from the user.
+        :return: dict containing all the entities in the user utterance
+        """
+        try:
+            return entity_future.result(
+                timeout=self.stage_timeouts[LLM_STAGE_ENTITY] or None
+            )
+        except TimeoutError:
+            entity_future.cancel()
+            print("Entity extraction did not complete within its deadline, using the local entities")
+            return (
+                self.entity_extractor.extract(user_utterance)
+                if self.entity_extractor
+                else {}
+            )
+
+    def _get_intent_and_entities_from_llm(self, user_utterance) -> tuple[str | None, dict | None]:
+        """
+        Method to detect the intent and the entities of the user utterance with a single call to Watsonx.
+        :param user_utterance: The input string from the user.
+        :return: Intent of the user utterance and dict containing the entities, the entities are None if the tags in
+        the llm response could not be parsed.
+        """
+        try:
+            prompt_template = (
+                self.joint_intent_entity_manager.get_joint_intent_entity_prompt()
+            )
+            input_prompt = prompt_template.format(
+                system_message=prompts.system_message, question=user_utterance
+            )
+
+            # Call the hosted LLM to get the intent classification and the entities
+            response = self._invoke(
+                self.joint_llm, input_prompt, LLM_STAGE_JOINT, self.joint_batcher
+            )
+            if not response:
+                return UNKNOWN, None
+
+            # the response holds the label, followed by the tags
+            label, _, tags = response.partition(JOINT_TAGS_SEPARATOR)
+            intent = self.helper.parse_output(label)
+            if not intent:
+                return UNKNOWN, None
+            self.intent_cache.put(user_utterance, intent)
+
+            result = self.helper.LLMOutputToDict(tags) if tags.strip() else None
+            if result is None:
+                return intent, None
+            local_entities = (
+                self.entity_extractor.extract(user_utterance)
+                if self.entity_extractor
+                else {}
+            )
+            entities = (
+                self.helper.filter_entities_from_result(result, user_utterance)
+                if result
+                else {}
+            )
+            # entities resolved by the local extractor take precedence over the llm output
+            entities.update(local_entities)
+            return intent, entities
+        except Exception as ex:
+            print(
+                f"Error encountered while trying to detect intent and entities. {str(ex)}"
+            )
+            self.handle_token_quota_error(ex)
+
+    def extract_entities_from_utterance(self, user_utterance, intent=None) -> dict:
         """
-        Method to extract entities from user utterance using Watsonx.
+        Method to extract entities from user utterance using the local entity extractor and Watsonx. The llm is
+        skipped when the locally extracted entities contain every parameter required by the api of the intent.
         :param user_utterance: The input string from the user.
+        :param intent: Intent of the user utterance, None if it is not known yet.
         :return: dict containing all the entities in the user utterance or an empty dict if result is None.
         """
         try:
             entities = {}
 
             if user_utterance:
+                local_entities = (
+                    self.entity_extractor.extract(user_utterance)
+                    if self.entity_extractor
+                    else {}
+                )
+                if (
+                    self.entity_extractor
+                    and intent is not None
+                    and self.entity_extractor.is_fully_resolved(
+                        user_utterance,
+                        local_entities,
+                        self.helper.get_api_parameters(intent),
+                    )
+                ):
+                    return local_entities
 
                 # Get the entity detection prompt template and format it
-                prompt_template = self.entity_manager.get_entity_detection_prompt()
+                prompt_template = self.entity_manager.get_entity_detection_prompt(
+                    user_utterance
+                )
                 input_prompt = prompt_template.format(
                     system_message=prompts.system_message, question=user_utterance
                 )
 
                 # Call the hosted LLM to extract entities
-                response = self.entity_llm.invoke(input_prompt)
+                response = self._invoke(
+                    self.entity_llm, input_prompt, LLM_STAGE_ENTITY, self.entity_batcher
+                )
 
                 # Convert the response string into a dictionary
                 result = self.helper.LLMOutputToDict(response)
 
                 # Check if the result is None or dictionary is empty
                 if not result:
-                    return {}
+                    return local_entities
 
                 # Create the entities dictionary from the result
                 entities = self.helper.filter_entities_from_result(result, user_utterance)
+                # entities resolved by the local extractor take precedence over the llm output
+                entities.update(local_entities)
 
             return entities
         except Exception as ex:
             print(f"Error encountered while trying to extracting entities. {str(ex)}")
             self.handle_token_quota_error(ex)
         
+    def get_pre_generated_response(self, intent_detected, user_utterance) -> dict | None:
+        """
+        Method to pick the next pre-generated response of a common intent like thanking, greetings.
+        :param intent_detected: The intent detected.
+        :param user_utterance: The input string from the user.
+        :return: dict containing the response, or None if llm responses are enabled or the intent has no pre-generated
+        response.
+        """
+        if not user_utterance or self.common_intents_llm_responses:
+            return None
+        response = self.common_intents_response_pool.get_response(intent_detected)
+        if not response:
+            return None
+        return {f"{INTENT}": f"{intent_detected}", f"{DATA}": response}
+
     def common_intents_response_generator(self,intent_detected, user_utterance) -> dict:
         """
-        Method to handle response generation of common intents like thanking, greetings using llm.
+        Method to handle response generation of common intents like thanking, greetings. The response is picked from
+        the pre-generated responses of the intent, the llm is only called when llm responses are enabled or the intent
+        has no pre-generated response.
         :param intent_detected: The intent detected.
         :param user_utterance: The input string from the user.
         :return: dict containing the response based on user intent or an empty dict if no valid response is generated.
@@ -239,6 +981,11 @@ class HostedLlm:
         try:
             # Initialize response dictionary
             final_response = {}
+            pre_generated_response = self.get_pre_generated_response(
+                intent_detected, user_utterance
+            )
+            if pre_generated_response is not None:
+                return pre_generated_response
             if user_utterance:
                 prompt = self.common_intents_manager.get_common_intent_handler_prompt()
                 input_prompt = prompt.format(
@@ -246,7 +993,11 @@ class HostedLlm:
                     question=user_utterance
                 )
                 # Call the LLM to generate response for general user intent
-                response = self.common_response_handler_llm.invoke(input_prompt)
+                response = self._invoke(
+                    self.common_response_handler_llm,
+                    input_prompt,
+                    LLM_STAGE_COMMON_INTENTS,
+                )
                 if response:
                     response = response.strip()
                     # Update the response with the specific format
@@ -268,6 +1019,250 @@ class HostedLlm:
             print(f"Error encountered while trying to generate common intents message using llm. {str(ex)}")
             self.handle_token_quota_error(ex)
 
+    def _get_response_generation_prompt(
+        self, question, intent, documents, allow_trimming=True
+    ) -> str | None:
+        """
+        Method to render the response generation prompt for the given documents
+        :param question: user query
+        :param intent: intent for which the document were fetched
+        :param documents: api response for the identified intent
+        :param allow_trimming: whether the compacted documents may be trimmed to the records fitting in the prompt
+        :return: rendered prompt, or None if the prompt does not fit in the context window of the llm
+        """
+        prompt_template = (
+            self.response_generation_manager.get_response_generation_prompt()
+        )
+        instructions = get_instructions_for_intent(intent)
+        # calculate the number of tokens in input prompt, if the tokens are more than size of context window,
+        # do not pass the input prompt to the llm and return the documents directly to be shown as table.
+        # The count is estimated locally, the template and instructions are counted once and cached. The remote
+        # tokenizer is only called when the estimate is too close to the context window to decide.
+        compacted = compact_records(documents) if self.document_compaction else None
+        # the format of the documents is only explained when they are rendered as compact records
+        document_format_instructions = (
+            compact_document_format_instructions if compacted is not None else ""
+        )
+        fixed_tokens = (
+            self.token_counter.estimate_static(prompt_template.template)
+            + self.token_counter.estimate_static(document_format_instructions)
+            + self.token_counter.estimate_static(instructions)
+            + self.token_counter.estimate(question)
+        )
+        if compacted is not None:
+            documents, included_rows = render_compact_records(
+                *compacted,
+                self._get_document_token_budget(fixed_tokens),
+                self.token_counter.estimate,
+            )
+            if included_rows < len(compacted[2]) and not allow_trimming:
+                return None
+        input_prompt = prompt_template.format(
+            question=question,
+            documents=documents,
+            document_format_instructions=document_format_instructions,
+            intent_specific_instructions=instructions,
+        )
+        estimated_tokens = fixed_tokens + self.token_counter.estimate(str(documents))
+        fits_in_context = self.token_counter.fits(
+            estimated_tokens, LLAMA_INPUT_CONTEXT_LENGTH
+        )
+        if fits_in_context is None:
+            tokenized_response = self.response_llm_tokenizer.tokenize(
+                prompt=input_prompt, return_tokens=False
+            )
+            token_count = tokenized_response["result"]["token_count"]
+            self.token_counter.calibrate(estimated_tokens, token_count)
+            fits_in_context = token_count <= LLAMA_INPUT_CONTEXT_LENGTH
+        return input_prompt if fits_in_context else None
+
+    def _get_document_token_budget(self, fixed_tokens) -> int:
+        """
+        Method to compute the number of tokens left for the documents in the response generation prompt
+        :param fixed_tokens: estimated tokens of the template, instructions and question
+        :return: token budget of the documents
+        """
+        budget = self.token_counter.budget(LLAMA_INPUT_CONTEXT_LENGTH) - fixed_tokens
+        if self.document_token_budget > 0:
+            budget = min(budget, self.document_token_budget)
+        return max(budget, 0)
+
+    def _get_answer_prompt(self, question, intent, documents) -> str | None:
+        """
+        Method to render the prompt answering the user query. Documents which do not fit in the context window are
+        summarized chunk by chunk and the returned prompt combines the partial answers. When there are more chunks than
+        allowed, the documents are trimmed to the records which fit in the context window instead.
+        :param question: user query
+        :param intent: intent for which the document were fetched
+        :param documents: api response for the identified intent
+        :return: rendered prompt, or None if the documents can not be answered by the llm
+        """
+        if self.map_reduce_max_chunks > 0:
+            input_prompt = self._get_response_generation_prompt(
+                question, intent, documents, allow_trimming=False
+            )
+            if input_prompt is None:
+                input_prompt = self._get_map_reduce_prompt(question, intent, documents)
+                # the map rounds may have used up the token budget of the tenant
+                if input_prompt is None and self._is_token_budget_limited():
+                    return None
+            if input_prompt is not None:
+                return input_prompt
+        return self._get_response_generation_prompt(question, intent, documents)
+
+    def _get_map_reduce_prompt(self, question, intent, documents) -> str | None:
+        """
+        Method to answer the user query for every chunk of the documents concurrently, and render the prompt combining
+        the partial answers. The map and reduce rounds share a deadline of map_reduce_timeout seconds.
+        :param question: user query
+        :param intent: intent for which the document were fetched
+        :param documents: api response for the identified intent
+        :return: rendered reduce prompt, or None if the documents can not be chunked within the limits
+        """
+        compacted = compact_records(documents)
+        if compacted is None:
+            return None
+        chunks = split_compact_records(
+            *compacted, self.map_reduce_chunk_tokens, self.token_counter.estimate
+        )
+        if len(chunks) > self.map_reduce_max_chunks:
+            print(
+                f"Map reduce skipped, {len(chunks)} chunks exceed the limit of {self.map_reduce_max_chunks}"
+            )
+            return None
+
+        deadline = time.monotonic() + self.map_reduce_timeout
+        prompt_template = (
+            self.response_generation_manager.get_response_generation_prompt()
+        )
+        instructions = get_instructions_for_intent(intent)
+        partial_answers = self._generate_concurrently(
+            [
+                prompt_template.format(
+                    question=question,
+                    documents=chunk,
+                    document_format_instructions=compact_document_format_instructions,
+                    intent_specific_instructions=f"{instructions}\n"
+                    + chunk_response_generation_instructions.format(
+                        part=part, parts=len(chunks)
+                    ),
+                )
+                for part, chunk in enumerate(chunks, start=1)
+            ],
+            deadline,
+        )
+        return self._reduce_partial_answers(
+            question, instructions, partial_answers, deadline
+        )
+
+    def _reduce_partial_answers(
+        self, question, instructions, partial_answers, deadline
+    ) -> str | None:
+        """
+        Method to render the prompt combining the partial answers of the chunks. When they do not fit in the context
+        window together, they are combined in groups which fit in a chunk and the answers of the groups are combined
+        again, until a single prompt fits.
+        :param question: user query
+        :param instructions: intent specific instructions
+        :param partial_answers: answers of the chunks, in document order
+        :param deadline: time.monotonic() value by which the reduce rounds must be done
+        :return: rendered reduce prompt, or None if no partial answer is left
+        """
+        reduce_template = self.response_generation_manager.get_response_reduce_prompt()
+
+        def render(answers):
+            return reduce_template.format(
+                question=question,
+                partial_answers="\n\n".join(
+                    f"Partial answer {number}:\n{answer}"
+                    for number, answer in enumerate(answers, start=1)
+                ),
+                intent_specific_instructions=instructions,
+            )
+
+        while partial_answers:
+            input_prompt = render(partial_answers)
+            if len(partial_answers) == 1 or self.token_counter.fits(
+                self.token_counter.estimate(input_prompt), LLAMA_INPUT_CONTEXT_LENGTH
+            ):
+                return input_prompt
+            # every group combines at least two answers, so each round shrinks the number of answers
+            groups = [[]]
+            for answer in partial_answers:
+                group = groups[-1]
+                if len(group) >= 2 and self.token_counter.estimate(
+                    render(group + [answer])
+                ) > self.map_reduce_chunk_tokens:
+                    groups.append([answer])
+                else:
+                    group.append(answer)
+            print(f"Combining {len(partial_answers)} partial answers in {len(groups)} groups")
+            partial_answers = self._generate_concurrently(
+                [render(group) for group in groups], deadline
+            )
+        return None
+
+    def _generate_concurrently(self, prompts, deadline) -> list[str]:
+        """
+        Method to generate the completions of the response llm for several prompts, in waves of map_reduce_parallelism
+        prompts. Every wave is given map_reduce_chunk_timeout seconds, prompts which fail or time out are left out. No
+        wave is started past the deadline or once the tenant reached the soft limit of its token budget.
+        :param prompts: rendered prompts
+        :param deadline: time.monotonic() value after which no wave is started or waited for
+        :return: completions of the prompts which succeeded, in the order of the prompts
+        """
+        completions = []
+        error = None
+        for wave_start in range(0, len(prompts), self.map_reduce_parallelism):
+            if time.monotonic() >= deadline:
+                print(
+                    f"Map reduce deadline reached, {len(prompts) - wave_start} of {len(prompts)} parts skipped"
+                )
+                break
+            if self._is_token_budget_limited():
+                break
+            wave = prompts[wave_start : wave_start + self.map_reduce_parallelism]
+            # a new executor per wave, so that calls which timed out do not hold up the next wave
+            executor = ThreadPoolExecutor(
+                max_workers=len(wave), thread_name_prefix="map-reduce"
+            )
+            try:
+                futures = [
+                    executor.submit(
+                        contextvars.copy_context().run,
+                        self._invoke,
+                        self.response_llm,
+                        prompt,
+                        LLM_STAGE_RESPONSE,
+                    )
+                    for prompt in wave
+                ]
+                wave_deadline = min(
+                    time.monotonic() + self.map_reduce_chunk_timeout, deadline
+                )
+                for index, future in enumerate(futures, start=wave_start + 1):
+                    try:
+                        completions.append(
+                            future.result(
+                                timeout=max(wave_deadline - time.monotonic(), 0)
+                            ).strip()
+                        )
+                    except TimeoutError:
+                        print(f"Summarization of part {index} of {len(prompts)} timed out")
+                    except Exception as ex:
+                        print(
+                            f"Error encountered while summarizing part {index} of {len(prompts)}. {str(ex)}"
+                        )
+                        error = ex
+            finally:
+                # calls which timed out end with the request timeout of the watsonx client
+                executor.shutdown(wait=False)
+
+        # surface upstream errors like an exhausted token quota
+        if not completions and error is not None:
+            raise error
+        return completions
+
     def extract_answers_from_documents(
         self, question, intent, documents
     ) -> tuple[Any, bool] | tuple[str, bool]:
@@ -279,24 +1274,86 @@ class HostedLlm:
         :return: String containing the answer to the user query
         """
         try:
-            prompt_template = (
-                self.response_generation_manager.get_response_generation_prompt()
-            )
-            instructions = get_instructions_for_intent(intent)
-            input_prompt = prompt_template.format(
-                question=question,
-                documents=documents,
-                intent_specific_instructions=instructions,
-            )
-            # calculate the number of tokens in input prompt, if the tokens are more than size of context window,
-            # do not pass the input prompt to the llm and return the documents directly to be shown as table.
-            tokenized_response = self.response_llm_tokenizer.tokenize(
-                prompt=input_prompt, return_tokens=True
-            )
-            if tokenized_response["result"]["token_count"] > LLAMA_INPUT_CONTEXT_LENGTH:
+            cache_key = self.answer_cache.cache_key(question, intent, documents)
+            response = self.answer_cache.get(cache_key)
+            if response is not None:
+                return response, True
+            if self._is_token_budget_limited():
+                return documents, False
+            input_prompt = self._get_answer_prompt(question, intent, documents)
+            if input_prompt is None:
                 return documents, False
-            response = self.response_llm.invoke(input_prompt)
-            return response.strip(), True
+            llm = self._get_routed_response_llm(intent, input_prompt)
+            start = time.monotonic()
+            response = self._invoke(llm, input_prompt, LLM_STAGE_RESPONSE).strip()
+            self._record_response_latency(llm, start)
+            if response:
+                self.answer_cache.put(cache_key, response)
+            return response, True
         except Exception as ex:
             print(f"Error encountered while trying to generate response. {str(ex)}")
             self.handle_token_quota_error(ex)
+
+    def stream_answers_from_documents(
+        self, question, intent, documents
+    ) -> tuple[Any, bool] | tuple[Iterator[str], bool]:
+        """
+        Method to stream the answer to the user query as it is generated by the llm
+        :param question: user query
+        :param intent: intent for which the document were fetched
+        :param documents: api response for the identified intent
+        :return: iterator over the generated text chunks and True, or the documents and False if the prompt does not
+        fit in the context window
+        """
+        try:
+            cache_key = self.answer_cache.cache_key(question, intent, documents)
+            response = self.answer_cache.get(cache_key)
+            if response is not None:
+                return iter([response]), True
+            if self._is_token_budget_limited():
+                return documents, False
+            input_prompt = self._get_answer_prompt(question, intent, documents)
+            if input_prompt is None:
+                return documents, False
+            llm = self._get_routed_response_llm(intent, input_prompt)
+            return (
+                self._stream_answer(llm, input_prompt, cache_key, get_usage_owner()),
+                True,
+            )
+        except Exception as ex:
+            print(f"Error encountered while trying to generate response. {str(ex)}")
+            self.handle_token_quota_error(ex)
+
+    def _stream_answer(self, llm, input_prompt, cache_key, usage_owner) -> Iterator[str]:
+        # the stream is consumed after stream_answers_from_documents returns, so errors are handled while iterating
+        try:
+            chunks = []
+            start = time.monotonic()
+            for chunk in self._stream(llm, input_prompt, usage_owner):
+                chunks.append(chunk)
+                yield chunk
+            self._record_response_latency(llm, start)
+            response = "".join(chunks).strip()
+            if response:
+                self.answer_cache.put(cache_key, response)
+        except Exception as ex:
+            print(f"Error encountered while trying to stream response. {str(ex)}")
+            self.handle_token_quota_error(ex)
+
+
+_hosted_llm = None
+_hosted_llm_lock = threading.Lock()
+
+
+def get_hosted_llm() -> HostedLlm:
+    """
+    Method to return the process wide HostedLlm, created on first use. The llm clients, prompt managers, caches and
+    the local classifier are shared by every request.
+    :return: shared HostedLlm
+    """
+    global _hosted_llm
+    if _hosted_llm is None:
+        with _hosted_llm_lock:
+            if _hosted_llm is None:
+                _hosted_llm = HostedLlm()
+    return _hosted_llm
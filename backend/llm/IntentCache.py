@@ -0,0 +1,91 @@
+# Copyright 2024. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import re
+
+from backend.constants.constants import (
+    VALID_UUID_REGEX,
+    VALID_DURATION_PATTERN,
+    VALID_SEVERITIES,
+    VALID_METRIC_TYPE,
+    DAYS_VARIATION,
+    HOURS_VARIATION,
+    MINUTES_VARIATION,
+)
+from backend.utils.LruCache import TtlLruCache
+
+# slot tokens used in the canonical form of an utterance
+UUID_SLOT = "<uuid>"
+DURATION_SLOT = "<duration>"
+SEVERITY_SLOT = "<severity>"
+METRIC_SLOT = "<metric>"
+
+
+def phrase_alternation(phrases):
+    """
+    Build a regex alternation where the words of every phrase may be separated by spaces, underscores or hyphens.
+    Longer phrases are tried first so that e.g. info_acknowledged wins over info.
+    """
+    patterns = []
+    for phrase in sorted(set(phrases), key=len, reverse=True):
+        words = re.split(r"[_\-\s]+", phrase)
+        patterns.append(r"[\s_\-]+".join(re.escape(word) for word in words))
+    return r"\b(?:" + "|".join(patterns) + r")\b"
+
+
+_UUID_PATTERN = re.compile(VALID_UUID_REGEX.strip("^$"), re.IGNORECASE)
+_METRIC_PATTERN = re.compile(phrase_alternation(VALID_METRIC_TYPE))
+_SEVERITY_PATTERN = re.compile(phrase_alternation(VALID_SEVERITIES))
+_DURATION_PATTERN = re.compile(
+    VALID_DURATION_PATTERN
+    + r"|\b\d+\s*(?:"
+    + "|".join(DAYS_VARIATION + HOURS_VARIATION + MINUTES_VARIATION)
+    + r")\b",
+    re.IGNORECASE,
+)
+
+
+def canonicalize_utterance(utterance: str) -> str:
+    """
+    Method to convert a user utterance to its canonical form. The utterance is lowercased and uuids, metric types,
+    severities and durations are replaced by slot tokens, so that queries of the same shape share a canonical form.
+    ex. "Show critical alerts for 4c7dcde0-e386-11ee-b2e1-cfddfe51829e for last 10d" ->
+        "show <severity> alerts for <uuid> for last <duration>"
+    :param utterance: The input string from the user.
+    :return: canonical form of the utterance
+    """
+    canonical = " ".join(utterance.lower().split())
+    canonical = _UUID_PATTERN.sub(UUID_SLOT, canonical)
+    canonical = _METRIC_PATTERN.sub(METRIC_SLOT, canonical)
+    canonical = _SEVERITY_PATTERN.sub(SEVERITY_SLOT, canonical)
+    canonical = _DURATION_PATTERN.sub(DURATION_SLOT, canonical)
+    return canonical.strip(" ?.!")
+
+
+class IntentCache:
+    """
+    LRU cache with a time to live, mapping the canonical form of an utterance to its detected intent.
+    """
+
+    def __init__(self, max_size, ttl_seconds):
+        self.cache = TtlLruCache(max_size, ttl_seconds)
+
+    def get(self, utterance) -> str | None:
+        return self.cache.get(canonicalize_utterance(utterance))
+
+    def put(self, utterance, intent) -> None:
+        self.cache.put(canonicalize_utterance(utterance), intent)
+
+    def stats(self) -> dict:
+        return self.cache.stats()
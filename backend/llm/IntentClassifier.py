@@ -0,0 +1,208 @@
+# Copyright 2024. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import re
+import threading
+import zlib
+from functools import lru_cache
+
+import numpy as np
+
+from backend.constants.constants import GREETINGS, THANKING
+from backend.llm.IntentCache import canonicalize_utterance
+from backend.prompt import prompts
+
+# number of hashed feature buckets
+FEATURE_DIMENSIONS = 4096
+TRAINING_EPOCHS = 300
+LEARNING_RATE = 10.0
+L2_PENALTY = 1e-4
+
+# short greetings and thanks, which are the most frequent utterances but are missing from the few-shot prompts
+COMMON_INTENT_EXAMPLES = [
+    (sentence, GREETINGS)
+    for sentence in (
+        "hi",
+        "hello",
+        "hey",
+        "hi there",
+        "hello there",
+        "hey there",
+        "good afternoon",
+        "howdy",
+        "hi chatbot",
+        "hello, how are you?",
+    )
+] + [
+    (sentence, THANKING)
+    for sentence in (
+        "thanks",
+        "thank you",
+        "thank you so much",
+        "thx",
+        "cheers",
+        "bye",
+        "goodbye",
+        "see you later",
+        "thanks for your help",
+        "that's all, thanks",
+    )
+]
+
+_TOKEN_PATTERN = re.compile(r"<\w+>|[a-z0-9]+")
+
+
+def get_labelled_examples() -> list[tuple[str, str]]:
+    """
+    Method to collect the labelled examples embedded in the few-shot prompts. The intent template provides
+    sentence/label pairs and the common intents template provides greetings and thanking examples, completed by the
+    short common intent examples.
+    :return: list of (sentence, label) tuples
+    """
+    examples = re.findall(
+        r"sentence:\n(.*?)\nlabel:\n\[(.*?)\]", prompts.intent_template
+    )
+    examples += [
+        (sentence, label)
+        for label, sentence in re.findall(
+            r"Intent:\s*(\w+)\s*\nUser Input:\s*(.*?)\s*\n",
+            prompts.common_intents_template,
+        )
+    ]
+    examples = [(sentence.strip(), label.strip()) for sentence, label in examples]
+    return examples + COMMON_INTENT_EXAMPLES
+
+
+def hash_features(utterance) -> dict:
+    """
+    Method to convert an utterance into hashed word unigram, word bigram and character trigram features
+    :param utterance: The input string from the user.
+    :return: dict mapping feature bucket to l2 normalised weight
+    """
+    tokens = _TOKEN_PATTERN.findall(canonicalize_utterance(utterance))
+    grams = [f"w:{token}" for token in tokens]
+    grams += [f"b:{first} {second}" for first, second in zip(tokens, tokens[1:])]
+    for token in tokens:
+        padded = f" {token} "
+        grams += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+
+    features = {}
+    for gram in grams:
+        bucket = zlib.crc32(gram.encode("utf-8")) % FEATURE_DIMENSIONS
+        features[bucket] = features.get(bucket, 0.0) + 1.0
+    norm = sum(value * value for value in features.values()) ** 0.5
+    if norm:
+        features = {bucket: value / norm for bucket, value in features.items()}
+    return features
+
+
+class IntentClassifier:
+    """
+    Local intent classifier, a softmax regression over hashed n-gram features, trained on the labelled examples of the
+    intent detection prompt. The classifier runs on CPU in microseconds, so the llm is only consulted when the
+    classifier is not confident about the intent.
+    """
+
+    def __init__(self, confidence_threshold, examples=None):
+        """
+        :param confidence_threshold: minimum probability for a local prediction to be accepted
+        :param examples: labelled (sentence, label) tuples, defaults to the examples of the prompt templates
+        """
+        self.confidence_threshold = confidence_threshold
+        self.local_count = 0
+        self.llm_count = 0
+        self._lock = threading.Lock()
+        self._train(examples if examples is not None else get_labelled_examples())
+
+    def _train(self, examples) -> None:
+        self.labels = sorted({label for _, label in examples})
+        label_index = {label: i for i, label in enumerate(self.labels)}
+
+        features = np.zeros((len(examples), FEATURE_DIMENSIONS), dtype=np.float32)
+        targets = np.zeros((len(examples), len(self.labels)), dtype=np.float32)
+        for row, (sentence, label) in enumerate(examples):
+            for bucket, value in hash_features(sentence).items():
+                features[row, bucket] = value
+            targets[row, label_index[label]] = 1.0
+
+        # full batch gradient descent on the cross entropy loss
+        self.weights = np.zeros((FEATURE_DIMENSIONS, len(self.labels)), dtype=np.float32)
+        self.bias = np.zeros(len(self.labels), dtype=np.float32)
+        for _ in range(TRAINING_EPOCHS):
+            probabilities = self._softmax(features @ self.weights + self.bias)
+            error = (probabilities - targets) / len(examples)
+            self.weights -= LEARNING_RATE * (
+                features.T @ error + L2_PENALTY * self.weights
+            )
+            self.bias -= LEARNING_RATE * error.sum(axis=0)
+
+    @staticmethod
+    def _softmax(scores):
+        scores = scores - scores.max(axis=-1, keepdims=True)
+        exp_scores = np.exp(scores)
+        return exp_scores / exp_scores.sum(axis=-1, keepdims=True)
+
+    def predict(self, utterance) -> tuple[str, float]:
+        """
+        Method to predict the intent of an utterance
+        :param utterance: The input string from the user.
+        :return: most probable intent and its probability
+        """
+        features = hash_features(utterance)
+        buckets = np.fromiter(features.keys(), dtype=np.intp, count=len(features))
+        values = np.fromiter(features.values(), dtype=np.float32, count=len(features))
+        scores = self.bias + values @ self.weights[buckets]
+        probabilities = self._softmax(scores)
+        best = int(probabilities.argmax())
+        return self.labels[best], float(probabilities[best])
+
+    def classify(self, utterance) -> str | None:
+        """
+        Method to classify an utterance locally and record whether the llm is needed
+        :param utterance: The input string from the user.
+        :return: predicted intent, or None if the confidence is below the threshold
+        """
+        intent, confidence = self.predict(utterance)
+        is_confident = confidence >= self.confidence_threshold
+        with self._lock:
+            if is_confident:
+                self.local_count += 1
+            else:
+                self.llm_count += 1
+        return intent if is_confident else None
+
+    def report(self) -> dict:
+        """
+        Method to report the share of classified utterances resolved locally versus through the llm
+        :return: dict with counts and shares
+        """
+        with self._lock:
+            total = self.local_count + self.llm_count
+            return {
+                "confidence_threshold": self.confidence_threshold,
+                "resolved_locally": self.local_count,
+                "resolved_by_llm": self.llm_count,
+                "local_share": self.local_count / total if total else 0.0,
+                "llm_share": self.llm_count / total if total else 0.0,
+            }
+
+
+@lru_cache(maxsize=None)
+def get_intent_classifier(confidence_threshold) -> IntentClassifier:
+    """
+    Method to return the process wide intent classifier, trained once on first use
+    :param confidence_threshold: minimum probability for a local prediction to be accepted
+    :return: trained intent classifier
+    """
+    return IntentClassifier(confidence_threshold)
@@ -0,0 +1,417 @@
+# Copyright 2024. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import math
+import random
+import re
+import threading
+import time
+
+from backend.constants.PromptConstants import (
+    END_HEADER_ID,
+    END_OF_TURN,
+    START_HEADER_ID,
+    USER,
+)
+from backend.constants.constants import (
+    GREETINGS,
+    JOINT_TAGS_SEPARATOR,
+    LLM_STAGE_COMMON_INTENTS,
+    LLM_STAGE_ENTITY,
+    LLM_STAGE_INTENT,
+    LLM_STAGE_JOINT,
+    LLM_STAGE_RESPONSE,
+    THANKING,
+    THANKING_RESPONSE_MESSAGE,
+    UNKNOWN,
+)
+from backend.llm.CompletionCache import CompletionCache
+from backend.llm.EntityExtractor import EntityExtractor
+from backend.llm.IntentClassifier import get_intent_classifier
+from backend.llm.TokenCounter import TokenCounter
+from backend.prompt import prompts
+
+# chunks of a replayed stream, a word with the whitespace following it
+_STREAM_CHUNK_PATTERN = re.compile(r"\S+\s*|\s+")
+# user input of every prompt, the prompts end with their query block
+_INTENT_QUERY_PATTERN = re.compile(r"sentence:\n(.*)\nlabel:\s*$", re.DOTALL)
+_ENTITY_QUERY_PATTERN = re.compile(r"Input Sentence:\n(.*)\nTags:\s*$", re.DOTALL)
+_COMMON_INTENTS_QUERY_PATTERN = re.compile(r"User Input: (.*)\n<\|assistant\|>\s*$")
+_RESPONSE_QUERY_PATTERN = re.compile(
+    re.escape(f"{START_HEADER_ID}{USER}{END_HEADER_ID}")
+    + r"(.*?)"
+    + re.escape(END_OF_TURN),
+    re.DOTALL,
+)
+
+
+class LatencyModel:
+    """
+    Synthetic latency of the offline backends. The distribution is described by a spec like "fixed:200",
+    "uniform:100,400", "normal:300,50" or "lognormal:300,0.4" with durations in milliseconds (the lognormal takes the
+    median and the sigma), "none" for no latency, or "recorded" to replay the latencies saved in the cassette. Samples
+    are drawn from a seeded generator, so that a benchmark run can be repeated.
+    """
+
+    def __init__(self, spec, seed):
+        """
+        :param spec: latency distribution
+        :param seed: seed of the random generator
+        """
+        self.spec = spec
+        self.distribution, _, arguments = spec.strip().lower().partition(":")
+        self.arguments = [float(argument) for argument in arguments.split(",") if argument]
+        if self.distribution not in ("none", "recorded", "fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"Unknown latency distribution {spec}")
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self, recorded_latencies=None) -> float:
+        """
+        Method to draw the latency of a call
+        :param recorded_latencies: latencies of the call saved in the cassette, in seconds
+        :return: latency in seconds
+        """
+        with self._lock:
+            if self.distribution == "recorded":
+                return self._random.choice(recorded_latencies) if recorded_latencies else 0.0
+            if self.distribution == "fixed":
+                milliseconds = self.arguments[0]
+            elif self.distribution == "uniform":
+                milliseconds = self._random.uniform(*self.arguments[:2])
+            elif self.distribution == "normal":
+                milliseconds = self._random.gauss(*self.arguments[:2])
+            elif self.distribution == "lognormal":
+                milliseconds = self._random.lognormvariate(
+                    math.log(self.arguments[0]), self.arguments[1]
+                )
+            else:
+                milliseconds = 0.0
+        return max(milliseconds, 0.0) / 1000
+
+
+def get_latency_models(spec, seed) -> dict:
+    """
+    Method to parse the synthetic latency configuration. The configuration is either a single spec applied to every
+    model, or a json object mapping model ids to specs, with a "default" entry for the other models.
+    :param spec: latency configuration
+    :param seed: seed of the random generators
+    :return: dict mapping model id, or "default", to its latency model
+    """
+    specs = json.loads(spec) if spec.strip().startswith("{") else {"default": spec}
+    specs.setdefault("default", "none")
+    return {model_id: LatencyModel(model_spec, seed) for model_id, model_spec in specs.items()}
+
+
+class Cassette:
+    """
+    Prompts and completions of the hosted llms saved as json lines, one line per call. Calls are identified by model
+    id, generation parameters and prompt, the same key as the completion cache. A call recorded several times is
+    replayed with the first completion, the latencies of every recording are kept to sample from.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: location of the cassette file, created on the first recording
+        """
+        self.path = path
+        self.recordings = {}
+        self._lock = threading.Lock()
+        try:
+            with open(path, encoding="utf-8") as cassette_file:
+                for line in cassette_file:
+                    if line.strip():
+                        self._add(json.loads(line))
+        except FileNotFoundError:
+            pass
+        print(f"Loaded {len(self.recordings)} llm recordings from {path}")
+
+    def _add(self, recording) -> None:
+        key = CompletionCache.cache_key(
+            recording["model_id"], recording["params"], recording["prompt"]
+        )
+        self.recordings.setdefault(key, []).append(recording)
+
+    def get(self, model_id, params, prompt) -> list:
+        """
+        Method to look up the recordings of a call
+        :return: list of recordings, empty if the call was never recorded
+        """
+        return self.recordings.get(CompletionCache.cache_key(model_id, params, prompt), [])
+
+    def record(self, model_id, params, prompt, completion, latency, first_chunk_latency=None) -> None:
+        """
+        Method to save a call to the cassette
+        :param model_id: id of the hosted model
+        :param params: generation parameters passed to the model
+        :param prompt: rendered prompt
+        :param completion: generated text
+        :param latency: duration of the call, in seconds
+        :param first_chunk_latency: time until the first chunk of a streamed call, in seconds
+        """
+        recording = {
+            "model_id": model_id,
+            "params": params,
+            "prompt": prompt,
+            "completion": completion,
+            "latency": latency,
+            "first_chunk_latency": first_chunk_latency,
+        }
+        line = json.dumps(recording, default=str)
+        with self._lock:
+            self._add(json.loads(line))
+            try:
+                with open(self.path, "a", encoding="utf-8") as cassette_file:
+                    cassette_file.write(line + "\n")
+            except OSError as e:
+                print(f"Unable to save llm recording to {self.path}: {e}")
+
+
+class RecordingLlm:
+    """
+    Hosted llm which saves every call to the cassette. Behaves as the wrapped WatsonxLLM.
+    """
+
+    def __init__(self, llm, cassette):
+        self._llm = llm
+        self._cassette = cassette
+
+    @property
+    def model_id(self):
+        return self._llm.model_id
+
+    @property
+    def params(self):
+        return self._llm.params
+
+    @params.setter
+    def params(self, params):
+        self._llm.params = params
+
+    def invoke(self, prompt) -> str:
+        params = self.params
+        start = time.monotonic()
+        completion = self._llm.invoke(prompt)
+        self._cassette.record(
+            self.model_id, params, prompt, completion, time.monotonic() - start
+        )
+        return completion
+
+    def stream(self, prompt):
+        params = self.params
+        start = time.monotonic()
+        first_chunk_latency = None
+        chunks = []
+        for chunk in self._llm.stream(prompt):
+            if first_chunk_latency is None:
+                first_chunk_latency = time.monotonic() - start
+            chunks.append(chunk)
+            yield chunk
+        self._cassette.record(
+            self.model_id,
+            params,
+            prompt,
+            "".join(chunks),
+            time.monotonic() - start,
+            first_chunk_latency,
+        )
+
+
+class RecordingModelInference:
+    """
+    Inference client which saves every generated prompt to the cassette. Behaves as the wrapped ModelInference.
+    """
+
+    def __init__(self, model_inference, cassette):
+        self._model_inference = model_inference
+        self._cassette = cassette
+
+    def __getattr__(self, name):
+        return getattr(self._model_inference, name)
+
+    def generate_text(self, prompt, params=None, **kwargs):
+        start = time.monotonic()
+        completions = self._model_inference.generate_text(
+            prompt=prompt, params=params, **kwargs
+        )
+        latency = time.monotonic() - start
+        if isinstance(prompt, list):
+            for single_prompt, completion in zip(prompt, completions):
+                self._cassette.record(
+                    self.model_id, params, single_prompt, completion, latency
+                )
+        else:
+            self._cassette.record(self.model_id, params, prompt, completions, latency)
+        return completions
+
+
+class ReplayBackend:
+    """
+    Offline backend serving the completions saved in the cassette
+    """
+
+    def __init__(self, cassette):
+        self.cassette = cassette
+
+    def complete(self, model_id, params, prompt) -> tuple[str, list, list]:
+        """
+        Method to look up the completion of a call
+        :return: completion, recorded latencies and recorded first chunk latencies
+        """
+        recordings = self.cassette.get(model_id, params, prompt)
+        if not recordings:
+            raise LookupError(
+                f"No recording of this {model_id} call in {self.cassette.path}, record it first"
+            )
+        return (
+            recordings[0]["completion"],
+            [recording["latency"] for recording in recordings],
+            [
+                recording["first_chunk_latency"]
+                for recording in recordings
+                if recording.get("first_chunk_latency") is not None
+            ],
+        )
+
+
+class StubBackend:
+    """
+    Offline backend answering with local rules. The user input is taken from the query block of the prompt, and
+    answered by the first configured rule whose pattern matches it. Without a matching rule, intents are predicted by
+    the local intent classifier, entities by the local entity extractor and responses are placeholders.
+    """
+
+    def __init__(self, rules=None):
+        """
+        :param rules: list of {"pattern": regex, "completion": text, "stage": optional llm stage} dicts
+        """
+        self.rules = [
+            (re.compile(rule["pattern"], re.IGNORECASE), rule["completion"], rule.get("stage"))
+            for rule in rules or []
+        ]
+        self.intent_classifier = get_intent_classifier(0.0)
+        self.entity_extractor = EntityExtractor()
+
+    @staticmethod
+    def get_stage_and_query(prompt) -> tuple[str, str]:
+        """
+        Method to find the llm stage of a prompt and the user input it holds
+        :param prompt: rendered prompt
+        :return: llm stage and user input
+        """
+        match = _INTENT_QUERY_PATTERN.search(prompt)
+        if match:
+            stage = LLM_STAGE_JOINT if JOINT_TAGS_SEPARATOR in prompt else LLM_STAGE_INTENT
+            return stage, match.group(1).rsplit("sentence:\n", 1)[-1].strip()
+        match = _ENTITY_QUERY_PATTERN.search(prompt)
+        if match:
+            return LLM_STAGE_ENTITY, match.group(1).rsplit("Input Sentence:\n", 1)[-1].strip()
+        match = _COMMON_INTENTS_QUERY_PATTERN.search(prompt)
+        if match:
+            return LLM_STAGE_COMMON_INTENTS, match.group(1).strip()
+        match = _RESPONSE_QUERY_PATTERN.search(prompt)
+        return LLM_STAGE_RESPONSE, match.group(1).strip() if match else ""
+
+    def _get_default_completion(self, stage, query) -> str:
+        if stage in (LLM_STAGE_INTENT, LLM_STAGE_JOINT, LLM_STAGE_COMMON_INTENTS):
+            intent, _ = self.intent_classifier.predict(query)
+        if stage in (LLM_STAGE_INTENT, LLM_STAGE_JOINT):
+            if stage == LLM_STAGE_INTENT:
+                return f"[{intent}]"
+            tags = json.dumps(self.entity_extractor.extract(query))
+            return f"[{intent}]\n{JOINT_TAGS_SEPARATOR}\n{tags}"
+        if stage == LLM_STAGE_ENTITY:
+            return json.dumps(self.entity_extractor.extract(query))
+        if stage == LLM_STAGE_COMMON_INTENTS:
+            if intent == GREETINGS:
+                return prompts.chatbot_system_message
+            if intent == THANKING:
+                return THANKING_RESPONSE_MESSAGE
+            return f"[{UNKNOWN}]"
+        return f"### Stubbed answer\nThis answer to *{query}* was generated offline."
+
+    def complete(self, model_id, params, prompt) -> tuple[str, list, list]:
+        """
+        Method to answer a call with the rules
+        :return: completion, recorded latencies and recorded first chunk latencies, which are always empty
+        """
+        stage, query = self.get_stage_and_query(prompt)
+        for pattern, completion, rule_stage in self.rules:
+            if rule_stage in (None, stage) and pattern.search(query):
+                return completion, [], []
+        return self._get_default_completion(stage, query), [], []
+
+
+class OfflineLlm:
+    """
+    Hosted llm answered by an offline backend, with a synthetic latency. Replaces WatsonxLLM.
+    """
+
+    def __init__(self, model_id, params, backend, latency_model):
+        self.model_id = model_id
+        self.params = params
+        self.backend = backend
+        self.latency_model = latency_model
+
+    def invoke(self, prompt) -> str:
+        completion, latencies, _ = self.backend.complete(self.model_id, self.params, prompt)
+        time.sleep(self.latency_model.sample(latencies))
+        return completion
+
+    def stream(self, prompt):
+        completion, latencies, first_chunk_latencies = self.backend.complete(
+            self.model_id, self.params, prompt
+        )
+        latency = self.latency_model.sample(latencies)
+        chunks = _STREAM_CHUNK_PATTERN.findall(completion) or [completion]
+        # the recorded time to first chunk is kept, the rest of the latency is spread evenly over the chunks
+        first_chunk_latency = min(
+            self.latency_model.sample(first_chunk_latencies)
+            if first_chunk_latencies
+            else latency / len(chunks),
+            latency,
+        )
+        time.sleep(first_chunk_latency)
+        yield chunks[0]
+        chunk_latency = (latency - first_chunk_latency) / max(len(chunks) - 1, 1)
+        for chunk in chunks[1:]:
+            time.sleep(chunk_latency)
+            yield chunk
+
+
+class OfflineModelInference:
+    """
+    Inference client answered by an offline backend, with a synthetic latency. Replaces ModelInference for the calls
+    made by the chatbot, tokenize counts tokens with the local estimate.
+    """
+
+    def __init__(self, model_id, backend, latency_model):
+        self.model_id = model_id
+        self.backend = backend
+        self.latency_model = latency_model
+
+    def tokenize(self, prompt, return_tokens=False) -> dict:
+        return {"result": {"token_count": TokenCounter.estimate(prompt)}}
+
+    def generate_text(self, prompt, params=None, **kwargs):
+        prompts_to_generate = prompt if isinstance(prompt, list) else [prompt]
+        results = [
+            self.backend.complete(self.model_id, params, single_prompt)
+            for single_prompt in prompts_to_generate
+        ]
+        # the prompts of a batch are generated concurrently, the batch takes as long as the slowest prompt
+        time.sleep(max(self.latency_model.sample(latencies) for _, latencies, _ in results))
+        completions = [completion for completion, _, _ in results]
+        return completions if isinstance(prompt, list) else completions[0]
@@ -0,0 +1,247 @@
+# Copyright 2024. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import threading
+from functools import lru_cache
+
+import httpx
+from ibm_watsonx_ai import APIClient, Credentials
+from ibm_watsonx_ai.foundation_models import ModelInference
+from langchain_ibm import WatsonxLLM
+
+from backend.constants.constants import (
+    WATSONX_APIKEY,
+    WATSONX_HOSTED_SERVICE,
+    PROJECT_ID,
+    LLM_BACKEND,
+    LLM_CASSETTE_PATH,
+    LLM_REPLAY_LATENCY,
+    LLM_REPLAY_SEED,
+    LLM_STUB_RULES_PATH,
+    DEFAULT_LLM_BACKEND,
+    DEFAULT_LLM_CASSETTE_PATH,
+    DEFAULT_LLM_REPLAY_LATENCY,
+    DEFAULT_LLM_REPLAY_SEED,
+    LLM_BACKEND_LIVE,
+    LLM_BACKEND_RECORD,
+    LLM_BACKEND_REPLAY,
+    LLM_BACKEND_STUB,
+    LLM_INTENT_TIMEOUT_SECONDS,
+    LLM_ENTITY_TIMEOUT_SECONDS,
+    LLM_COMMON_INTENTS_TIMEOUT_SECONDS,
+    LLM_RESPONSE_TIMEOUT_SECONDS,
+    DEFAULT_LLM_INTENT_TIMEOUT_SECONDS,
+    DEFAULT_LLM_ENTITY_TIMEOUT_SECONDS,
+    DEFAULT_LLM_COMMON_INTENTS_TIMEOUT_SECONDS,
+    DEFAULT_LLM_RESPONSE_TIMEOUT_SECONDS,
+    LLM_CONNECT_TIMEOUT_SECONDS,
+    DEFAULT_LLM_CONNECT_TIMEOUT_SECONDS,
+)
+from backend.llm.LlmBackends import (
+    Cassette,
+    OfflineLlm,
+    OfflineModelInference,
+    RecordingLlm,
+    RecordingModelInference,
+    ReplayBackend,
+    StubBackend,
+    get_latency_models,
+)
+from backend.utils.Helpers import get_env_number
+
+# process wide clients, created on first use. Authentication, the model validation requests and the http sessions are
+# paid once per process instead of once per client
+_api_client = None
+_model_inferences = {}
+_lock = threading.RLock()
+# record, replay and stub state, created on first use
+_cassette = None
+_offline_backend = None
+_latency_models = None
+
+
+@lru_cache(maxsize=None)
+def get_llm_backend() -> str:
+    """
+    Method to return the configured llm backend
+    :return: LLM_BACKEND_LIVE, LLM_BACKEND_RECORD, LLM_BACKEND_REPLAY or LLM_BACKEND_STUB
+    """
+    backend = (os.getenv(LLM_BACKEND) or DEFAULT_LLM_BACKEND).strip().lower()
+    if backend not in (
+        LLM_BACKEND_LIVE,
+        LLM_BACKEND_RECORD,
+        LLM_BACKEND_REPLAY,
+        LLM_BACKEND_STUB,
+    ):
+        print(f"Invalid value {backend} for {LLM_BACKEND}, defaulting to {LLM_BACKEND_LIVE}")
+        return LLM_BACKEND_LIVE
+    return backend
+
+
+def _get_cassette() -> Cassette:
+    global _cassette
+    if _cassette is None:
+        with _lock:
+            if _cassette is None:
+                _cassette = Cassette(
+                    os.getenv(LLM_CASSETTE_PATH) or DEFAULT_LLM_CASSETTE_PATH
+                )
+    return _cassette
+
+
+def _get_offline_backend() -> ReplayBackend | StubBackend:
+    global _offline_backend
+    if _offline_backend is None:
+        with _lock:
+            if _offline_backend is None:
+                if get_llm_backend() == LLM_BACKEND_REPLAY:
+                    _offline_backend = ReplayBackend(_get_cassette())
+                else:
+                    rules_path = os.getenv(LLM_STUB_RULES_PATH)
+                    rules = None
+                    if rules_path:
+                        with open(rules_path, encoding="utf-8") as rules_file:
+                            rules = json.load(rules_file)
+                    _offline_backend = StubBackend(rules)
+    return _offline_backend
+
+
+def _get_latency_model(model_id):
+    global _latency_models
+    if _latency_models is None:
+        with _lock:
+            if _latency_models is None:
+                _latency_models = get_latency_models(
+                    os.getenv(LLM_REPLAY_LATENCY) or DEFAULT_LLM_REPLAY_LATENCY,
+                    get_env_number(LLM_REPLAY_SEED, DEFAULT_LLM_REPLAY_SEED),
+                )
+    return _latency_models.get(model_id, _latency_models["default"])
+
+
+def _is_offline() -> bool:
+    return get_llm_backend() in (LLM_BACKEND_REPLAY, LLM_BACKEND_STUB)
+
+
+def get_api_client() -> APIClient:
+    """
+    Method to return the process wide watsonx api client, which holds the authentication token and the http session
+    :return: watsonx api client
+    """
+    global _api_client
+    if _api_client is None:
+        with _lock:
+            if _api_client is None:
+                _api_client = APIClient(
+                    credentials=Credentials(
+                        api_key=os.getenv(WATSONX_APIKEY),
+                        url=os.getenv(WATSONX_HOSTED_SERVICE),
+                    ),
+                    project_id=os.getenv(PROJECT_ID),
+                )
+    return _api_client
+
+
+def get_model_inference(model_id) -> ModelInference:
+    """
+    Method to return the process wide inference client of a hosted model. Generation parameters are passed per call,
+    so one client serves every stage using the model. With the record backend the calls are also saved to the
+    cassette, with the replay and stub backends the client is answered offline.
+    :param model_id: id of the hosted model
+    :return: inference client of the model
+    """
+    if _is_offline():
+        return OfflineModelInference(
+            model_id, _get_offline_backend(), _get_latency_model(model_id)
+        )
+    if get_llm_backend() == LLM_BACKEND_RECORD:
+        return RecordingModelInference(_get_live_model_inference(model_id), _get_cassette())
+    return _get_live_model_inference(model_id)
+
+
+@lru_cache(maxsize=None)
+def get_request_timeout():
+    """
+    Method to return the timeout of the http requests to the hosted models. The stage deadlines only bound how long
+    the caller waits, so the requests themselves end no later than the largest stage deadline instead of the 10 minutes
+    of the watsonx client. When a stage waits without a deadline, the timeout of the watsonx client is kept
+    :return: httpx timeout, or None to keep the timeout of the watsonx client
+    """
+    stage_timeouts = [
+        get_env_number(name, default, cast=float)
+        for name, default in (
+            (LLM_INTENT_TIMEOUT_SECONDS, DEFAULT_LLM_INTENT_TIMEOUT_SECONDS),
+            (LLM_ENTITY_TIMEOUT_SECONDS, DEFAULT_LLM_ENTITY_TIMEOUT_SECONDS),
+            (LLM_COMMON_INTENTS_TIMEOUT_SECONDS, DEFAULT_LLM_COMMON_INTENTS_TIMEOUT_SECONDS),
+            (LLM_RESPONSE_TIMEOUT_SECONDS, DEFAULT_LLM_RESPONSE_TIMEOUT_SECONDS),
+        )
+    ]
+    if not all(stage_timeouts):
+        return None
+    request_timeout = max(stage_timeouts)
+    connect_timeout = get_env_number(
+        LLM_CONNECT_TIMEOUT_SECONDS, DEFAULT_LLM_CONNECT_TIMEOUT_SECONDS, cast=float
+    )
+    return httpx.Timeout(request_timeout, connect=min(connect_timeout, request_timeout))
+
+
+def _get_live_model_inference(model_id) -> ModelInference:
+    model_inference = _model_inferences.get(model_id)
+    if model_inference is None:
+        with _lock:
+            model_inference = _model_inferences.get(model_id)
+            if model_inference is None:
+                model_inference = ModelInference(
+                    model_id=model_id, api_client=get_api_client()
+                )
+                request_timeout = get_request_timeout()
+                http_client = model_inference._inference._http_client
+                if request_timeout is not None and isinstance(http_client, httpx.Client):
+                    http_client.timeout = request_timeout
+                _model_inferences[model_id] = model_inference
+    return model_inference
+
+
+def get_watsonx_llm(model_id, params) -> WatsonxLLM:
+    """
+    Method to create a langchain llm for a stage, backed by the shared inference client of the model. The llm only
+    holds the generation parameters of the stage, which are sent with every call.
+    :param model_id: id of the hosted model
+    :param params: generation parameters of the stage
+    :return: langchain llm, or its record, replay or stub replacement
+    """
+    if _is_offline():
+        return OfflineLlm(
+            model_id, params, _get_offline_backend(), _get_latency_model(model_id)
+        )
+    llm = WatsonxLLM(watsonx_model=_get_live_model_inference(model_id))
+    # the llm copies the parameters of the shared client on creation, replace them with those of the stage
+    llm.params = params
+    if get_llm_backend() == LLM_BACKEND_RECORD:
+        return RecordingLlm(llm, _get_cassette())
+    return llm
+
+
+def warm_up(model_ids) -> None:
+    """
+    Method to open the connections to the inference service ahead of the first user request, with a tokenize call per
+    model. Failures are reported and otherwise ignored, the connections are then opened by the first request.
+    :param model_ids: ids of the hosted models to warm up
+    """
+    for model_id in model_ids:
+        try:
+            get_model_inference(model_id).tokenize(prompt="warm up", return_tokens=False)
+        except Exception as e:
+            print(f"Unable to warm up the connection to {model_id}: {e}")
@@ -0,0 +1,170 @@
+# Copyright 2024. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from backend.llm.Resilience import is_upstream_failure
+
+# largest number of prompts the sdk sends in parallel for a multi-prompt generate call
+MAX_SDK_CONCURRENCY = 10
+
+
+class PromptBatcher:
+    """
+    Micro-batcher for the prompts of one model and one set of generation parameters. Prompts arriving within the batch
+    window are collected, up to the maximum batch size, and generated with a single multi-prompt call of the
+    ModelInference client. Every caller waits for, and receives, the completion of its own prompt. When the call fails
+    with a client error, the prompts are generated one by one so that only the caller of a failing prompt gets the
+    error. The outcome of every batch is recorded once in the circuit breaker, whatever the number of its callers.
+    """
+
+    def __init__(self, model, params, window_seconds, max_batch_size, circuit_breaker):
+        """
+        :param model: ModelInference client of the hosted model
+        :param params: generation parameters of the prompts
+        :param window_seconds: time to wait for more prompts after the first prompt of a batch arrives
+        :param max_batch_size: number of prompts after which a batch is sent without waiting for the window
+        :param circuit_breaker: circuit breaker recording the outcome of the batches
+        """
+        self.model = model
+        self.params = params
+        self.circuit_breaker = circuit_breaker
+        self.window_seconds = window_seconds
+        self.max_batch_size = max_batch_size
+        self.batches = 0
+        self.prompts = 0
+        self._pending = []
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def generate(self, prompt) -> str:
+        """
+        Method to generate the completion of a prompt as part of the next batch
+        :param prompt: rendered prompt
+        :return: completion generated for the prompt
+        """
+        return self.submit(prompt).result()
+
+    def submit(self, prompt) -> Future:
+        """
+        Method to add a prompt to the next batch
+        :param prompt: rendered prompt
+        :return: future holding the completion of the prompt
+        """
+        future = Future()
+        with self._lock:
+            self._pending.append((prompt, future))
+            if len(self._pending) >= self.max_batch_size:
+                batch = self._take_batch()
+            else:
+                batch = None
+                if self._timer is None:
+                    self._timer = threading.Timer(self.window_seconds, self._flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+        # a full batch is sent by the caller completing it, the caller would be waiting for it anyway
+        if batch:
+            self._send(batch)
+        return future
+
+    def _take_batch(self) -> list:
+        # must be called with the lock held
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        return batch
+
+    def _flush(self) -> None:
+        with self._lock:
+            batch = self._take_batch()
+        if batch:
+            self._send(batch)
+
+    def _send(self, batch) -> None:
+        prompts = [prompt for prompt, _ in batch]
+        try:
+            completions = self.model.generate_text(
+                prompt=prompts,
+                params=self.params,
+                concurrency_limit=min(len(prompts), MAX_SDK_CONCURRENCY),
+            )
+        except Exception as ex:
+            # an unhealthy llm fails every prompt, retrying them one by one would only add load
+            if len(batch) == 1 or is_upstream_failure(ex):
+                self._record(ex)
+                for _, future in batch:
+                    future.set_exception(ex)
+            else:
+                self._send_one_by_one(batch)
+            return
+        self._record(None)
+        with self._lock:
+            self.batches += 1
+            self.prompts += len(prompts)
+        for (_, future), completion in zip(batch, completions):
+            future.set_result(completion)
+
+    def _send_one_by_one(self, batch) -> None:
+        """
+        Method to generate the prompts of a failed batch with a call per prompt, so that an invalid prompt only fails
+        its own caller
+        :param batch: prompts and futures of the batch
+        """
+
+        def generate(prompt):
+            try:
+                return self.model.generate_text(prompt=prompt, params=self.params), None
+            except Exception as ex:
+                return None, ex
+
+        with ThreadPoolExecutor(
+            max_workers=min(len(batch), MAX_SDK_CONCURRENCY),
+            thread_name_prefix="prompt-batcher",
+        ) as executor:
+            results = list(executor.map(generate, [prompt for prompt, _ in batch]))
+        errors = [ex for _, ex in results if ex is not None]
+        upstream_errors = [ex for ex in errors if is_upstream_failure(ex)]
+        if upstream_errors:
+            self._record(upstream_errors[0])
+        elif len(errors) < len(results):
+            self._record(None)
+        else:
+            self._record(errors[0])
+        for (_, future), (completion, ex) in zip(batch, results):
+            if ex is None:
+                future.set_result(completion)
+            else:
+                future.set_exception(ex)
+
+    def _record(self, ex) -> None:
+        """
+        Method to record the outcome of a batch in the circuit breaker
+        :param ex: exception which failed the batch, None if it succeeded
+        """
+        if ex is None:
+            self.circuit_breaker.record(True)
+        elif is_upstream_failure(ex):
+            self.circuit_breaker.record(False)
+        else:
+            self.circuit_breaker.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "prompts": self.prompts,
+                "average_batch_size": self.prompts / self.batches if self.batches else 0.0,
+            }
@@ -0,0 +1,171 @@
+# Copyright 2024. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+from collections import deque
+
+import httpx
+import numpy as np
+import requests
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling the llm while the circuit breaker is open
+    """
+
+
+def is_upstream_failure(ex) -> bool:
+    """
+    Method to tell whether a failed llm call says the llm is unhealthy. Only timeouts and server errors do, client
+    errors like an exhausted token quota or an invalid request are specific to the caller.
+    :param ex: exception raised by the call
+    :return: True if the call should count as a failure of the llm
+    """
+    if isinstance(ex, (TimeoutError, requests.exceptions.Timeout, httpx.TimeoutException)):
+        return True
+    response = getattr(ex, "response", None)
+    status_code = getattr(response, "status_code", None)
+    return isinstance(status_code, int) and status_code >= 500
+
+
+class LatencyWindow:
+    """
+    Thread safe sliding window of the latest latencies of an llm stage
+    """
+
+    def __init__(self, size):
+        self._latencies = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds) -> None:
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def percentile(self, percentile, min_samples=1) -> float | None:
+        """
+        Method to compute a percentile of the latencies in the window
+        :param percentile: percentile to compute, ex. 95
+        :param min_samples: minimum number of latencies needed for a meaningful value
+        :return: latency in seconds, or None if the window holds fewer than min_samples latencies
+        """
+        with self._lock:
+            if len(self._latencies) < max(min_samples, 1):
+                return None
+            latencies = list(self._latencies)
+        return float(np.percentile(latencies, percentile))
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker over the outcomes of the latest llm calls. When the failure rate of the window exceeds the threshold
+    the circuit opens, and calls fail fast for open_seconds. A single trial call is then let through, its success
+    closes the circuit and its failure opens it again.
+    """
+
+    def __init__(self, failure_rate_threshold, window_size, min_calls, open_seconds):
+        """
+        :param failure_rate_threshold: share of failed calls which opens the circuit, 0 disables the breaker
+        :param window_size: number of latest calls considered
+        :param min_calls: minimum number of calls in the window before the circuit can open
+        :param open_seconds: number of seconds calls fail fast once the circuit is open
+        """
+        self.failure_rate_threshold = failure_rate_threshold
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self.opened_count = 0
+        self._outcomes = deque(maxlen=window_size)
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.failure_rate_threshold > 0
+
+    def allow(self) -> bool:
+        """
+        Method to check whether a call may be made
+        :return: False if the call should fail fast
+        """
+        if not self.enabled:
+            return True
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    return False
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN:
+                if self._trial_in_flight:
+                    return False
+                self._trial_in_flight = True
+            return True
+
+    def record(self, success) -> None:
+        """
+        Method to record the outcome of a call
+        :param success: whether the call succeeded
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._trial_in_flight = False
+                if success:
+                    self.state = CLOSED
+                    self._outcomes.clear()
+                else:
+                    self._open()
+                return
+            self._outcomes.append(success)
+            failures = self._outcomes.count(False)
+            if (
+                self.state == CLOSED
+                and len(self._outcomes) >= self.min_calls
+                and failures / len(self._outcomes) >= self.failure_rate_threshold
+            ):
+                self._open()
+
+    def release(self) -> None:
+        """
+        Method to end a call whose outcome says nothing about the health of the llm, like a client error or a stream
+        closed by its consumer. A trial call is released so that the next call can be the trial.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._trial_in_flight = False
+
+    def _open(self) -> None:
+        # must be called with the lock held
+        self.state = OPEN
+        self.opened_count += 1
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "opened_count": self.opened_count,
+                "recent_calls": len(self._outcomes),
+                "recent_failures": self._outcomes.count(False),
+            }
@@ -0,0 +1,200 @@
+# Copyright 2024. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import math
+import threading
+import time
+from typing import NamedTuple
+
+from backend.llm.Resilience import LatencyWindow
+
+# upper bound of the characters per token, prompts longer than this many characters per token of the small model
+# limit are routed to the large model without estimating their size
+MAX_CHARS_PER_TOKEN = 8
+# max new tokens are rounded up to a multiple of this, which bounds the number of distinct generation parameters
+MAX_NEW_TOKENS_STEP = 256
+LATENCY_PERCENTILE = 95
+
+ROUTE_SMALL_DOCUMENT = "small_document"
+ROUTE_LARGE_DOCUMENT = "large_document"
+ROUTE_LARGE_MODEL_INTENT = "large_model_intent"
+ROUTE_SLO_FALLBACK = "slo_fallback"
+ROUTE_SLO_PROBE = "slo_probe"
+
+
+class RoutingDecision(NamedTuple):
+    model_id: str
+    max_new_tokens: int
+    prompt_tokens: int | None
+    reason: str
+
+
+class ResponseModelRouter:
+    """
+    Routing policy of the response generation calls. Prompts with small documents are answered by the small model,
+    and the max new tokens grow with the size of the prompt instead of always allowing the largest answer. When the
+    recent latency percentile of the large model exceeds the latency objective, every prompt falls back to the small
+    model, and a single probe call goes to the large model every probe_seconds. A probe answered within the objective
+    ends the fallback.
+    """
+
+    def __init__(
+        self,
+        large_model_id,
+        small_model_id,
+        small_model_max_prompt_tokens,
+        large_model_intents,
+        latency_slo_seconds,
+        min_samples,
+        probe_seconds,
+        min_new_tokens,
+        max_new_tokens,
+        output_token_ratio,
+        latency_window_size,
+        estimate_tokens,
+    ):
+        """
+        :param large_model_id: id of the default response generation model
+        :param small_model_id: id of the model answering small prompts and taking over when the large model is slow
+        :param small_model_max_prompt_tokens: largest prompt answered by the small model
+        :param large_model_intents: intents always answered by the large model, unless it is slow
+        :param latency_slo_seconds: latency objective of the response generation, 0 disables the fallback
+        :param min_samples: minimum number of latencies of the large model before it can be considered slow
+        :param probe_seconds: interval of the probe calls to the large model during a fallback
+        :param min_new_tokens: smallest max new tokens given to a prompt
+        :param max_new_tokens: largest max new tokens given to a prompt
+        :param output_token_ratio: max new tokens per token of the prompt
+        :param latency_window_size: number of latest latencies kept per model
+        :param estimate_tokens: function estimating the number of tokens of a text
+        """
+        self.large_model_id = large_model_id
+        self.small_model_id = small_model_id
+        self.small_model_max_prompt_tokens = small_model_max_prompt_tokens
+        self.large_model_intents = set(large_model_intents)
+        self.latency_slo_seconds = latency_slo_seconds
+        self.min_samples = min_samples
+        self.probe_seconds = probe_seconds
+        self.min_new_tokens = min_new_tokens
+        self.max_new_tokens = max_new_tokens
+        self.output_token_ratio = output_token_ratio
+        self.estimate_tokens = estimate_tokens
+        self.latency_window_size = latency_window_size
+        self.latencies = {
+            model_id: LatencyWindow(latency_window_size)
+            for model_id in (large_model_id, small_model_id)
+        }
+        self.decisions = {}
+        self._fallback_since = None
+        self._last_probe = 0.0
+        self._lock = threading.Lock()
+
+    def _get_max_new_tokens(self, prompt_tokens) -> int:
+        if prompt_tokens is None:
+            return self.max_new_tokens
+        max_new_tokens = (
+            math.ceil(prompt_tokens * self.output_token_ratio / MAX_NEW_TOKENS_STEP)
+            * MAX_NEW_TOKENS_STEP
+        )
+        return min(max(max_new_tokens, self.min_new_tokens), self.max_new_tokens)
+
+    def _is_large_model_slow(self) -> bool:
+        if self.latency_slo_seconds <= 0:
+            return False
+        p95 = self.latencies[self.large_model_id].percentile(
+            LATENCY_PERCENTILE, self.min_samples
+        )
+        return p95 is not None and p95 > self.latency_slo_seconds
+
+    def route(self, intent, input_prompt) -> RoutingDecision:
+        """
+        Method to pick the model and the max new tokens answering a response generation prompt
+        :param intent: intent for which the documents were fetched
+        :param input_prompt: rendered response generation prompt
+        :return: routing decision
+        """
+        prompt_tokens = (
+            self.estimate_tokens(input_prompt)
+            if len(input_prompt) <= self.small_model_max_prompt_tokens * MAX_CHARS_PER_TOKEN
+            else None
+        )
+        max_new_tokens = self._get_max_new_tokens(prompt_tokens)
+        if self._is_large_model_slow():
+            with self._lock:
+                now = time.monotonic()
+                if self._fallback_since is None:
+                    self._fallback_since = now
+                    print(
+                        f"Response generation latency of {self.large_model_id} exceeds the objective, "
+                        f"falling back to {self.small_model_id}"
+                    )
+                is_probe = (
+                    now - max(self._fallback_since, self._last_probe)
+                    >= self.probe_seconds
+                )
+                if is_probe:
+                    self._last_probe = now
+            model_id, reason = (
+                (self.large_model_id, ROUTE_SLO_PROBE)
+                if is_probe
+                else (self.small_model_id, ROUTE_SLO_FALLBACK)
+            )
+        elif intent in self.large_model_intents:
+            model_id, reason = self.large_model_id, ROUTE_LARGE_MODEL_INTENT
+        elif prompt_tokens is not None and prompt_tokens <= self.small_model_max_prompt_tokens:
+            model_id, reason = self.small_model_id, ROUTE_SMALL_DOCUMENT
+        else:
+            model_id, reason = self.large_model_id, ROUTE_LARGE_DOCUMENT
+        with self._lock:
+            key = f"{model_id}:{reason}"
+            self.decisions[key] = self.decisions.get(key, 0) + 1
+        return RoutingDecision(model_id, max_new_tokens, prompt_tokens, reason)
+
+    def record_latency(self, model_id, seconds) -> None:
+        """
+        Method to record the latency of a response generation call
+        :param model_id: model which answered the call
+        :param seconds: duration of the call
+        """
+        latencies = self.latencies.get(model_id)
+        if latencies is None:
+            return
+        if (
+            model_id == self.large_model_id
+            and seconds <= self.latency_slo_seconds
+            and self._is_large_model_slow()
+        ):
+            # the large model recovered, drop the latencies which caused the fallback
+            with self._lock:
+                self.latencies[model_id] = LatencyWindow(self.latency_window_size)
+                self._fallback_since = None
+            print(f"Response generation latency of {model_id} is back within the objective, fallback ended")
+            return
+        latencies.record(seconds)
+
+    def stats(self) -> dict:
+        """
+        Method to report the routing decisions and the recent latencies of the models
+        :return: dict containing the decision counts and the latency percentile of every model
+        """
+        with self._lock:
+            decisions = dict(self.decisions)
+        return {
+            "decisions": decisions,
+            "latency_slo_seconds": self.latency_slo_seconds,
+            "large_model_slow": self._is_large_model_slow(),
+            "p95_latencies": {
+                model_id: latencies.percentile(LATENCY_PERCENTILE)
+                for model_id, latencies in self.latencies.items()
+            },
+        }
@@ -0,0 +1,105 @@
+# Copyright 2024. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import re
+import threading
+
+# approximation of the llama 3 pre-tokenizer, every piece is at least one token
+_PIECE_PATTERN = re.compile(
+    r"'(?:s|t|re|ve|m|ll|d)|[^\r\n\w]?[^\W\d_]+|\d{1,3}|_+|\s?[^\s\w]+[\r\n]*|\s+"
+)
+# letters per token assumed for long words, which the tokenizer splits into several sub words
+LETTERS_PER_TOKEN = 6
+# weight of the latest remote token count when calibrating the estimate
+CALIBRATION_WEIGHT = 0.2
+
+
+class TokenCounter:
+    """
+    Local token count estimator for the response generation prompt. The estimate is calibrated against the counts of
+    the remote tokenizer, which is only needed when an estimate is too close to the context limit to decide locally.
+    """
+
+    def __init__(self, safety_margin):
+        """
+        :param safety_margin: relative error tolerated in the estimate, e.g. 0.15 for 15%
+        """
+        self.safety_margin = safety_margin
+        # ratio of remote token counts to local estimates, updated on every remote count
+        self.calibration = 1.0
+        self._static_counts = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def estimate(text) -> int:
+        """
+        Method to estimate the number of tokens of a text
+        :param text: text to count
+        :return: estimated number of tokens
+        """
+        count = 0
+        for piece in _PIECE_PATTERN.findall(text):
+            count += 1
+            if piece[-1:].isalpha() and len(piece) > LETTERS_PER_TOKEN:
+                count += (len(piece) - 1) // LETTERS_PER_TOKEN
+        return count
+
+    def estimate_static(self, text) -> int:
+        """
+        Method to estimate the number of tokens of a text which does not change between requests, like the prompt
+        template and the intent specific instructions. The count is computed once and cached.
+        :param text: text to count
+        :return: estimated number of tokens
+        """
+        count = self._static_counts.get(text)
+        if count is None:
+            count = self.estimate(text)
+            with self._lock:
+                self._static_counts[text] = count
+        return count
+
+    def fits(self, estimated_tokens, limit) -> bool | None:
+        """
+        Method to decide whether a prompt fits in the context window from its estimated size
+        :param estimated_tokens: uncalibrated estimate of the prompt size
+        :param limit: maximum number of tokens
+        :return: True if it fits, False if it does not, None if the estimate is too close to the limit to decide
+        """
+        calibrated = estimated_tokens * self.calibration
+        if calibrated * (1 + self.safety_margin) <= limit:
+            return True
+        if calibrated * (1 - self.safety_margin) > limit:
+            return False
+        return None
+
+    def budget(self, limit) -> int:
+        """
+        Method to convert a token limit into the largest uncalibrated estimate which surely fits in it
+        :param limit: maximum number of tokens
+        :return: budget for the local estimates
+        """
+        return int(limit / (self.calibration * (1 + self.safety_margin)))
+
+    def calibrate(self, estimated_tokens, actual_tokens) -> None:
+        """
+        Method to adjust the calibration with a token count returned by the remote tokenizer
+        :param estimated_tokens: uncalibrated local estimate of the prompt
+        :param actual_tokens: token count of the remote tokenizer
+        """
+        if estimated_tokens <= 0:
+            return
+        with self._lock:
+            self.calibration += CALIBRATION_WEIGHT * (
+                actual_tokens / estimated_tokens - self.calibration
+            )
@@ -0,0 +1,278 @@
+# Copyright 2024. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import contextvars
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from datetime import datetime, timezone
+
+from backend.constants.constants import (
+    TOKEN_BUDGET_EXHAUSTED,
+    TOKEN_BUDGET_OK,
+    TOKEN_BUDGET_SOFT_LIMIT_REACHED,
+)
+from backend.utils.LruCache import TtlLruCache
+
+# seconds to wait for a lock held by another uvicorn worker
+SQLITE_BUSY_TIMEOUT = 5
+# tenants whose monthly totals are kept in memory between budget checks
+BUDGET_CACHE_SIZE = 1024
+
+# tenant and user the llm calls of the current request are accounted to
+_usage_owner = contextvars.ContextVar("token_usage_owner", default=("", ""))
+
+
+def set_usage_owner(tenant_id, username) -> None:
+    """
+    Method to account the llm calls of the current request to a tenant and a user. Work submitted to an executor
+    keeps the owner when it runs in a copy of the current context.
+    :param tenant_id: tenant of the request
+    :param username: user of the request
+    """
+    _usage_owner.set((tenant_id or "", username or ""))
+
+
+def get_usage_owner() -> tuple[str, str]:
+    """
+    Method to return the tenant and the user the llm calls of the current request are accounted to
+    :return: (tenant id, username) tuple, empty strings when unknown
+    """
+    return _usage_owner.get()
+
+
+def _current_month_start() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-01")
+
+
+class TokenUsage:
+    """
+    Input and output tokens of the llm calls, per tenant, user, llm stage and day, persisted in sqlite and shared by
+    all uvicorn workers. Calls are buffered in memory and written in the background, so that accounting does not add
+    a database write to every llm call. Token counts are estimated locally from the prompt and the completion.
+    Monthly totals are compared with a soft and a hard budget, per tenant and for all tenants, the same period as
+    the watsonx token quota.
+    """
+
+    def __init__(
+        self,
+        db_path,
+        estimate_tokens,
+        executor,
+        flush_seconds,
+        tenant_budget,
+        total_budget,
+        soft_limit,
+        enabled=True,
+    ):
+        """
+        :param db_path: location of the sqlite database
+        :param estimate_tokens: function estimating the number of tokens of a text
+        :param executor: executor running the background writes
+        :param flush_seconds: maximum age of the buffered calls before they are written, also the maximum age of the
+        monthly totals used for the budget checks
+        :param tenant_budget: tokens per calendar month for each tenant, 0 for no budget
+        :param total_budget: tokens per calendar month for all tenants, 0 for no budget
+        :param soft_limit: share of a budget from which cheaper paths are taken, e.g. 0.8
+        :param enabled: False disables the accounting and the budgets
+        """
+        self.db_path = db_path
+        self.estimate_tokens = estimate_tokens
+        self.executor = executor
+        self.flush_seconds = flush_seconds
+        self.tenant_budget = tenant_budget
+        self.total_budget = total_budget
+        self.soft_limit = soft_limit
+        self._pending = []
+        self._last_flush = time.monotonic()
+        self._flush_scheduled = False
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._monthly_totals = TtlLruCache(BUDGET_CACHE_SIZE, flush_seconds)
+        self.enabled = enabled and self._initialize()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=SQLITE_BUSY_TIMEOUT)
+
+    def _initialize(self) -> bool:
+        """
+        Creates the token usage table if it does not already exist.
+        :return: True if the usage can be recorded, otherwise False
+        """
+        try:
+            with closing(self._connect()) as connection, connection:
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.execute(
+                    """CREATE TABLE IF NOT EXISTS token_usage (
+                                    tenant_id TEXT,
+                                    username TEXT,
+                                    stage TEXT,
+                                    day TEXT,
+                                    input_tokens INTEGER,
+                                    output_tokens INTEGER,
+                                    calls INTEGER,
+                                    PRIMARY KEY (tenant_id, username, stage, day)
+                                )"""
+                )
+                connection.execute(
+                    "CREATE INDEX IF NOT EXISTS token_usage_day ON token_usage (day, tenant_id)"
+                )
+            return True
+        except sqlite3.Error as e:
+            print(f"Unable to initialize token usage accounting at {self.db_path}, accounting disabled: {e}")
+            return False
+
+    def record(self, stage, prompt, completion, usage_owner=None) -> None:
+        """
+        Method to account an llm call
+        :param stage: llm stage of the call
+        :param prompt: rendered prompt
+        :param completion: generated text
+        :param usage_owner: (tenant id, username) tuple, defaults to the owner of the current request
+        """
+        if not self.enabled:
+            return
+        tenant_id, username = usage_owner or get_usage_owner()
+        with self._lock:
+            self._pending.append((tenant_id, username, stage, prompt, completion))
+            if self._flush_scheduled or time.monotonic() - self._last_flush < self.flush_seconds:
+                return
+            self._flush_scheduled = True
+        self.executor.submit(self.flush)
+
+    def flush(self) -> None:
+        """
+        Method to write the buffered calls to the database
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+            self._last_flush = time.monotonic()
+            self._flush_scheduled = False
+        if not pending:
+            return
+        day = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        totals = {}
+        for tenant_id, username, stage, prompt, completion in pending:
+            key = (tenant_id, username, stage, day)
+            input_tokens, output_tokens, calls = totals.get(key, (0, 0, 0))
+            totals[key] = (
+                input_tokens + self.estimate_tokens(prompt),
+                output_tokens + self.estimate_tokens(completion or ""),
+                calls + 1,
+            )
+        try:
+            with self._flush_lock, closing(self._connect()) as connection, connection:
+                connection.executemany(
+                    """INSERT INTO token_usage (tenant_id, username, stage, day, input_tokens, output_tokens, calls)
+                                  VALUES (?, ?, ?, ?, ?, ?, ?)
+                                  ON CONFLICT (tenant_id, username, stage, day) DO UPDATE SET
+                                  input_tokens = input_tokens + excluded.input_tokens,
+                                  output_tokens = output_tokens + excluded.output_tokens,
+                                  calls = calls + excluded.calls""",
+                    [key + value for key, value in totals.items()],
+                )
+        except sqlite3.Error as e:
+            print(f"Error writing token usage: {e}")
+
+    def _get_monthly_total(self, tenant_id=None) -> int:
+        """
+        Method to return the tokens used in the current calendar month, read from the database at most once per flush
+        interval
+        :param tenant_id: tenant to total, None for all tenants
+        :return: input and output tokens used
+        """
+        key = (tenant_id,)
+        total = self._monthly_totals.get(key)
+        if total is not None:
+            return total
+        query = "SELECT COALESCE(SUM(input_tokens + output_tokens), 0) FROM token_usage WHERE day >= ?"
+        params = [_current_month_start()]
+        if tenant_id is not None:
+            query += " AND tenant_id = ?"
+            params.append(tenant_id)
+        try:
+            with closing(self._connect()) as connection:
+                total = connection.execute(query, params).fetchone()[0]
+        except sqlite3.Error as e:
+            print(f"Error reading token usage: {e}")
+            return 0
+        if self.flush_seconds > 0:
+            self._monthly_totals.put(key, total)
+        return total
+
+    def get_budget_state(self, tenant_id) -> str:
+        """
+        Method to compare the monthly usage with the budgets of the tenant and of all tenants
+        :param tenant_id: tenant of the request
+        :return: TOKEN_BUDGET_OK, TOKEN_BUDGET_SOFT_LIMIT_REACHED or TOKEN_BUDGET_EXHAUSTED
+        """
+        if not self.enabled:
+            return TOKEN_BUDGET_OK
+        usage_shares = []
+        if self.tenant_budget > 0:
+            usage_shares.append(self._get_monthly_total(tenant_id or "") / self.tenant_budget)
+        if self.total_budget > 0:
+            usage_shares.append(self._get_monthly_total() / self.total_budget)
+        usage_share = max(usage_shares, default=0)
+        if usage_share >= 1:
+            return TOKEN_BUDGET_EXHAUSTED
+        if usage_share >= self.soft_limit:
+            return TOKEN_BUDGET_SOFT_LIMIT_REACHED
+        return TOKEN_BUDGET_OK
+
+    def report(self, tenant_id=None, username=None, since_day=None) -> dict:
+        """
+        Method to report the token usage per tenant, user and llm stage
+        :param tenant_id: only report this tenant
+        :param username: only report this user
+        :param since_day: first day of the report as YYYY-MM-DD, defaults to the start of the current month
+        :return: dict containing the period, the budgets and the usage rows
+        """
+        self.flush()
+        since_day = since_day or _current_month_start()
+        query = """SELECT tenant_id, username, stage, SUM(input_tokens), SUM(output_tokens), SUM(calls)
+                   FROM token_usage WHERE day >= ?"""
+        params = [since_day]
+        if tenant_id is not None:
+            query += " AND tenant_id = ?"
+            params.append(tenant_id)
+        if username is not None:
+            query += " AND username = ?"
+            params.append(username)
+        query += " GROUP BY tenant_id, username, stage ORDER BY tenant_id, username, stage"
+        rows = []
+        if self.enabled:
+            with closing(self._connect()) as connection:
+                rows = connection.execute(query, params).fetchall()
+        return {
+            "since": since_day,
+            "tenant_budget": self.tenant_budget,
+            "total_budget": self.total_budget,
+            "soft_limit": self.soft_limit,
+            "budget_state": (
+                self.get_budget_state(tenant_id) if tenant_id is not None else None
+            ),
+            "usage": [
+                {
+                    "tenant_id": row[0],
+                    "username": row[1],
+                    "stage": row[2],
+                    "input_tokens": row[3],
+                    "output_tokens": row[4],
+                    "calls": row[5],
+                }
+                for row in rows
+            ],
+        }
@@ -12,8 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import requests
 from backend.constants.constants import BASE_URL, X_API_KEY, ACCEPT, APPLICATION_JSON
+from backend.external_apis.HttpSession import async_http_post, http_post
 
 
 def key_validation_service(tenant_id: str, api_key: str) -> bool:
@@ -34,10 +34,35 @@ def key_validation_service(tenant_id: str, api_key: str) -> bool:
     }
 
     try:
-        response = requests.post(url, headers=headers)
+        response = http_post(url, headers=headers)
         if response.status_code in {200, 201}:
             return True
         return False
     except Exception as e:
         print(f"[ERROR] Unable to fetch X-API-Token: {e}", flush=True)
         raise e
+
+
+async def key_validation_service_async(tenant_id: str, api_key: str) -> bool:
+    """
+    Validate the API key without blocking the event loop, same as key_validation_service.
+
+    Args:
+        tenant_id (str): The identifier for the tenant.
+        api_key (str): The API key to be validated.
+
+    Returns:
+        bool: True if the API key is valid, False otherwise.
+    """
+    url = f"{BASE_URL}tenants/{tenant_id}/token"
+    headers = {
+        X_API_KEY: api_key,
+        ACCEPT: APPLICATION_JSON,
+    }
+
+    try:
+        response = await async_http_post(url, headers=headers)
+        return response.status_code in {200, 201}
+    except Exception as e:
+        print(f"[ERROR] Unable to fetch X-API-Token: {e}", flush=True)
+        raise e
@@ -15,7 +15,7 @@
 from fastapi import HTTPException
 from backend.constants.constants import *
 from backend.utils.ResponseGenerationHelpers import preprocess_api_response
-from backend.llm.HostedLlm import HostedLlm
+from backend.llm.HostedLlm import get_hosted_llm
 from backend.previous_actions_module.DatabaseOperations import (
     IntentsAndEntitiesDatabaseOperations,
 )
@@ -107,7 +107,7 @@ class ActionExecutor:
             }
             raise HTTPException(status_code=204, detail=error_response)
         documents = preprocess_api_response(documents, intent, entity_dict)
-        hosted_llmObj = HostedLlm()
+        hosted_llmObj = get_hosted_llm()
         question = userQuery
         response, is_response_generated = (
             hosted_llmObj.extract_answers_from_documents(
@@ -13,26 +13,44 @@
 # limitations under the License.
 
 from langchain_core.prompts import PromptTemplate
+from backend.llm.FewShotExampleStore import FewShotExampleStore
 from backend.prompt import prompts
 
 class IntentDetectionPromptManager:
-    def __init__(self):
+    def __init__(self, few_shot_examples=0):
         """
         Initializes the IntentDetectionPromptManager with a prompt template.
 
         Args:
             intent (str): The template string for intent detection.
+            few_shot_examples (int): Number of examples selected per question, 0 keeps every example.
         """
         self.prompt = PromptTemplate(
             template=prompts.intent_template,
             input_variables=["system_message","question"]
         )
+        self.example_store = (
+            FewShotExampleStore(
+                prompts.intent_template,
+                "sentence:\n{question}",
+                few_shot_examples,
+                ["system_message", "question"],
+            )
+            if few_shot_examples > 0
+            else None
+        )
 
-    def get_intent_prompt(self):
+    def get_intent_prompt(self, question=None):
         """
-        Returns the prompt template.
+        Returns the prompt template. When few-shot example selection is enabled and a question is given, the template
+        only holds the examples most similar to the question.
+
+        Args:
+            question (str): The user utterance.
 
         Returns:
             PromptTemplate: The prompt template initialized with the given intent.
         """
+        if self.example_store is not None and question:
+            return self.example_store.get_prompt(question)
         return self.prompt
@@ -13,7 +13,10 @@
 # limitations under the License.
 
 from langchain_core.prompts import PromptTemplate
-from backend.prompt.prompts import response_generation_template
+from backend.prompt.prompts import (
+    response_generation_template,
+    response_reduce_template,
+)
 
 
 class ResponseGenerationPromptManager:
@@ -23,7 +26,20 @@ class ResponseGenerationPromptManager:
         """
         self.prompt = PromptTemplate(
             template=response_generation_template,
-            input_variables=["question", "documents", "intent_specific_instructions"],
+            input_variables=[
+                "question",
+                "documents",
+                "document_format_instructions",
+                "intent_specific_instructions",
+            ],
+        )
+        self.reduce_prompt = PromptTemplate(
+            template=response_reduce_template,
+            input_variables=[
+                "question",
+                "partial_answers",
+                "intent_specific_instructions",
+            ],
         )
 
     def get_response_generation_prompt(self):
@@ -34,3 +50,12 @@ class ResponseGenerationPromptManager:
             PromptTemplate: The prompt template initialized with the given intent.
         """
         return self.prompt
+
+    def get_response_reduce_prompt(self):
+        """
+        Returns the prompt template combining the partial answers of a chunked response generation.
+
+        Returns:
+            PromptTemplate: The reduce prompt template.
+        """
+        return self.reduce_prompt
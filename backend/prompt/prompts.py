@@ -15,7 +15,12 @@
 from backend.utils.Helpers import Helpers
 from backend.external_apis import REGISTERED_APIS
 from backend.constants.PromptConstants import *
-from backend.constants.constants import SYSTEM_ID_ASSERTION, METRIC_TYPE_ASSERTION
+from backend.constants.constants import (
+    SYSTEM_ID_ASSERTION,
+    METRIC_TYPE_ASSERTION,
+    GREETINGS,
+    THANKING,
+)
 
 helper = Helpers(REGISTERED_APIS)
 # Method to dynamically fetch API list
@@ -1031,6 +1036,30 @@ Intent: {{intent}}
 User Input: {{question}}
 <|assistant|>"""
 
+# pre-generated responses to the common intents, served in turn without calling the llm
+common_intents_responses = {
+    GREETINGS: [
+        "Hey there! How can I assist you with your storage systems today?",
+        "Hello! Ready to dive into your storage systems? Let me know how I can help!",
+        "Hi! How can I make your storage observability easier today?",
+        "Hey! I'm here to help with your storage systems. What would you like to know?",
+        "Hello there! Ask me about the alerts, notifications, capacity or performance of your storage systems.",
+        "Hi! Good to see you. Which of your storage systems should we look at today?",
+        "Hey! I'm all set to help you keep an eye on your storage. What can I do for you?",
+        "Hello! Curious about your tenant's alerts, notifications or system details? Just ask!",
+    ],
+    THANKING: [
+        "You're very welcome! I'm here if you need any more help with your storage systems!",
+        "It's my pleasure! Don't hesitate to reach out if you need more assistance!",
+        "Take care! Don't hesitate to reach out if you have any questions or concerns about your storage systems.",
+        "Happy to help! Feel free to come back whenever you need insights into your storage systems.",
+        "Anytime! Let me know if there's anything else I can check for you.",
+        "Glad I could help! Your storage systems are in good hands, reach out anytime.",
+        "You're welcome! If anything else comes up with your storage, I'm just a message away.",
+        "No problem at all! Have a great day, and ping me whenever you need me.",
+    ],
+}
+
 response_generation_template = f"""{BEGIN_OF_TEXT}{START_HEADER_ID}{SYSTEM}{END_HEADER_ID} You are an AI language model 
 designed to function as a specialized Retrieval Augmented Generation (RAG) assistant. You are not good at mathematical 
 calculations such as counting, addition, subtraction, multiplication, or division. If the user asks for any form of 
@@ -1052,7 +1081,7 @@ using H1 (#) and H2 (##). Include other markdown elements like bold, italics, li
 For important notes or references, use block quotes (>) to draw attention to the text. Examine the question and decide 
 whether you should answer in a tabular format or not. Replace the word 'document' in your response with 'tenant'.
 Think step by step but do not provide steps in the answer.
-{{intent_specific_instructions}}
+{{document_format_instructions}}{{intent_specific_instructions}}
 [Document] {{documents}} [End] {END_OF_TURN}{START_HEADER_ID}{USER}{END_HEADER_ID}{{question}}{END_OF_TURN}
 {START_HEADER_ID}{ASSISTANT}{END_HEADER_ID}"""
 
@@ -1099,3 +1128,199 @@ were received for the tenant. You should answer questions only about notificatio
 system. Your answer should always include following fields: event, id, time, device name, serial number, 
 more information, whether the event is acknowledged or not in addition to whatever fields you choose to add. If you 
 are asked about alerts, details about a system, below document does not provide that answer."""
+
+# describes the documents rendered by render_compact_records, left out of the prompt for documents which are not compacted
+compact_document_format_instructions = """The document lists records as tab separated rows below a header row. Fields 
+which have the same value in every record are listed once above the header row as 'field: value' and apply to every 
+record.
+"""
+
+chunk_response_generation_instructions = """The document below is part {part} of {parts} of the data of the tenant. 
+Answer only from this part. Include every record of this part which is relevant to the question, together with the 
+fields you are asked to always include, and do not draw conclusions about records which are not in this part."""
+
+response_reduce_template = f"""{BEGIN_OF_TEXT}{START_HEADER_ID}{SYSTEM}{END_HEADER_ID} You are an AI language model 
+designed to function as a specialized Retrieval Augmented Generation (RAG) assistant. The data of the tenant was too 
+large to read at once, so it was split into parts and the question was answered for every part separately. Combine 
+the partial answers below into a single answer to the question. Keep every relevant record mentioned in the partial 
+answers, remove duplicates, and do not mention the parts or the partial answers in your response. Generate responses 
+in proper sentences as a human would and make sure that the response is grounded in the partial answers.
+
+You are a markdown expert, generate responses using markdown formatting, H3 (###), and lower-level headings, but avoid 
+using H1 (#) and H2 (##). Include other markdown elements like bold, italics, lists, links, and code blocks as needed. 
+Examine the question and decide whether you should answer in a tabular format or not.
+{{intent_specific_instructions}}
+[Partial Answers] {{partial_answers}} [End] {END_OF_TURN}{START_HEADER_ID}{USER}{END_HEADER_ID}{{question}}{END_OF_TURN}
+{START_HEADER_ID}{ASSISTANT}{END_HEADER_ID}"""
+
+joint_intent_entity_template = f"""
+<|system|>
+{{system_message}}
+<|user|>
+For the given sentence, assign a label and perform named entity recognition (NER).
+
+Label: The label must be one of the following: [{formatted_intent_list}]
+If the input is an introductory salutation like "hi", "hello", "good morning", "good evening" or similar, then assign [greetings]. If the input is a goodbye message or a thanking remark, assign [thanking]. If the input asks which storage system needs attention, focus, or review, assign [morning-cup-of-coffee]. If the input does not fit into any of these labels, you should assign [unknown]. Assign only one label to the sentence.
+Note: The terms 'systems' and 'devices' are synonymous and should be treated as referring to the same entity. For any query related to hardware failure, ensure the intent is mapped to [tenant-notifications]. If the input sentence only includes a storage system UUID (formatted as a UUID), the label should be [system-id-assertion]. If the input sentence only includes a metric type (e.g., "port_send_io_rate", "ip_replication_latency") or any metric-related term without other detailed information, assign the label [metric-type-assertion]. If the input sentence seems related to documentation, such as questions about "how to" or "what to do," then assign the label [unknown]. Also, Questions regarding opening or closing of tickets should be mapped to [unknown].
+
+Tags: Tag the entities of the sentence according to the following categories:
+- storage_system_id : A unique system ID. This entity will always represent a unique identifier which must be a 32-character hexadecimal string in the format `8-4-4-4-12` (e.g., `123e4567-e89b-12d3-a456-426614174000`). Do not tag any other alphanumeric strings as `storage_system_id`.
+- system_name: The name of a storage system. This entity represents a descriptive or user-defined name for a storage system, distinct from the storage_system_id, e.g. "2107.75AHG91", "SVC-svc4", "tpcflash9100", "XIV_D 7811012", "v7000-storea". System names do not follow the 8-4-4-4-12 hexadecimal format.
+- severity : The severity level can only be one of the following - critical, critical_acknowledged, warning, warning_acknowledged, info, info_acknowledged.
+- duration : The duration, which ends with 'd/D' for days, 'h/H' for hours, or 'm/M' for minutes.
+- types :The metric types, which must be in the format of lowercase words separated by underscores, e.g. used_capacity, usable_capacity, cpu_utilization, volume_overall_read_io_rate, port_send_io_rate.
+
+Response Instructions:
+Your response must consist only of the label in square brackets, followed by the line "Tags:" and the detected entities and their corresponding tags within a dictionary structure. If no entities are detected, the tags must be an empty dictionary `{{{{}}}}`. Do not prepend or append anything else. Do not provide any further explanation. Only respond based on the current input sentence.
+
+Here are some examples, complete the last one:
+sentence:
+what are the info notifications for my tenant for the past 20 days
+label:
+[tenant-notifications]
+Tags:
+{{{{"severity":"info", "duration":"20d"}}}}
+
+sentence:
+Provide details about device 98765432-1234-5678-abcd-123456789abc associated with this tenant
+label:
+[storage-system-details]
+Tags:
+{{{{"storage_system_id":"98765432-1234-5678-abcd-123456789abc"}}}}
+
+sentence:
+show me the volumes for system e8958560-e386-11ee-b2e1-cfddfe51829e
+label:
+[storage-system-volume]
+Tags:
+{{{{"storage_system_id":"e8958560-e386-11ee-b2e1-cfddfe51829e"}}}}
+
+sentence:
+show me alerts on this tenant for last 15 days
+label:
+[tenant-alerts]
+Tags:
+{{{{"duration":"15d"}}}}
+
+sentence:
+fetch the critical alerts for storage system e8958560-e386-11ee-b2e1-cfd123e51829e for last 10 hours
+label:
+[storage-system-alert]
+Tags:
+{{{{"storage_system_id":"e8958560-e386-11ee-b2e1-cfd123e51829e", "severity":"critical", "duration":"10h"}}}}
+
+sentence:
+what is the ip replication compressed receive data rate for 059f59a0-1687-11ef-9ec0-6976616010e2 for the last twelve days
+label:
+[storage-system-metric]
+Tags:
+{{{{"storage_system_id":"059f59a0-1687-11ef-9ec0-6976616010e2", "types":"ip_replication_compressed_receive_data_rate", "duration":"12d"}}}}
+
+sentence:
+show me used capacity graph for system svc3c
+label:
+[storage-system-metric]
+Tags:
+{{{{"types":"used_capacity", "system_name":"svc3c"}}}}
+
+sentence:
+are there any systems in error condition?
+label:
+[storage-list]
+Tags:
+{{{{}}}}
+
+sentence:
+are their any warning acknowledged notifications for my tenant
+label:
+[tenant-notifications]
+Tags:
+{{{{"severity":"warning_acknowledged"}}}}
+
+sentence:
+give me the warning alerts in past one hour for SVC-perfsvc1 which has id 51ad7e60-c75b-11ee-a416-b3b5584372fa
+label:
+[storage-system-alert]
+Tags:
+{{{{"severity":"warning", "duration": "1h", "system_name":"SVC-perfsvc1", "storage_system_id": "51ad7e60-c75b-11ee-a416-b3b5584372fa"}}}}
+
+sentence:
+list me the alerts on tpcflash900b
+label:
+[storage-system-alert]
+Tags:
+{{{{"system_name":"tpcflash900b"}}}}
+
+sentence:
+Does a7ece550-02d3-11ef-ba9c-f1cd529d5b67 have any volume related details in the past 10 days
+label:
+[storage-system-volume]
+Tags:
+{{{{"storage_system_id": "a7ece550-02d3-11ef-ba9c-f1cd529d5b67", "duration": "10d"}}}}
+
+sentence:
+07688d90-6099-11ef-859d-47e83a51569d
+label:
+[system-id-assertion]
+Tags:
+{{{{"storage_system_id": "07688d90-6099-11ef-859d-47e83a51569d"}}}}
+
+sentence:
+port_send_io_rate
+label:
+[metric-type-assertion]
+Tags:
+{{{{"types":"port_send_io_rate"}}}}
+
+sentence:
+give me all systems on this tenant
+label:
+[storage-list]
+Tags:
+{{{{}}}}
+
+sentence:
+Has any hardware component failed on my devices?
+label:
+[tenant-notifications]
+Tags:
+{{{{}}}}
+
+sentence:
+which storage systems need my attention today?
+label:
+[morning-cup-of-coffee]
+Tags:
+{{{{}}}}
+
+sentence:
+what can you help me with?
+label:
+[chatbot-capabilities]
+Tags:
+{{{{}}}}
+
+sentence:
+Hey, good morning!
+label:
+[greetings]
+Tags:
+{{{{}}}}
+
+sentence:
+thanks, that was helpful
+label:
+[thanking]
+Tags:
+{{{{}}}}
+
+sentence:
+how do I open a support ticket?
+label:
+[unknown]
+Tags:
+{{{{}}}}
+
+sentence:
+{{question}}
+label:"""
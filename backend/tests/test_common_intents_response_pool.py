@@ -0,0 +1,46 @@
+# Copyright 2024. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import json
+
+from backend.llm.CommonIntentsResponsePool import CommonIntentsResponsePool
+
+BUILTIN_RESPONSES = {"greetings": ["Hello!"], "thanking": ["You're welcome!"]}
+
+
+def test_values_which_are_not_lists_are_ignored(tmp_path):
+    path = tmp_path / "responses.json"
+    path.write_text(json.dumps({"greetings": "Hi there", "thanking": ["Anytime!", 3]}))
+    pool = CommonIntentsResponsePool(BUILTIN_RESPONSES, str(path))
+
+    assert pool.get_response("greetings") == "Hello!"
+    assert pool.get_response("thanking") == "Anytime!"
+    assert pool.stats()["responses"] == {"greetings": 1, "thanking": 1}
+
+
+def test_invalid_file_is_not_read_again_until_it_changes(tmp_path, monkeypatch):
+    path = tmp_path / "responses.json"
+    path.write_text("{not json")
+    pool = CommonIntentsResponsePool(BUILTIN_RESPONSES, str(path))
+    assert pool.get_response("greetings") == "Hello!"
+
+    loads = []
+    monkeypatch.setattr(
+        "backend.llm.CommonIntentsResponsePool.json.load",
+        lambda responses_file: loads.append(responses_file) or {},
+    )
+    assert pool.get_response("greetings") == "Hello!"
+
+    assert loads == []
@@ -0,0 +1,80 @@
+# Copyright 2024. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import sqlite3
+from contextlib import closing
+
+from backend.llm.CompletionCache import CompletionCache
+
+
+def get_rows(cache):
+    with closing(sqlite3.connect(cache.db_path)) as connection:
+        rows = connection.execute(
+            "SELECT cache_key, size, last_access FROM completions"
+        ).fetchall()
+        (total,) = connection.execute("SELECT total FROM completions_size").fetchone()
+    return rows, total
+
+
+def test_least_recently_used_completions_are_evicted_below_the_bound(tmp_path):
+    cache = CompletionCache(str(tmp_path / "cache.db"), 10000)
+
+    for index in range(100):
+        cache.put("model", {}, f"prompt {index}", "x" * 200)
+
+    rows, total = get_rows(cache)
+    assert total == sum(size for _, size, _ in rows)
+    assert total <= 10000
+    assert cache.stats()["evictions"] > 0
+    assert cache.get("model", {}, "prompt 99") == "x" * 200
+    assert cache.get("model", {}, "prompt 0") is None
+
+
+def test_replacing_a_completion_keeps_the_total_size(tmp_path):
+    cache = CompletionCache(str(tmp_path / "cache.db"), 10000)
+
+    cache.put("model", {}, "prompt", "short")
+    cache.put("model", {}, "prompt", "a longer completion")
+
+    rows, total = get_rows(cache)
+    assert len(rows) == 1
+    assert total == rows[0][1]
+
+
+def test_recent_hits_do_not_update_the_last_access(tmp_path):
+    cache = CompletionCache(str(tmp_path / "cache.db"), 10000)
+    cache.put("model", {}, "prompt", "completion")
+    (_, _, last_access), = get_rows(cache)[0]
+
+    assert cache.get("model", {}, "prompt") == "completion"
+
+    (_, _, last_access_after_hit), = get_rows(cache)[0]
+    assert last_access_after_hit == last_access
+
+
+def test_databases_of_older_versions_are_cleared(tmp_path):
+    db_path = str(tmp_path / "cache.db")
+    with closing(sqlite3.connect(db_path)) as connection, connection:
+        connection.execute(
+            "CREATE TABLE completions (cache_key TEXT PRIMARY KEY, model_id TEXT, completion TEXT, size INTEGER, "
+            "last_access REAL)"
+        )
+        connection.execute(
+            "INSERT INTO completions VALUES ('key', 'model', 'tenant data', 14, 0)"
+        )
+
+    cache = CompletionCache(db_path, 10000)
+
+    assert get_rows(cache) == ([], 0)
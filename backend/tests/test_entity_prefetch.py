@@ -0,0 +1,49 @@
+# Copyright 2024. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+from backend.constants.constants import LLM_STAGE_ENTITY
+from backend.llm.HostedLlm import HostedLlm
+
+
+class EntityExtractor:
+    def extract(self, user_utterance):
+        return {"severity": "critical"}
+
+
+def get_llm():
+    return SimpleNamespace(
+        stage_timeouts={LLM_STAGE_ENTITY: 0.05}, entity_extractor=EntityExtractor()
+    )
+
+
+def test_prefetched_entities_are_returned():
+    entity_future = Future()
+    entity_future.set_result({"storage_system_id": "abc"})
+
+    entities = HostedLlm.get_prefetched_entities(get_llm(), entity_future, "query")
+
+    assert entities == {"storage_system_id": "abc"}
+
+
+def test_late_extraction_is_cancelled_and_local_entities_are_used():
+    entity_future = Future()
+
+    entities = HostedLlm.get_prefetched_entities(get_llm(), entity_future, "query")
+
+    assert entities == {"severity": "critical"}
+    assert entity_future.cancelled()
@@ -0,0 +1,74 @@
+# Copyright 2024. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import random
+
+import pytest
+
+from backend.constants.constants import (
+    DEFAULT_INTENT_CLASSIFIER_CONFIDENCE_THRESHOLD,
+    GREETINGS,
+    THANKING,
+)
+from backend.llm.IntentClassifier import IntentClassifier, get_labelled_examples
+
+FOLDS = 5
+
+
+@pytest.fixture(scope="module")
+def classifier():
+    return IntentClassifier(DEFAULT_INTENT_CLASSIFIER_CONFIDENCE_THRESHOLD)
+
+
+@pytest.mark.parametrize(
+    "utterance, intent",
+    [
+        ("hi", GREETINGS),
+        ("Hello!", GREETINGS),
+        ("hey", GREETINGS),
+        ("good morning", GREETINGS),
+        ("thanks", THANKING),
+        ("Thank you!", THANKING),
+    ],
+)
+def test_common_intents_are_resolved_locally(classifier, utterance, intent):
+    assert classifier.classify(utterance) == intent
+
+
+def test_most_bundled_examples_are_resolved_locally(classifier):
+    examples = get_labelled_examples()
+    predictions = [(classifier.classify(sentence), label) for sentence, label in examples]
+    resolved = [(intent, label) for intent, label in predictions if intent]
+    assert len(resolved) / len(examples) > 0.6
+    assert all(intent == label for intent, label in resolved)
+
+
+def test_no_held_out_example_is_confidently_wrong():
+    examples = get_labelled_examples()
+    random.Random(0).shuffle(examples)
+    resolved = 0
+    for fold in range(FOLDS):
+        held_out = examples[fold::FOLDS]
+        training = [
+            example for index, example in enumerate(examples) if index % FOLDS != fold
+        ]
+        classifier = IntentClassifier(
+            DEFAULT_INTENT_CLASSIFIER_CONFIDENCE_THRESHOLD, training
+        )
+        for sentence, label in held_out:
+            intent = classifier.classify(sentence)
+            assert intent in (None, label), sentence
+            resolved += intent is not None
+    assert resolved / len(examples) > 0.1
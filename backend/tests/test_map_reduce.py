@@ -0,0 +1,128 @@
+# Copyright 2024. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import threading
+import time
+from types import MethodType, SimpleNamespace
+
+from backend.constants.PromptConstants import LLAMA_INPUT_CONTEXT_LENGTH
+from backend.constants.constants import (
+    DEFAULT_MAP_REDUCE_CHUNK_TIMEOUT_SECONDS,
+    DEFAULT_MAP_REDUCE_CHUNK_TOKENS,
+    DEFAULT_MAP_REDUCE_MAX_CHUNKS,
+    DEFAULT_MAP_REDUCE_PARALLELISM,
+    DEFAULT_MAP_REDUCE_TIMEOUT_SECONDS,
+    TENANT_ALERTS,
+)
+from backend.llm.HostedLlm import HostedLlm
+from backend.llm.TokenCounter import TokenCounter
+from backend.prompt.ResponseGenerationPromptManager import (
+    ResponseGenerationPromptManager,
+)
+
+
+def get_llm(answer, budget_limited=lambda: False):
+    """
+    Method to build the parts of HostedLlm used by map reduce, with an llm which answers every prompt with answer
+    """
+    llm = SimpleNamespace(
+        token_counter=TokenCounter(0.15),
+        response_generation_manager=ResponseGenerationPromptManager(),
+        response_llm=None,
+        map_reduce_max_chunks=DEFAULT_MAP_REDUCE_MAX_CHUNKS,
+        map_reduce_chunk_tokens=DEFAULT_MAP_REDUCE_CHUNK_TOKENS,
+        map_reduce_parallelism=DEFAULT_MAP_REDUCE_PARALLELISM,
+        map_reduce_chunk_timeout=DEFAULT_MAP_REDUCE_CHUNK_TIMEOUT_SECONDS,
+        map_reduce_timeout=DEFAULT_MAP_REDUCE_TIMEOUT_SECONDS,
+        prompts=[],
+    )
+    llm._is_token_budget_limited = budget_limited
+    lock = threading.Lock()
+
+    def invoke(response_llm, input_prompt, stage):
+        with lock:
+            llm.prompts.append(input_prompt)
+        return answer
+
+    llm._invoke = invoke
+    for method in (
+        HostedLlm._get_map_reduce_prompt,
+        HostedLlm._reduce_partial_answers,
+        HostedLlm._generate_concurrently,
+    ):
+        setattr(llm, method.__name__, MethodType(method, llm))
+    return llm
+
+
+def test_map_reduce_covers_documents_above_128k_tokens():
+    alerts = [
+        {
+            "id": f"alert-{index}",
+            "severity": ("critical", "major", "minor")[index % 3],
+            "title": f"Capacity of pool pool-{index} on storage system system-{index % 40} is above threshold",
+            "description": " ".join(f"metric-{index}-{word}" for word in range(12)),
+        }
+        for index in range(1600)
+    ]
+    llm = get_llm("There are critical alerts.")
+    document_tokens = llm.token_counter.estimate(str(alerts))
+    assert document_tokens > 128000
+
+    input_prompt = llm._get_map_reduce_prompt("Show my alerts", TENANT_ALERTS, alerts)
+
+    assert input_prompt is not None
+    assert len(llm.prompts) > 8
+    assert "There are critical alerts." in input_prompt
+
+
+def test_partial_answers_which_do_not_fit_are_reduced_again():
+    long_answer = " ".join(f"system-{word} has capacity issues" for word in range(800))
+    llm = get_llm("Combined answer.")
+
+    input_prompt = llm._reduce_partial_answers(
+        "Show my alerts", "", [long_answer] * 64, time.monotonic() + 60
+    )
+
+    assert llm.prompts
+    assert all(
+        llm.token_counter.estimate(prompt) <= DEFAULT_MAP_REDUCE_CHUNK_TOKENS * 1.5
+        for prompt in llm.prompts
+    )
+    assert long_answer not in input_prompt
+    assert llm.token_counter.fits(
+        llm.token_counter.estimate(input_prompt), LLAMA_INPUT_CONTEXT_LENGTH
+    )
+
+
+def test_no_wave_is_started_once_the_token_budget_is_limited():
+    waves = []
+    llm = get_llm("Partial answer.", lambda: waves.append(1) or len(waves) > 1)
+
+    completions = llm._generate_concurrently(
+        [f"prompt {index}" for index in range(3 * DEFAULT_MAP_REDUCE_PARALLELISM)],
+        time.monotonic() + 60,
+    )
+
+    assert len(completions) == DEFAULT_MAP_REDUCE_PARALLELISM
+    assert len(llm.prompts) == DEFAULT_MAP_REDUCE_PARALLELISM
+
+
+def test_no_wave_is_started_past_the_deadline():
+    llm = get_llm("Partial answer.")
+
+    completions = llm._generate_concurrently(["prompt"], time.monotonic() - 1)
+
+    assert completions == []
+    assert llm.prompts == []
@@ -0,0 +1,74 @@
+# Copyright 2024. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import pytest
+
+from backend.llm.PromptBatcher import PromptBatcher
+from backend.llm.Resilience import CircuitBreaker
+
+
+class Model:
+    def __init__(self, error=None):
+        self.error = error
+        self.calls = 0
+
+    def generate_text(self, prompt, params, concurrency_limit=1):
+        self.calls += 1
+        prompts = prompt if isinstance(prompt, list) else [prompt]
+        if self.error:
+            raise self.error
+        if "bad" in prompts:
+            raise ValueError("invalid prompt")
+        completions = [f"completion of {item}" for item in prompts]
+        return completions if isinstance(prompt, list) else completions[0]
+
+
+class UpstreamError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"status {status_code}")
+        self.response = type("Response", (), {"status_code": status_code})()
+
+
+def get_batcher(model):
+    breaker = CircuitBreaker(0.5, window_size=10, min_calls=10, open_seconds=30)
+    return PromptBatcher(
+        model, {}, window_seconds=60, max_batch_size=3, circuit_breaker=breaker
+    )
+
+
+def test_invalid_prompt_only_fails_its_own_caller():
+    batcher = get_batcher(Model())
+
+    futures = [batcher.submit(prompt) for prompt in ("first", "bad", "third")]
+
+    assert futures[0].result() == "completion of first"
+    assert futures[2].result() == "completion of third"
+    with pytest.raises(ValueError):
+        futures[1].result()
+    assert batcher.circuit_breaker.stats()["recent_calls"] == 1
+    assert batcher.circuit_breaker.stats()["recent_failures"] == 0
+
+
+def test_failed_batch_counts_as_one_breaker_failure():
+    model = Model(UpstreamError(503))
+    batcher = get_batcher(model)
+
+    futures = [batcher.submit(prompt) for prompt in ("first", "second", "third")]
+
+    for future in futures:
+        with pytest.raises(UpstreamError):
+            future.result()
+    assert model.calls == 1
+    assert batcher.circuit_breaker.stats()["recent_failures"] == 1
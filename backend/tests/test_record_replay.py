@@ -0,0 +1,79 @@
+# Copyright 2024. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from types import SimpleNamespace
+
+from ibm_watsonx_ai.metanames import GenTextParamsMetaNames
+
+from backend.constants.constants import (
+    GREEDY,
+    LLM_BACKEND_RECORD,
+    LLM_BACKEND_REPLAY,
+    LLM_STAGE_INTENT,
+)
+from backend.llm.CompletionCache import CompletionCache
+from backend.llm.HostedLlm import HostedLlm
+from backend.llm.LlmBackends import (
+    Cassette,
+    LatencyModel,
+    OfflineLlm,
+    RecordingLlm,
+    ReplayBackend,
+)
+from backend.llm.Resilience import CircuitBreaker
+
+MODEL_ID = "test-model"
+PARAMS = {GenTextParamsMetaNames.DECODING_METHOD: GREEDY}
+
+
+def get_llm(tmp_path):
+    completion_cache = CompletionCache(str(tmp_path / "cache.db"), 10000)
+    # the prompt was answered before on this machine
+    completion_cache.put(MODEL_ID, PARAMS, "prompt", "cached completion")
+    return SimpleNamespace(
+        completion_cache=completion_cache,
+        circuit_breaker=CircuitBreaker(0, window_size=10, min_calls=10, open_seconds=30),
+        token_usage=SimpleNamespace(record=lambda *args, **kwargs: None),
+        _call_with_deadline=lambda stage, call: call(),
+    )
+
+
+def test_cached_prompt_is_recorded_and_replayed(tmp_path, monkeypatch):
+    cassette_path = str(tmp_path / "cassette.jsonl")
+    llm = get_llm(tmp_path)
+    watsonx_llm = SimpleNamespace(
+        model_id=MODEL_ID, params=PARAMS, invoke=lambda prompt: "live completion"
+    )
+
+    monkeypatch.setattr(
+        "backend.llm.HostedLlm.get_llm_backend", lambda: LLM_BACKEND_RECORD
+    )
+    recorded = HostedLlm._invoke(
+        llm, RecordingLlm(watsonx_llm, Cassette(cassette_path)), "prompt", LLM_STAGE_INTENT
+    )
+
+    monkeypatch.setattr(
+        "backend.llm.HostedLlm.get_llm_backend", lambda: LLM_BACKEND_REPLAY
+    )
+    replay_llm = OfflineLlm(
+        MODEL_ID,
+        PARAMS,
+        ReplayBackend(Cassette(cassette_path)),
+        LatencyModel("none", 0),
+    )
+    replayed = HostedLlm._invoke(llm, replay_llm, "prompt", LLM_STAGE_INTENT)
+
+    assert recorded == "live completion"
+    assert replayed == "live completion"
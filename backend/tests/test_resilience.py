@@ -0,0 +1,140 @@
+# Copyright 2024. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from backend.constants.constants import LLM_RESPONSE_TIMEOUT_SECONDS, LLM_STAGE_RESPONSE
+from backend.llm.HostedLlm import HostedLlm
+from backend.llm.LlmClientRegistry import get_request_timeout
+from backend.llm.Resilience import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    is_upstream_failure,
+)
+
+
+class StreamingLlm:
+    params = {}
+    model_id = "test-model"
+
+    def __init__(self, error=None):
+        self.error = error
+
+    def stream(self, prompt):
+        yield "first "
+        if self.error:
+            raise self.error
+        yield "second"
+
+
+def _half_open_breaker() -> CircuitBreaker:
+    breaker = CircuitBreaker(0.5, window_size=2, min_calls=2, open_seconds=0)
+    breaker.record(False)
+    breaker.record(False)
+    assert breaker.state == OPEN
+    return breaker
+
+
+def _hosted_llm(breaker) -> SimpleNamespace:
+    return SimpleNamespace(
+        circuit_breaker=breaker,
+        token_usage=SimpleNamespace(record=lambda *args: None),
+    )
+
+
+def _http_error(status_code) -> requests.HTTPError:
+    response = requests.Response()
+    response.status_code = status_code
+    return requests.HTTPError(response=response)
+
+
+def test_closed_stream_releases_the_half_open_trial():
+    breaker = _half_open_breaker()
+    stream = HostedLlm._stream(_hosted_llm(breaker), StreamingLlm(), "prompt")
+    assert next(stream) == "first "
+    assert breaker.state == HALF_OPEN
+    # the client disconnects in the middle of the trial call
+    stream.close()
+    assert breaker.allow()
+
+
+def test_closed_stream_records_the_partial_completion():
+    usage = []
+    llm = _hosted_llm(CircuitBreaker(0.5, window_size=2, min_calls=2, open_seconds=0))
+    llm.token_usage = SimpleNamespace(record=lambda *args: usage.append(args))
+    stream = HostedLlm._stream(llm, StreamingLlm(), "prompt", ("tenant", "user"))
+    assert next(stream) == "first "
+    stream.close()
+    assert usage == [(LLM_STAGE_RESPONSE, "prompt", "first ", ("tenant", "user"))]
+
+
+def test_completed_stream_closes_the_circuit():
+    breaker = _half_open_breaker()
+    stream = HostedLlm._stream(_hosted_llm(breaker), StreamingLlm(), "prompt")
+    assert "".join(stream) == "first second"
+    assert breaker.state == CLOSED
+
+
+def test_stream_timeout_opens_the_circuit_again():
+    breaker = _half_open_breaker()
+    stream = HostedLlm._stream(
+        _hosted_llm(breaker), StreamingLlm(TimeoutError()), "prompt"
+    )
+    with pytest.raises(TimeoutError):
+        list(stream)
+    assert breaker.state == OPEN
+
+
+def test_stream_client_error_releases_the_trial():
+    breaker = _half_open_breaker()
+    stream = HostedLlm._stream(
+        _hosted_llm(breaker), StreamingLlm(_http_error(403)), "prompt"
+    )
+    with pytest.raises(requests.HTTPError):
+        list(stream)
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+
+
+def test_only_timeouts_and_server_errors_are_upstream_failures():
+    assert is_upstream_failure(TimeoutError())
+    assert is_upstream_failure(requests.exceptions.ReadTimeout())
+    assert is_upstream_failure(_http_error(503))
+    assert not is_upstream_failure(_http_error(403))
+    assert not is_upstream_failure(_http_error(429))
+    assert not is_upstream_failure(ValueError())
+
+
+@pytest.fixture
+def request_timeout():
+    get_request_timeout.cache_clear()
+    yield get_request_timeout
+    get_request_timeout.cache_clear()
+
+
+def test_request_timeout_is_the_largest_stage_deadline(request_timeout, monkeypatch):
+    monkeypatch.setenv(LLM_RESPONSE_TIMEOUT_SECONDS, "90")
+    timeout = request_timeout()
+    assert timeout.read == 90
+    assert timeout.connect == 10
+
+
+def test_request_timeout_of_the_client_is_kept_without_a_deadline(request_timeout, monkeypatch):
+    monkeypatch.setenv(LLM_RESPONSE_TIMEOUT_SECONDS, "0")
+    assert request_timeout() is None
@@ -0,0 +1,59 @@
+# Copyright 2024. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from types import MethodType, SimpleNamespace
+
+from backend.constants.constants import TENANT_ALERTS
+from backend.llm.HostedLlm import HostedLlm
+from backend.llm.TokenCounter import TokenCounter
+from backend.prompt.ResponseGenerationPromptManager import (
+    ResponseGenerationPromptManager,
+)
+
+FORMAT_SENTENCE = "tab separated rows below a header row"
+
+
+def get_llm(document_compaction):
+    llm = SimpleNamespace(
+        token_counter=TokenCounter(0.15),
+        response_generation_manager=ResponseGenerationPromptManager(),
+        document_compaction=document_compaction,
+        document_token_budget=0,
+    )
+    llm._get_document_token_budget = MethodType(
+        HostedLlm._get_document_token_budget, llm
+    )
+    return llm
+
+
+def test_compacted_documents_are_described_in_the_prompt():
+    documents = [{"id": "a", "severity": "critical"}, {"id": "b", "severity": "minor"}]
+
+    input_prompt = HostedLlm._get_response_generation_prompt(
+        get_llm(True), "Show my alerts", TENANT_ALERTS, documents
+    )
+
+    assert FORMAT_SENTENCE in input_prompt
+    assert "id\tseverity" in input_prompt
+
+
+def test_documents_which_are_not_compacted_are_not_described_as_rows():
+    documents = [{"id": "a", "severity": "critical"}]
+
+    input_prompt = HostedLlm._get_response_generation_prompt(
+        get_llm(False), "Show my alerts", TENANT_ALERTS, documents
+    )
+
+    assert FORMAT_SENTENCE not in input_prompt
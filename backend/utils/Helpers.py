@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
 import re
 import json
 import datetime
@@ -127,6 +128,37 @@ def epoch_to_human_readable(epoch_ms):
     return formatted_time
 
 
+def get_env_flag(name, default=False) -> bool:
+    """
+    Method to read a boolean feature flag from the environment
+    :param name: name of the environment variable
+    :param default: value used when the variable is not set
+    :return: True if the variable is set to true/1/yes/on, otherwise False
+    """
+    value = os.getenv(name)
+    if value is None or not value.strip():
+        return default
+    return value.strip().lower() in ("true", "1", "yes", "on")
+
+
+def get_env_number(name, default, cast=int):
+    """
+    Method to read a numeric setting from the environment
+    :param name: name of the environment variable
+    :param default: value used when the variable is not set or is not a valid number
+    :param cast: int or float
+    :return: the configured value
+    """
+    value = os.getenv(name)
+    if value is None or not value.strip():
+        return default
+    try:
+        return cast(value.strip())
+    except ValueError:
+        print(f"Invalid value {value} for {name}, defaulting to {default}")
+        return default
+
+
 def get_intent_link(intent, tenant_id, system_uuid):
     """
     This method will generate a Storage insights link depending on the intent
@@ -0,0 +1,113 @@
+# Copyright 2024. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class TtlLruCache:
+    """
+    Thread safe in-memory cache with a size bound and a time to live for every entry. When the cache is full, the
+    least recently used entry is evicted.
+    """
+
+    def __init__(self, max_size, ttl_seconds, max_bytes=0, sizeof=None):
+        """
+        :param max_size: maximum number of entries kept in the cache, 0 disables the cache
+        :param ttl_seconds: number of seconds after which an entry expires, 0 keeps entries until evicted
+        :param max_bytes: maximum total size of the cached values, 0 bounds the number of entries only
+        :param sizeof: function returning the size of a value in bytes, required with max_bytes
+        """
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def get(self, key):
+        """
+        Method to look up a key in the cache
+        :param key: cache key
+        :return: cached value, or None if the key is absent or expired
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at, size = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.size_bytes -= size
+            self.misses += 1
+            return None
+
+    def put(self, key, value) -> None:
+        """
+        Method to add or refresh an entry, evicting the least recently used entries when the cache is full
+        :param key: cache key
+        :param value: value to cache
+        """
+        if not self.enabled:
+            return
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds > 0 else None
+        size = self.sizeof(value) if self.max_bytes > 0 else 0
+        if self.max_bytes > 0 and size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size_bytes -= previous[2]
+            self._entries[key] = (value, expires_at, size)
+            self.size_bytes += size
+            while len(self._entries) > self.max_size or (
+                self.max_bytes > 0 and self.size_bytes > self.max_bytes
+            ):
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self.size_bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+
+    def stats(self) -> dict:
+        """
+        Method to return the cache counters
+        :return: dict with hits, misses, evictions, current size and size bounds
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "size_bytes": self.size_bytes,
+                "max_bytes": self.max_bytes,
+            }
@@ -0,0 +1,343 @@
+# Copyright 2024. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import math
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _format_value(value) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(
+            name,
+            str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'),
+        )
+        for name, value in labels
+    )
+    return "{" + pairs + "}"
+
+
+class Metric:
+    """
+    Base class of the metrics exposed in the prometheus text format. Values are kept per combination of label values,
+    missing labels are recorded as empty strings.
+    """
+
+    metric_type = "untyped"
+
+    def __init__(self, name, documentation, label_names=()):
+        """
+        :param name: metric name
+        :param documentation: help text of the metric
+        :param label_names: names of the labels of the metric
+        """
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels) -> tuple:
+        return tuple(str(labels.get(name) or "") for name in self.label_names)
+
+    def samples(self) -> list[tuple[str, tuple, float]]:
+        """
+        Method to return the samples of the metric
+        :return: list of (sample name, ((label name, label value), ...), value) tuples
+        """
+        with self._lock:
+            return [
+                (self.name, tuple(zip(self.label_names, key)), value)
+                for key, value in self._values.items()
+            ]
+
+
+class Counter(Metric):
+    """
+    Monotonically increasing count, like the number of requests
+    """
+
+    metric_type = "counter"
+
+    def inc(self, amount=1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """
+    Value which goes up and down, like the number of requests in progress
+    """
+
+    metric_type = "gauge"
+
+    def inc(self, amount=1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_in_progress(self, **labels):
+        """
+        Context manager counting the code blocks in progress
+        """
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values, like latencies, counted in cumulative buckets
+    """
+
+    metric_type = "histogram"
+
+    def __init__(self, name, documentation, label_names=(), buckets=LATENCY_BUCKETS):
+        """
+        :param buckets: sorted upper bounds of the buckets, the +Inf bucket is added
+        """
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(buckets) + (math.inf,)
+
+    def observe(self, value, **labels) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # per bucket counts followed by the sum of the observed values
+                counts = self._values[key] = [0] * len(self.buckets) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Context manager observing the duration of a code block in seconds. The labels are yielded as a dict, so that
+        labels known only at the end of the block, like the detected intent, can be added to it.
+        """
+        start = time.perf_counter()
+        try:
+            yield labels
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> list[tuple[str, tuple, float]]:
+        with self._lock:
+            values = [(key, list(counts)) for key, counts in self._values.items()]
+        samples = []
+        for key, counts in values:
+            labels = tuple(zip(self.label_names, key))
+            cumulative = 0
+            for upper_bound, count in zip(self.buckets, counts):
+                cumulative += count
+                samples.append(
+                    (
+                        f"{self.name}_bucket",
+                        labels + (("le", _format_value(upper_bound)),),
+                        cumulative,
+                    )
+                )
+            samples.append((f"{self.name}_sum", labels, counts[-1]))
+            samples.append((f"{self.name}_count", labels, cumulative))
+        return samples
+
+
+class CallbackMetric(Metric):
+    """
+    Metric read at scrape time from counters kept elsewhere, like the hit counters of the caches
+    """
+
+    def __init__(self, name, documentation, metric_type, label_names, callback):
+        """
+        :param metric_type: counter or gauge
+        :param callback: function returning a dict mapping tuples of label values to values
+        """
+        super().__init__(name, documentation, label_names)
+        self.metric_type = metric_type
+        self.callback = callback
+
+    def samples(self) -> list[tuple[str, tuple, float]]:
+        return [
+            (self.name, tuple(zip(self.label_names, key)), value)
+            for key, value in self.callback().items()
+        ]
+
+
+class MetricsRegistry:
+    """
+    Collection of the metrics of the process, rendered in the prometheus text exposition format
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric) -> Metric:
+        """
+        Method to add a metric, a metric registered again under the same name replaces the previous one
+        :param metric: metric to expose
+        :return: the metric
+        """
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """
+        Method to render every metric in the prometheus text format
+        :return: metrics text
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                samples = metric.samples()
+            except Exception as e:
+                print(f"Unable to collect metric {metric.name}: {e}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.metric_type}")
+            for sample_name, labels, value in samples:
+                lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# latency of every stage of a chatbot request
+STAGE_DURATION = REGISTRY.register(
+    Histogram(
+        "si_chatbot_stage_duration_seconds",
+        "Duration of the stages of a chatbot request",
+        ("stage", "intent", "tenant"),
+    )
+)
+REQUEST_DURATION = REGISTRY.register(
+    Histogram(
+        "si_chatbot_request_duration_seconds",
+        "Duration of the chatbot requests",
+        ("endpoint", "intent", "tenant"),
+    )
+)
+REQUESTS_IN_PROGRESS = REGISTRY.register(
+    Gauge(
+        "si_chatbot_requests_in_progress",
+        "Chatbot requests being serviced",
+        ("endpoint",),
+    )
+)
+# latency of the calls to the hosted llms, including hedged duplicates and deadlines
+LLM_CALL_DURATION = REGISTRY.register(
+    Histogram(
+        "si_chatbot_llm_call_duration_seconds",
+        "Duration of the calls to the hosted llms",
+        ("stage",),
+    )
+)
+LLM_CALLS_IN_PROGRESS = REGISTRY.register(
+    Gauge(
+        "si_chatbot_llm_calls_in_progress",
+        "Calls to the hosted llms in progress",
+        ("stage",),
+    )
+)
+
+RESPONSE_ROUTING_DECISIONS = REGISTRY.register(
+    Counter(
+        "si_chatbot_response_routing_decisions_total",
+        "Models picked for response generation and the reason",
+        ("model", "reason", "intent"),
+    )
+)
+
+SI_API_SPECULATIONS = REGISTRY.register(
+    Counter(
+        "si_chatbot_si_api_speculations_total",
+        "Storage insights api calls started before the entities were extracted, by whether the result was used",
+        ("intent", "outcome"),
+    )
+)
+
+
+def register_cache_metrics(get_cache_stats) -> None:
+    """
+    Method to expose the hit and miss counters of the caches, read at scrape time
+    :param get_cache_stats: function returning a dict mapping cache name to its stats dict with hits and misses
+    """
+    for counter in ("hits", "misses"):
+        REGISTRY.register(
+            CallbackMetric(
+                f"si_chatbot_cache_{counter}_total",
+                f"Cache {counter} since the process started",
+                "counter",
+                ("cache",),
+                lambda counter=counter: {
+                    (cache,): stats.get(counter, 0)
+                    for cache, stats in get_cache_stats().items()
+                },
+            )
+        )
+
+
+def register_digest_metrics(get_digest_stats) -> None:
+    """
+    Method to expose the counters of the morning cup of coffee digests kept in memory, read at scrape time
+    :param get_digest_stats: function returning the stats dict of the digests
+    """
+    REGISTRY.register(
+        CallbackMetric(
+            "si_chatbot_morning_cup_of_coffee_digests",
+            "Tenants whose digest is refreshed in the background and digests kept in memory",
+            "gauge",
+            ("kind",),
+            lambda: {
+                (kind,): get_digest_stats()[kind]
+                for kind in ("active_tenants", "digests")
+            },
+        )
+    )
+    REGISTRY.register(
+        CallbackMetric(
+            "si_chatbot_morning_cup_of_coffee_digest_events_total",
+            "Digests refreshed in the background and digests served from memory",
+            "counter",
+            ("event",),
+            lambda: {
+                (event,): get_digest_stats()[event]
+                for event in ("refreshes", "served_from_memory")
+            },
+        )
+    )
@@ -0,0 +1,376 @@
+# Copyright 2024. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import hashlib
+import threading
+import time
+
+from backend.constants.constants import (
+    CONDITION,
+    CRITICAL,
+    DATA,
+    DESCRIPTION,
+    DURATION,
+    ERROR,
+    GRID,
+    IDENTIFIER,
+    INTENT,
+    MORNING_CUP_OF_COFFEE_SECTION_UNAVAILABLE_DESC,
+    OCCURRENCE,
+    REQUEST_STAGE_SI_API,
+    SEVERITY,
+    STORAGE_LIST,
+    STORAGE_LIST_DESC,
+    STORAGE_LIST_NO_DATA_DESC,
+    TENANT_ALERTS,
+    TENANT_ALERTS_DESC,
+    TENANT_ALERTS_NO_DATA_DESC,
+    TENANT_ID,
+    TENANT_NOTIFICATIONS,
+    TENANT_NOTIFICATIONS_DESC,
+    TENANT_NOTIFICATIONS_NO_DATA_DESC,
+)
+from backend.login_module.ApiKeyValidation import key_validation_service_async
+from backend.utils.LruCache import TtlLruCache
+from backend.utils.Metrics import STAGE_DURATION
+
+# maximum number of verified api keys remembered
+MAX_VERIFIED_KEYS = 4096
+
+# sections of the morning cup of coffee digest in display order, with the query parameters of their api
+MORNING_CUP_OF_COFFEE_SECTIONS = (
+    (STORAGE_LIST, {}),
+    (TENANT_ALERTS, {SEVERITY: CRITICAL, DURATION: OCCURRENCE}),
+    (TENANT_NOTIFICATIONS, {SEVERITY: CRITICAL, DURATION: OCCURRENCE}),
+)
+
+
+def _build_section(intent, api_response) -> dict:
+    """
+    Method to build a section of the digest from the response of its api
+    :param intent: intent of the section
+    :param api_response: response of the api
+    :return: section shown as a grid by the UI
+    """
+    if intent == STORAGE_LIST:
+        data = [entry for entry in api_response[DATA] if entry[CONDITION] == ERROR]
+        description = STORAGE_LIST_DESC if data else STORAGE_LIST_NO_DATA_DESC
+    elif intent == TENANT_ALERTS:
+        data = api_response
+        description = (
+            TENANT_ALERTS_DESC if api_response[DATA] else TENANT_ALERTS_NO_DATA_DESC
+        )
+    else:
+        data = api_response
+        description = (
+            TENANT_NOTIFICATIONS_DESC
+            if api_response[DATA]
+            else TENANT_NOTIFICATIONS_NO_DATA_DESC
+        )
+    return {INTENT: intent, DATA: data, IDENTIFIER: GRID, DESCRIPTION: description}
+
+
+async def _fetch_section(
+    api_controller, intent, parameters, api_key, logger, timeout
+) -> tuple[dict, bool]:
+    """
+    Method to fetch a section of the digest within its deadline
+    :param api_controller: controller calling the storage insights apis
+    :param intent: intent of the section
+    :param parameters: parameters of the api
+    :param api_key: api key of the tenant
+    :param timeout: deadline of the api call in seconds
+    :return: tuple of the section and whether it was fetched, a section which could not be fetched has no data and
+    tells the user it is unavailable
+    """
+    try:
+        with STAGE_DURATION.time(
+            stage=REQUEST_STAGE_SI_API, intent=intent, tenant=parameters[TENANT_ID]
+        ):
+            api_response = await asyncio.wait_for(
+                api_controller.call_async(intent, parameters, api_key, logger),
+                timeout,
+            )
+        return _build_section(intent, api_response), True
+    except Exception as ex:
+        logger.error(f"Unable to fetch the {intent} section of the digest: {ex!r}", ex)
+        return {
+            INTENT: intent,
+            DATA: [],
+            IDENTIFIER: GRID,
+            DESCRIPTION: MORNING_CUP_OF_COFFEE_SECTION_UNAVAILABLE_DESC,
+        }, False
+
+
+def _start_sections(api_controller, tenant_id, api_key, logger, timeout) -> list:
+    return [
+        asyncio.ensure_future(
+            _fetch_section(
+                api_controller,
+                intent,
+                {TENANT_ID: tenant_id, **parameters},
+                api_key,
+                logger,
+                timeout,
+            )
+        )
+        for intent, parameters in MORNING_CUP_OF_COFFEE_SECTIONS
+    ]
+
+
+async def get_morning_cup_of_coffee_sections(
+    api_controller, tenant_id, api_key, logger, timeout
+) -> tuple[list, bool]:
+    """
+    Method to fetch the sections of the digest concurrently, so the digest takes as long as its slowest api
+    :param api_controller: controller calling the storage insights apis
+    :param tenant_id: tenant of the digest
+    :param api_key: api key of the tenant
+    :param timeout: deadline of every api call in seconds
+    :return: tuple of the sections in display order and the number of them which were fetched
+    """
+    results = await asyncio.gather(
+        *_start_sections(api_controller, tenant_id, api_key, logger, timeout)
+    )
+    return [section for section, _ in results], sum(
+        fetched for _, fetched in results
+    )
+
+
+async def iter_morning_cup_of_coffee_sections(
+    api_controller, tenant_id, api_key, logger, timeout
+):
+    """
+    Method to fetch the sections of the digest concurrently, yielding every section as soon as it is fetched
+    :param api_controller: controller calling the storage insights apis
+    :param tenant_id: tenant of the digest
+    :param api_key: api key of the tenant
+    :param timeout: deadline of every api call in seconds
+    :return: async iterator over tuples of the section and whether it was fetched, in completion order
+    """
+    tasks = _start_sections(api_controller, tenant_id, api_key, logger, timeout)
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        # the client went away before every section was sent
+        for task in tasks:
+            task.cancel()
+
+
+class MorningCupOfCoffeeDigests:
+    """
+    Digests of the tenants, shared by all the users of a tenant. The digests of the recently active tenants are
+    refreshed in the background so that the users get them from memory, and concurrent requests for a digest which is
+    missing or too old share a single computation. A digest is only given to the callers whose api key was verified
+    against the tenant, since the digest in memory skips the storage insights apis which would otherwise reject a wrong
+    key. The latest verified api key of a tenant is kept in memory to refresh its digest, until the tenant is no longer
+    active.
+    """
+
+    def __init__(
+        self,
+        api_controller,
+        logger,
+        timeout,
+        refresh_seconds,
+        max_age_seconds,
+        active_seconds,
+        key_verification_seconds,
+    ):
+        """
+        :param api_controller: controller calling the storage insights apis
+        :param timeout: deadline of every api call in seconds
+        :param refresh_seconds: cadence of the background refresh, 0 to disable it
+        :param max_age_seconds: age from which a digest is computed again on request, 0 to never serve from memory
+        :param active_seconds: time since the latest request of a tenant after which it is no longer refreshed
+        :param key_verification_seconds: time after which an api key is verified again, so revoked keys are rejected
+        """
+        self.api_controller = api_controller
+        self.logger = logger
+        self.timeout = timeout
+        self.refresh_seconds = refresh_seconds
+        self.max_age_seconds = max_age_seconds
+        self.active_seconds = active_seconds
+        self.refreshes = 0
+        self.served_from_memory = 0
+        # tenant id -> (sections, fetch time)
+        self._digests = {}
+        # tenant id -> (api key, time of the latest request)
+        self._active_tenants = {}
+        # tenant id -> task computing its digest
+        self._pending = {}
+        # hashes of the tenant ids and api keys accepted by the storage insights apis
+        self._verified_keys = TtlLruCache(MAX_VERIFIED_KEYS, key_verification_seconds)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key_hash(tenant_id, api_key) -> str:
+        return hashlib.sha256(f"{tenant_id}\0{api_key}".encode()).hexdigest()
+
+    def is_verified(self, tenant_id, api_key) -> bool:
+        """
+        Method to check whether an api key was recently verified against a tenant
+        :param tenant_id: tenant of the request
+        :param api_key: decrypted api key of the request
+        :return: True if the key was accepted for the tenant
+        """
+        return self._verified_keys.get(self._key_hash(tenant_id, api_key)) is not None
+
+    async def verify(self, tenant_id, api_key) -> bool:
+        """
+        Method to verify an api key against a tenant with the storage insights token api, unless it was recently
+        verified
+        :param tenant_id: tenant of the request
+        :param api_key: decrypted api key of the request
+        :return: True if the key is accepted for the tenant
+        """
+        if self.is_verified(tenant_id, api_key):
+            return True
+        if not await key_validation_service_async(tenant_id, api_key):
+            return False
+        self._verified_keys.put(self._key_hash(tenant_id, api_key), True)
+        return True
+
+    def mark_active(self, tenant_id, api_key) -> None:
+        """
+        Method to record a request of a tenant whose storage insights calls succeeded, called from the request threads
+        as well as the event loop. The api key is only kept to refresh the digest once it was verified, so a wrong key
+        never replaces the key of the tenant.
+        :param tenant_id: tenant of the request
+        :param api_key: decrypted api key of the request
+        """
+        if not self.is_verified(tenant_id, api_key):
+            return
+        with self._lock:
+            self._active_tenants[tenant_id] = (api_key, time.time())
+
+    def get_cached(self, tenant_id, api_key) -> tuple[list, float] | None:
+        """
+        Method to return the digest of a tenant from memory
+        :param tenant_id: tenant of the digest
+        :param api_key: decrypted api key of the request, which must have been verified against the tenant
+        :return: tuple of the sections and their age in seconds, or None if there is no digest younger than the
+        maximum age or the key was not verified
+        """
+        if not self.is_verified(tenant_id, api_key):
+            return None
+        digest = self._digests.get(tenant_id)
+        if digest is None:
+            return None
+        sections, fetched_at = digest
+        age = time.time() - fetched_at
+        if age >= self.max_age_seconds:
+            return None
+        self.served_from_memory += 1
+        return sections, age
+
+    def store(self, tenant_id, sections) -> None:
+        """
+        Method to keep the digest of a tenant, fetched by the caller
+        :param tenant_id: tenant of the digest
+        :param sections: sections of the digest, in display order
+        """
+        self._digests[tenant_id] = (sections, time.time())
+
+    async def get(self, tenant_id, api_key) -> tuple[list, float, bool]:
+        """
+        Method to return the digest of a tenant, from memory if it is recent enough
+        :param tenant_id: tenant of the digest
+        :param api_key: decrypted api key of the request
+        :return: tuple of the sections, their age in seconds and the number of them which were fetched
+        :raises PermissionError: if the api key is not accepted for the tenant
+        """
+        # the key is checked before serving from memory or joining the computation started by another caller
+        if not await self.verify(tenant_id, api_key):
+            raise PermissionError(f"api key rejected for tenant {tenant_id}")
+        self.mark_active(tenant_id, api_key)
+        cached = self.get_cached(tenant_id, api_key)
+        if cached is not None:
+            return cached[0], cached[1], len(cached[0])
+        sections, fetched = await self.refresh(tenant_id, api_key)
+        return sections, 0.0, fetched
+
+    async def refresh(self, tenant_id, api_key) -> tuple[list, bool]:
+        """
+        Method to fetch the digest of a tenant, joining the computation already in progress for the tenant if any
+        :param tenant_id: tenant of the digest
+        :param api_key: decrypted api key verified against the tenant
+        :return: tuple of the sections and the number of them which were fetched
+        """
+        task = self._pending.get(tenant_id)
+        if task is None:
+            task = asyncio.ensure_future(
+                get_morning_cup_of_coffee_sections(
+                    self.api_controller, tenant_id, api_key, self.logger, self.timeout
+                )
+            )
+            self._pending[tenant_id] = task
+            task.add_done_callback(lambda _: self._pending.pop(tenant_id, None))
+        # a request which goes away does not cancel the computation shared with the other requests
+        sections, fetched = await asyncio.shield(task)
+        # a partial digest is returned but not kept, the next request tries again the sections which failed
+        if fetched == len(sections):
+            self.store(tenant_id, sections)
+        return sections, fetched
+
+    async def _refresh_active_tenants(self) -> None:
+        now = time.time()
+        with self._lock:
+            for tenant_id, (_, last_seen) in list(self._active_tenants.items()):
+                if now - last_seen > self.active_seconds:
+                    del self._active_tenants[tenant_id]
+                    self._digests.pop(tenant_id, None)
+            active_tenants = list(self._active_tenants.items())
+        tenants_to_refresh = [
+            (tenant_id, api_key)
+            for tenant_id, (api_key, _) in active_tenants
+            if tenant_id not in self._digests
+            or now - self._digests[tenant_id][1] >= self.refresh_seconds
+        ]
+        results = await asyncio.gather(
+            *(self.refresh(tenant_id, api_key) for tenant_id, api_key in tenants_to_refresh),
+            return_exceptions=True,
+        )
+        for (tenant_id, api_key), result in zip(tenants_to_refresh, results):
+            if isinstance(result, Exception):
+                self.logger.error(
+                    f"Unable to refresh the digest of tenant {tenant_id}: {result!r}", result
+                )
+            elif not result[1]:
+                # the key may have been revoked, the tenant is refreshed again once a verified key is used
+                with self._lock:
+                    if self._active_tenants.get(tenant_id, (None,))[0] == api_key:
+                        del self._active_tenants[tenant_id]
+        self.refreshes += len(tenants_to_refresh)
+
+    async def run(self) -> None:
+        """
+        Method to refresh the digests of the active tenants at the configured cadence, until it is cancelled
+        """
+        while True:
+            await asyncio.sleep(self.refresh_seconds)
+            try:
+                await self._refresh_active_tenants()
+            except Exception as ex:
+                self.logger.error(f"Unable to refresh the digests: {ex!r}", ex)
+
+    def stats(self) -> dict:
+        return {
+            "active_tenants": len(self._active_tenants),
+            "digests": len(self._digests),
+            "refreshes": self.refreshes,
+            "served_from_memory": self.served_from_memory,
+        }
@@ -179,3 +179,129 @@ def _process_details_section(details):
         else:
             updated_details[key] = details[key]
     return updated_details
+
+
+def _flatten_record(record, prefix=""):
+    """
+    Flatten nested sections of a record, ex. {"details": {"a": 1}} -> {"details.a": 1}
+    :param record: single record of the api response
+    :param prefix: key of the enclosing section
+    :return: flat dict
+    """
+    flat = {}
+    for key, value in record.items():
+        if isinstance(value, dict):
+            flat.update(_flatten_record(value, f"{prefix}{key}."))
+        else:
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def _format_value(value) -> str:
+    """
+    Format a field as a single table cell, lists are joined and separators are replaced by spaces
+    :param value:
+    :return: cell text
+    """
+    if isinstance(value, (list, tuple, set)):
+        value = ", ".join(_format_value(item) for item in value)
+    return " ".join(str(value).split())
+
+
+def _is_empty(value) -> bool:
+    return value is None or (
+        isinstance(value, (str, list, tuple, set, dict)) and len(value) == 0
+    )
+
+
+def compact_records(data):
+    """
+    This method compacts the data section of the api response before it is rendered into the prompt:
+        1. Flatten nested sections and drop null or empty fields
+        2. Move fields with the same value in every record into a common section, so the value is shown once
+        3. Build rows for the remaining fields, in the order in which the fields first appear
+    :param data: data section of the preprocessed api response
+    :return: common fields, columns and rows, or None if the data is not a non-empty list of records
+    """
+    if isinstance(data, dict):
+        data = [data]
+    if not data or not isinstance(data, list) or not all(isinstance(item, dict) for item in data):
+        return None
+
+    records = [
+        {
+            key: _format_value(value)
+            for key, value in _flatten_record(item).items()
+            if not _is_empty(value)
+        }
+        for item in data
+    ]
+    columns = list(dict.fromkeys(key for record in records for key in record))
+    common_fields = {}
+    for column in columns:
+        values = {record.get(column) for record in records}
+        if len(values) == 1 and None not in values:
+            common_fields[column] = values.pop()
+    columns = [column for column in columns if column not in common_fields]
+    rows = [[record.get(column, "") for column in columns] for record in records]
+    return common_fields, columns, rows
+
+
+def render_compact_records(common_fields, columns, rows, token_budget, estimate_tokens):
+    """
+    This method renders compacted records as tab separated rows under a single header, adding rows until the token
+    budget is used up. A trailing line tells the llm how many records were left out.
+    :param common_fields: fields with the same value in every record
+    :param columns: header of the table
+    :param rows: table rows
+    :param token_budget: maximum number of tokens of the rendered document, None for no limit
+    :param estimate_tokens: function returning the estimated number of tokens of a text
+    :return: rendered document and number of rows included
+    """
+    lines = [f"{key}: {value}" for key, value in common_fields.items()]
+    if columns:
+        lines.append("\t".join(columns))
+    used_tokens = sum(estimate_tokens(line) + 1 for line in lines)
+    included_rows = 0
+    if columns:
+        for row in rows:
+            line = "\t".join(row)
+            row_tokens = estimate_tokens(line) + 1
+            if token_budget is not None and used_tokens + row_tokens > token_budget:
+                break
+            lines.append(line)
+            used_tokens += row_tokens
+            included_rows += 1
+        if included_rows < len(rows):
+            lines.append(
+                f"({included_rows} of {len(rows)} records shown, the remaining records did not fit)"
+            )
+    else:
+        included_rows = len(rows)
+    return "\n".join(lines), included_rows
+
+
+def split_compact_records(common_fields, columns, rows, token_budget, estimate_tokens):
+    """
+    This method splits compacted records into consecutive chunks, every chunk is rendered with the common fields and
+    the header, and fits in the token budget. A row which does not fit in the budget on its own gets a chunk of its own.
+    :param common_fields: fields with the same value in every record
+    :param columns: header of the table
+    :param rows: table rows
+    :param token_budget: maximum number of tokens of a rendered chunk
+    :param estimate_tokens: function returning the estimated number of tokens of a text
+    :return: list of rendered chunks
+    """
+    chunks = []
+    start = 0
+    while start < len(rows):
+        _, included_rows = render_compact_records(
+            common_fields, columns, rows[start:], token_budget, estimate_tokens
+        )
+        end = start + max(included_rows, 1)
+        document, _ = render_compact_records(
+            common_fields, columns, rows[start:end], None, estimate_tokens
+        )
+        chunks.append(document)
+        start = end
+    return chunks